@@ -1,16 +1,115 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from utils.query_metrics import command_stats
 import os
+import threading
 
 # MongoDB connection - will be initialized in server.py
 client = None
 db = None
 
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Tracks live connection pool usage across all servers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.wait_queue = 0
+        self.open_connections = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checkout_failures = 0
+        self.pools_cleared = 0
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add(pools_cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open_connections=1, connections_created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open_connections=-1, connections_closed=1)
+
+    def connection_check_out_started(self, event):
+        self._add(wait_queue=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(wait_queue=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(wait_queue=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkedOut": self.checked_out,
+                "waitQueueLength": self.wait_queue,
+                "openConnections": self.open_connections,
+                "connectionsCreated": self.connections_created,
+                "connectionsClosed": self.connections_closed,
+                "checkoutFailures": self.checkout_failures,
+                "poolsCleared": self.pools_cleared
+            }
+
+pool_stats = PoolStatsListener()
+
+def _client_options() -> dict:
+    """Pool sizing, timeouts and compression, configurable from the environment"""
+    options = {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")),
+        "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "event_listeners": [pool_stats, command_stats],
+    }
+    # e.g. "zstd,snappy,zlib" - pymongo skips compressors whose library is missing
+    compressors = os.environ.get("MONGO_COMPRESSORS", "")
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
 def init_db():
     global client, db
     mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
+    # The client connects lazily; the pool is warmed and closed by the app lifespan
+    client = AsyncIOMotorClient(mongo_url, **_client_options())
     db = client[os.environ['DB_NAME']]
     return db
 
 def get_db():
     return db
+
+async def connect_db():
+    """Verify connectivity on startup so pool problems surface immediately"""
+    await client.admin.command("ping")
+
+def close_db():
+    if client is not None:
+        client.close()
+
+def get_pool_stats() -> dict:
+    stats = pool_stats.snapshot()
+    if client is not None:
+        stats["maxPoolSize"] = client.options.pool_options.max_pool_size
+        stats["minPoolSize"] = client.options.pool_options.min_pool_size
+    return stats
@@ -3,6 +3,10 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Optional
 from models.admin import AdminCreate, AdminLogin, Admin, AdminResponse, Token
 from database import get_db
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING
+from utils.indexes import declare_indexes
+from utils.password_pool import password_pool
 import os
 from datetime import datetime, timedelta
 from bson import ObjectId
@@ -15,6 +19,11 @@ security = HTTPBearer()
 # Get database instance
 db = get_db()
 
+declare_indexes(
+    "admin_users",
+    IndexModel([("email", ASCENDING)], name="email_1"),
+)
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -23,11 +32,11 @@ SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await password_pool.run(pwd_context.hash, password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.run(pwd_context.verify, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -64,7 +73,7 @@ async def register_admin(admin: AdminCreate):
             raise HTTPException(status_code=400, detail="Admin dengan email ini sudah terdaftar")
         
         # Hash password
-        hashed_password = hash_password(admin.password)
+        hashed_password = await hash_password(admin.password)
         
         admin_dict = {
             "username": admin.username,
@@ -99,7 +108,7 @@ async def login_admin(credentials: AdminLogin):
             raise HTTPException(status_code=401, detail="Email atau password salah")
         
         # Verify password
-        if not verify_password(credentials.password, admin["password"]):
+        if not await verify_password(credentials.password, admin["password"]):
             raise HTTPException(status_code=401, detail="Email atau password salah")
         
         # Update last login
@@ -144,18 +153,14 @@ async def get_dashboard_stats(token_data: dict = Depends(verify_token)):
             {}, 
             {"name": 1, "email": 1, "testStatus": 1, "registrationDate": 1}
         ).sort("registrationDate", -1).limit(5).to_list(5)
-        for reg in recent_registrations:
-            reg["_id"] = str(reg["_id"])
         
         # Get recent contacts (optimized with projections)
         recent_contacts = await db.contacts.find(
             {}, 
             {"name": 1, "email": 1, "message": 1, "status": 1, "submittedAt": 1}
         ).sort("submittedAt", -1).limit(5).to_list(5)
-        for contact in recent_contacts:
-            contact["_id"] = str(contact["_id"])
         
-        return {
+        return MongoJSONResponse({
             "registrations": {
                 "total": total_registrations,
                 "pending": pending_registrations,
@@ -170,7 +175,7 @@ async def get_dashboard_stats(token_data: dict = Depends(verify_token)):
                 "total": total_institutions,
                 "pending": pending_institutions
             }
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Terjadi kesalahan: {str(e)}")
 
@@ -208,9 +213,7 @@ async def get_all_admins(token_data: dict = Depends(verify_token)):
             raise HTTPException(status_code=403, detail="Hanya superadmin yang dapat mengakses")
         
         admins = await db.admin_users.find({}, {"password": 0}).to_list(100)
-        for admin in admins:
-            admin["_id"] = str(admin["_id"])
-        return admins
+        return MongoJSONResponse(admins)
     except HTTPException:
         raise
     except Exception as e:
@@ -231,7 +234,7 @@ async def create_admin_user(admin: AdminCreate, token_data: dict = Depends(verif
             raise HTTPException(status_code=400, detail="Email sudah terdaftar")
         
         # Hash password
-        hashed_password = hash_password(admin.password)
+        hashed_password = await hash_password(admin.password)
         
         admin_dict = {
             "username": admin.username,
@@ -283,7 +286,7 @@ async def change_admin_password(admin_id: str, password_data: dict, token_data:
             raise HTTPException(status_code=400, detail="Password minimal 6 karakter")
         
         # Hash and update password
-        hashed_password = hash_password(new_password)
+        hashed_password = await hash_password(new_password)
         await db.admin_users.update_one(
             {"_id": ObjectId(admin_id)},
             {"$set": {"password": hashed_password, "updatedAt": datetime.utcnow()}}
@@ -2,7 +2,10 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional, Dict
 from pydantic import BaseModel
 from database import get_db
-from routes.auth import get_current_user
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
+from routes.auth import get_current_user, invalidate_user_cache
+from routes.certificates import has_paid_test, schedule_ai_certificate_prerender
 from datetime import datetime
 import os
 import logging
@@ -12,6 +15,12 @@ router = APIRouter(prefix="/api/ai-analysis", tags=["ai-analysis"])
 db = get_db()
 logger = logging.getLogger(__name__)
 
+declare_indexes(
+    "ai_analyses",
+    IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)], name="userId_1_createdAt_-1"),
+    IndexModel([("userId", ASCENDING), ("testType", ASCENDING)], name="userId_1_testType_1"),
+)
+
 # Initialize AI Chat
 EMERGENT_LLM_KEY = os.environ.get("EMERGENT_LLM_KEY", "")
 
@@ -198,7 +207,16 @@ Penting: Jawab dalam format JSON yang valid seperti yang diminta di system messa
             "createdAt": datetime.utcnow()
         }
         
-        await db.ai_analyses.insert_one(analysis_doc)
+        # Paid users can download the AI certificate right away; render it ahead of time
+        # testType comes from the client, so only the payment records decide
+        prerender_certificate = await has_paid_test(current_user)
+        if prerender_certificate:
+            analysis_doc["renderStatus"] = "pending"
+            analysis_doc["renderRequestedAt"] = datetime.utcnow()
+        
+        result = await db.ai_analyses.insert_one(analysis_doc)
+        if prerender_certificate:
+            schedule_ai_certificate_prerender(result.inserted_id, str(current_user["_id"]))
         
         # Update user with latest analysis
         await db.users.update_one(
@@ -209,6 +227,7 @@ Penting: Jawab dalam format JSON yang valid seperti yang diminta di system messa
                 f"{request.testType}TestStatus": "completed"
             }}
         )
+        invalidate_user_cache(current_user["_id"])
         
         return {
             "success": True,
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
 from models.analytics import PageView, OnlineUser
 from database import get_db
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
 from datetime import datetime, timedelta
 from bson import ObjectId
 from routes.admin import verify_token
@@ -9,6 +12,16 @@ import uuid
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 db = get_db()
 
+declare_indexes(
+    "pageviews",
+    IndexModel([("timestamp", DESCENDING)], name="timestamp_-1"),
+)
+declare_indexes(
+    "online_users",
+    IndexModel([("sessionId", ASCENDING)], name="sessionId_1"),
+    IndexModel([("lastActivity", DESCENDING)], name="lastActivity_-1"),
+)
+
 @router.post("/pageview")
 async def track_pageview(request: Request, page: str, sessionId: str = None):
     """
@@ -129,13 +142,10 @@ async def get_online_users(token_data: dict = Depends(verify_token)):
         
         online_users = await cursor.to_list(100)
         
-        for user in online_users:
-            user["_id"] = str(user["_id"])
-        
-        return {
+        return MongoJSONResponse({
             "count": len(online_users),
             "users": online_users
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
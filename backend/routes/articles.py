@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request
 from typing import List, Optional
 from database import get_db
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
 from datetime import datetime
 from bson import ObjectId
 from routes.admin import verify_token
+from utils.etag import etag_response
+from utils.blobs import blob_store
+from pymongo import ReturnDocument
 import os
 import uuid
 import re
@@ -12,9 +18,17 @@ from pathlib import Path
 router = APIRouter(prefix="/api/articles", tags=["articles"])
 db = get_db()
 
+declare_indexes(
+    "articles",
+    IndexModel([("slug", ASCENDING)], name="slug_1"),
+    IndexModel([("publishedAt", DESCENDING)], name="publishedAt_-1"),
+)
+
 UPLOAD_DIR = Path("uploads/articles")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+blob_store.track("articles", "featuredImage")
+
 def create_slug(title: str) -> str:
     """Create URL-friendly slug from title"""
     slug = title.lower()
@@ -25,6 +39,7 @@ def create_slug(title: str) -> str:
 
 @router.get("", response_model=List[dict])
 async def get_articles(
+    request: Request,
     category: Optional[str] = None,
     isPublished: Optional[bool] = None,
     search: Optional[str] = None,
@@ -49,10 +64,7 @@ async def get_articles(
         cursor = db.articles.find(query).skip(skip).limit(limit).sort("publishedAt", -1)
         articles = await cursor.to_list(length=limit)
         
-        for article in articles:
-            article["_id"] = str(article["_id"])
-        
-        return articles
+        return etag_response(request, articles)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -83,11 +95,7 @@ async def get_article(article_id: str):
             {"$inc": {"views": 1}}
         )
         
-        # Convert _id to string if it's ObjectId
-        if isinstance(article["_id"], ObjectId):
-            article["_id"] = str(article["_id"])
-        
-        return article
+        return MongoJSONResponse(article)
     except HTTPException:
         raise
     except Exception as e:
@@ -136,16 +144,12 @@ async def create_article(
             if ext not in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
                 raise HTTPException(status_code=400, detail="Format file tidak didukung")
             
-            filename = f"{uuid.uuid4().hex}{ext}"
-            file_path = UPLOAD_DIR / filename
-            
-            with open(file_path, "wb") as f:
-                content_bytes = await file.read()
-                f.write(content_bytes)
+            stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/articles", ext.lstrip("."))
             
-            article_doc["featuredImage"] = f"/uploads/articles/{filename}"
+            article_doc["featuredImage"] = stored.url
         
         result = await db.articles.insert_one(article_doc)
+        await blob_store.refresh(article_doc.get("featuredImage"))
         
         return {
             "success": True,
@@ -201,23 +205,23 @@ async def update_article(
             if ext not in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
                 raise HTTPException(status_code=400, detail="Format file tidak didukung")
             
-            filename = f"{uuid.uuid4().hex}{ext}"
-            file_path = UPLOAD_DIR / filename
+            stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/articles", ext.lstrip("."))
             
-            with open(file_path, "wb") as f:
-                content_bytes = await file.read()
-                f.write(content_bytes)
-            
-            update_data["featuredImage"] = f"/uploads/articles/{filename}"
+            update_data["featuredImage"] = stored.url
         
-        result = await db.articles.update_one(
+        previous = await db.articles.find_one_and_update(
             {"_id": ObjectId(article_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"featuredImage": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="Artikel tidak ditemukan")
         
+        if "featuredImage" in update_data:
+            await blob_store.refresh(previous.get("featuredImage"), update_data["featuredImage"])
+        
         return {"success": True, "message": "Artikel berhasil diupdate"}
     except HTTPException:
         raise
@@ -236,18 +240,14 @@ async def delete_article(
         if not ObjectId.is_valid(article_id):
             raise HTTPException(status_code=400, detail="Invalid article ID")
         
-        # Get article to delete image if exists
-        article = await db.articles.find_one({"_id": ObjectId(article_id)})
-        if article and article.get("featuredImage"):
-            image_path = Path(article["featuredImage"].lstrip("/"))
-            if image_path.exists():
-                image_path.unlink()
+        article = await db.articles.find_one_and_delete({"_id": ObjectId(article_id)}, projection={"featuredImage": 1})
         
-        result = await db.articles.delete_one({"_id": ObjectId(article_id)})
-        
-        if result.deleted_count == 0:
+        if article is None:
             raise HTTPException(status_code=404, detail="Artikel tidak ditemukan")
         
+        # The image file itself may be shared; the upload GC removes it once unreferenced
+        await blob_store.refresh(article.get("featuredImage"))
+        
         return {"success": True, "message": "Artikel berhasil dihapus"}
     except HTTPException:
         raise
@@ -2,6 +2,10 @@ from fastapi import APIRouter, HTTPException, Request, Depends
 from typing import Optional
 from models.user import UserCreate, UserLogin, UserUpdate, UserResponse, PasswordChange
 from database import get_db
+from pymongo import IndexModel, ASCENDING
+from utils.indexes import declare_indexes
+from utils.cache import TTLCache
+from utils.password_pool import password_pool
 from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 import bcrypt
@@ -13,9 +17,39 @@ from pathlib import Path
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 db = get_db()
 
+declare_indexes(
+    "users",
+    IndexModel([("email", ASCENDING)], name="email_1"),
+    IndexModel([("myReferralCode", ASCENDING)], name="myReferralCode_1"),
+)
+
 JWT_SECRET = os.environ.get("JWT_SECRET_KEY", "default_secret_key")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
+STREAM_TOKEN_PURPOSE = "stream"
+STREAM_TOKEN_TTL_SECONDS = int(os.environ.get("STREAM_TOKEN_TTL_SECONDS", "300"))
+
+# What get_current_user loads. Handlers that need other fields
+# (profile, password hash, referral stats) read them explicitly.
+PRINCIPAL_FIELDS = {
+    "email": 1,
+    "fullName": 1,
+    "whatsapp": 1,
+    "userType": 1,
+    "isBanned": 1,
+    "paymentStatus": 1,
+    "paidTestStatus": 1
+}
+
+# user id -> slim principal; writers call invalidate_user_cache() after changing a user
+principal_cache = TTLCache(
+    "auth-principal",
+    maxsize=int(os.environ.get("AUTH_CACHE_SIZE", "4096")),
+    default_ttl=float(os.environ.get("AUTH_CACHE_TTL", "60"))
+)
+
+def invalidate_user_cache(user_id) -> None:
+    principal_cache.invalidate(str(user_id))
 
 def generate_referral_code(name: str) -> str:
     """Generate unique referral code from name"""
@@ -23,12 +57,18 @@ def generate_referral_code(name: str) -> str:
     suffix = uuid.uuid4().hex[:6].upper()
     return f"{prefix}{suffix}"
 
-def hash_password(password: str) -> str:
+def _hash_password_sync(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
-def verify_password(password: str, hashed: str) -> bool:
+def _verify_password_sync(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+async def hash_password(password: str) -> str:
+    return await password_pool.run(_hash_password_sync, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_pool.run(_verify_password_sync, password, hashed)
+
 def create_token(user_id: str, email: str, user_type: str) -> str:
     payload = {
         "sub": user_id,
@@ -44,17 +84,61 @@ async def get_current_user(request: Request):
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Token tidak valid")
     
-    token = auth_header.split(" ")[1]
+    return await resolve_user_token(auth_header.split(" ")[1])
+
+def create_stream_token(user_id: str, scope: str) -> str:
+    """
+    Short-lived token for one SSE stream. EventSource cannot send headers,
+    so these travel in ?token= and end up in proxy and access logs; unlike
+    the login token they expire within minutes and only open the stream
+    they were issued for.
+    """
+    payload = {
+        "sub": user_id,
+        "purpose": STREAM_TOKEN_PURPOSE,
+        "scope": scope,
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_TTL_SECONDS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+async def resolve_stream_token(token: Optional[str], scope: str) -> dict:
+    """The user a stream token was issued to; 401 unless it was issued for scope"""
+    if not token:
+        raise HTTPException(status_code=401, detail="Token tidak valid")
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"_id": ObjectId(payload["sub"])})
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token sudah expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Token tidak valid")
+    if payload.get("purpose") != STREAM_TOKEN_PURPOSE or payload.get("scope") != scope:
+        raise HTTPException(status_code=401, detail="Token tidak valid")
+    return await load_principal(payload["sub"])
+
+async def resolve_user_token(token: str) -> dict:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token sudah expired")
+    except Exception:
+        raise HTTPException(status_code=401, detail="Token tidak valid")
+    if payload.get("purpose"):
+        # Stream tokens only open their own stream
+        raise HTTPException(status_code=401, detail="Token tidak valid")
+    return await load_principal(payload["sub"])
+
+async def load_principal(user_id: str) -> dict:
+    try:
+        user = await principal_cache.get_or_load(
+            user_id,
+            lambda: db.users.find_one({"_id": ObjectId(user_id)}, PRINCIPAL_FIELDS)
+        )
         if not user:
             raise HTTPException(status_code=401, detail="User tidak ditemukan")
         if user.get("isBanned"):
             raise HTTPException(status_code=403, detail="Akun Anda telah diblokir")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token sudah expired")
+        # Copy so handlers cannot mutate the cached entry
+        return dict(user)
     except Exception:
         raise HTTPException(status_code=401, detail="Token tidak valid")
 
@@ -70,7 +154,7 @@ async def register_user(user_data: UserCreate, request: Request):
             raise HTTPException(status_code=400, detail="Email sudah terdaftar")
         
         # Hash password
-        hashed_password = hash_password(user_data.password)
+        hashed_password = await hash_password(user_data.password)
         
         # Generate unique referral code for this user
         my_referral_code = generate_referral_code(user_data.fullName)
@@ -185,7 +269,7 @@ async def login_user(credentials: UserLogin, request: Request):
         if not user:
             raise HTTPException(status_code=401, detail="Email atau password salah")
         
-        if not verify_password(credentials.password, user["hashedPassword"]):
+        if not await verify_password(credentials.password, user["hashedPassword"]):
             raise HTTPException(status_code=401, detail="Email atau password salah")
         
         if not user.get("isActive", True):
@@ -229,38 +313,45 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
     """
     Get current user profile
     """
+    user = await db.users.find_one(
+        {"_id": current_user["_id"]},
+        {"hashedPassword": 0, "lastAnalysis": 0, "freeTestAnswers": 0, "paidTestAnswers": 0}
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User tidak ditemukan")
+    
     return {
-        "id": str(current_user["_id"]),
-        "email": current_user["email"],
-        "fullName": current_user["fullName"],
-        "birthDate": current_user.get("birthDate"),
-        "whatsapp": current_user.get("whatsapp"),
-        "userType": current_user.get("userType", "individual"),
+        "id": str(user["_id"]),
+        "email": user["email"],
+        "fullName": user["fullName"],
+        "birthDate": user.get("birthDate"),
+        "whatsapp": user.get("whatsapp"),
+        "userType": user.get("userType", "individual"),
         
         # Location
-        "province": current_user.get("province"),
-        "city": current_user.get("city"),
-        "district": current_user.get("district"),
-        "village": current_user.get("village"),
-        "address": current_user.get("address"),
+        "province": user.get("province"),
+        "city": user.get("city"),
+        "district": user.get("district"),
+        "village": user.get("village"),
+        "address": user.get("address"),
         
         # Institution
-        "institutionName": current_user.get("institutionName"),
-        "institutionAddress": current_user.get("institutionAddress"),
-        "position": current_user.get("position"),
+        "institutionName": user.get("institutionName"),
+        "institutionAddress": user.get("institutionAddress"),
+        "position": user.get("position"),
         
         # Referral
-        "myReferralCode": current_user.get("myReferralCode"),
-        "referralCount": current_user.get("referralCount", 0),
-        "referralBonus": current_user.get("referralBonus", 0),
-        "referralSource": current_user.get("referralSource"),
+        "myReferralCode": user.get("myReferralCode"),
+        "referralCount": user.get("referralCount", 0),
+        "referralBonus": user.get("referralBonus", 0),
+        "referralSource": user.get("referralSource"),
         
         # Status
-        "freeTestStatus": current_user.get("freeTestStatus", "not_started"),
-        "paidTestStatus": current_user.get("paidTestStatus", "not_started"),
-        "paymentStatus": current_user.get("paymentStatus", "unpaid"),
-        "isVerified": current_user.get("isVerified", False),
-        "certificateNumber": current_user.get("certificateNumber")
+        "freeTestStatus": user.get("freeTestStatus", "not_started"),
+        "paidTestStatus": user.get("paidTestStatus", "not_started"),
+        "paymentStatus": user.get("paymentStatus", "unpaid"),
+        "isVerified": user.get("isVerified", False),
+        "certificateNumber": user.get("certificateNumber")
     }
 
 @router.put("/profile", response_model=dict)
@@ -279,6 +370,7 @@ async def update_profile(
             {"_id": current_user["_id"]},
             {"$set": update_data}
         )
+        invalidate_user_cache(current_user["_id"])
         
         return {"success": True, "message": "Profil berhasil diupdate"}
     except Exception as e:
@@ -293,15 +385,17 @@ async def change_password(
     Change user password
     """
     try:
-        if not verify_password(data.currentPassword, current_user["hashedPassword"]):
+        user = await db.users.find_one({"_id": current_user["_id"]}, {"hashedPassword": 1})
+        if not user or not await verify_password(data.currentPassword, user["hashedPassword"]):
             raise HTTPException(status_code=400, detail="Password lama salah")
         
-        new_hashed = hash_password(data.newPassword)
+        new_hashed = await hash_password(data.newPassword)
         
         await db.users.update_one(
             {"_id": current_user["_id"]},
             {"$set": {"hashedPassword": new_hashed, "updatedAt": datetime.utcnow()}}
         )
+        invalidate_user_cache(current_user["_id"])
         
         return {"success": True, "message": "Password berhasil diubah"}
     except HTTPException:
@@ -314,7 +408,11 @@ async def get_referral_link(current_user: dict = Depends(get_current_user)):
     """
     Get user's referral link
     """
-    referral_code = current_user.get("myReferralCode")
+    user = await db.users.find_one(
+        {"_id": current_user["_id"]},
+        {"myReferralCode": 1, "referralCount": 1, "referralBonus": 1}
+    ) or {}
+    referral_code = user.get("myReferralCode")
     if not referral_code:
         # Generate one if doesn't exist
         referral_code = generate_referral_code(current_user["fullName"])
@@ -328,6 +426,6 @@ async def get_referral_link(current_user: dict = Depends(get_current_user)):
     return {
         "referralCode": referral_code,
         "referralLink": f"{base_url}/register?ref={referral_code}",
-        "referralCount": current_user.get("referralCount", 0),
-        "referralBonus": current_user.get("referralBonus", 0)
+        "referralCount": user.get("referralCount", 0),
+        "referralBonus": user.get("referralBonus", 0)
     }
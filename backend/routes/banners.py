@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, Request
 from typing import List, Optional
 from database import get_db
 from datetime import datetime
 from bson import ObjectId
 from routes.admin import verify_token
-import uuid
+from utils.cache import public_cache
+from utils.etag import etag_response
+from utils.blobs import blob_store
+from utils.images import image_pipeline
+from pymongo import ReturnDocument
 from pathlib import Path
 
 router = APIRouter(prefix="/api/banners", tags=["banners"])
@@ -14,8 +18,36 @@ db = get_db()
 UPLOAD_DIR = Path("/app/frontend/public/uploads/banners")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+CACHE_PREFIX = "banners:"
+
+blob_store.track("banners", "imageUrl")
+
+async def load_banners(type: Optional[str] = None, isActive: Optional[bool] = None) -> List[dict]:
+    query = {}
+    if type:
+        query["type"] = type
+    if isActive is not None:
+        query["isActive"] = isActive
+    
+    cursor = db.banners.find(query).sort("order", 1)
+    return await cursor.to_list(100)
+
+async def get_cached_banners(type: Optional[str] = None, isActive: Optional[bool] = None) -> List[dict]:
+    return await public_cache.get_or_load(
+        f"{CACHE_PREFIX}{type}:{isActive}",
+        lambda: load_banners(type, isActive)
+    )
+
+async def record_image_variants(url: str, srcset: dict):
+    result = await db.banners.update_many({"imageUrl": url}, {"$set": {"imageSrcset": srcset}})
+    if result.modified_count:
+        public_cache.invalidate_prefix(CACHE_PREFIX)
+
+image_pipeline.on_ready(record_image_variants)
+
 @router.get("", response_model=List[dict])
 async def get_banners(
+    request: Request,
     type: Optional[str] = None,
     isActive: Optional[bool] = None
 ):
@@ -23,24 +55,12 @@ async def get_banners(
     Get all banners (public)
     """
     try:
-        query = {}
-        if type:
-            query["type"] = type
-        if isActive is not None:
-            query["isActive"] = isActive
-        
-        cursor = db.banners.find(query).sort("order", 1)
-        banners = await cursor.to_list(100)
-        
-        for banner in banners:
-            banner["_id"] = str(banner["_id"])
-        
-        return banners
+        return etag_response(request, await get_cached_banners(type, isActive))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @router.get("/{banner_id}", response_model=dict)
-async def get_banner(banner_id: str):
+async def get_banner(request: Request, banner_id: str):
     """
     Get banner by ID
     """
@@ -52,8 +72,7 @@ async def get_banner(banner_id: str):
         if not banner:
             raise HTTPException(status_code=404, detail="Banner not found")
         
-        banner["_id"] = str(banner["_id"])
-        return banner
+        return etag_response(request, banner)
     except HTTPException:
         raise
     except Exception as e:
@@ -81,17 +100,14 @@ async def create_banner(
             raise HTTPException(status_code=400, detail="File type not allowed")
         
         # Save file
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/banners", file_extension)
+        image_url = stored.url
         
         banner_data = {
             "title": title,
             "description": description,
-            "imageUrl": f"/uploads/banners/{unique_filename}",
+            "imageUrl": image_url,
+            "imageSrcset": None,
             "link": link,
             "type": type,  # slider, popup
             "isActive": True,
@@ -101,6 +117,9 @@ async def create_banner(
         }
         
         result = await db.banners.insert_one(banner_data)
+        public_cache.invalidate_prefix(CACHE_PREFIX)
+        await blob_store.refresh(image_url)
+        image_pipeline.schedule(stored.path, image_url)
         
         return {
             "success": True,
@@ -154,25 +173,28 @@ async def update_banner(
             if file_extension not in allowed_extensions:
                 raise HTTPException(status_code=400, detail="File type not allowed")
             
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-            file_path = UPLOAD_DIR / unique_filename
-            
-            contents = await file.read()
-            with open(file_path, 'wb') as f:
-                f.write(contents)
+            stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/banners", file_extension)
             
-            update_data["imageUrl"] = f"/uploads/banners/{unique_filename}"
+            update_data["imageUrl"] = stored.url
+            # Filled in by the image pipeline once the variants are generated
+            update_data["imageSrcset"] = None
         
         update_data["updatedAt"] = datetime.utcnow()
         
-        result = await db.banners.update_one(
+        previous = await db.banners.find_one_and_update(
             {"_id": ObjectId(banner_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"imageUrl": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="Banner not found")
         
+        public_cache.invalidate_prefix(CACHE_PREFIX)
+        if file:
+            await blob_store.refresh(previous.get("imageUrl"), stored.url)
+            image_pipeline.schedule(stored.path, stored.url)
         return {"success": True, "message": "Banner updated successfully"}
     except HTTPException:
         raise
@@ -191,11 +213,13 @@ async def delete_banner(
         if not ObjectId.is_valid(banner_id):
             raise HTTPException(status_code=400, detail="Invalid banner ID")
         
-        result = await db.banners.delete_one({"_id": ObjectId(banner_id)})
+        banner = await db.banners.find_one_and_delete({"_id": ObjectId(banner_id)}, projection={"imageUrl": 1})
         
-        if result.deleted_count == 0:
+        if banner is None:
             raise HTTPException(status_code=404, detail="Banner not found")
         
+        public_cache.invalidate_prefix(CACHE_PREFIX)
+        await blob_store.refresh(banner.get("imageUrl"))
         return {"success": True, "message": "Banner deleted successfully"}
     except HTTPException:
         raise
@@ -218,6 +242,7 @@ async def reorder_banners(
                     {"$set": {"order": item["order"]}}
                 )
         
+        public_cache.invalidate_prefix(CACHE_PREFIX)
         return {"success": True, "message": "Banners reordered successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -1,26 +1,43 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form
-from fastapi.responses import StreamingResponse
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
 from database import get_db
-from datetime import datetime
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ReturnDocument, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
+from utils.blobs import blob_store
+from utils.images import image_pipeline
+from datetime import datetime, timedelta
 from bson import ObjectId
 from routes.admin import verify_token
+from utils.background_jobs import BackgroundJobs
+from utils.pubsub import pubsub, status_event_stream
+import asyncio
+import csv
+import io
+import os
 import uuid
 from pathlib import Path
-from io import BytesIO
-
-# PDF Generation imports
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.lib.units import inch, cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-from reportlab.pdfgen import canvas
+from utils.certificate_pdf import (
+    LAYOUT_VERSION, generate_certificate_pdf, generate_ai_certificate_pdf, warm_template_assets
+)
+from utils.pdf_renderer import pdf_renderer
+from utils.pdf_cache import certificate_pdf_cache
+from utils.etag import etag_matches
+from utils.responses import file_range_response
+from utils.zip_stream import ZipStreamWriter
 
 router = APIRouter(prefix="/api/certificates", tags=["certificates"])
 db = get_db()
 
+declare_indexes(
+    "issued_certificates",
+    IndexModel([("certificateNumber", ASCENDING)], name="certificateNumber_1", unique=True),
+    IndexModel([("issuedAt", DESCENDING)], name="issuedAt_-1"),
+    IndexModel([("userId", ASCENDING), ("courseName", ASCENDING)], name="userId_1_courseName_1"),
+)
+
 # Upload directory
 UPLOAD_DIR = Path("/app/frontend/public/uploads/certificates")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
@@ -51,8 +68,7 @@ async def get_certificate_template():
             result = await db.certificate_templates.insert_one(default_template)
             template = await db.certificate_templates.find_one({"_id": result.inserted_id})
         
-        template["_id"] = str(template["_id"])
-        return template
+        return MongoJSONResponse(template)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -93,18 +109,31 @@ async def update_certificate_template(
         
         template = await db.certificate_templates.find_one()
         if template:
+            # A new version changes the cache key of every rendered PDF
             await db.certificate_templates.update_one(
                 {"_id": template["_id"]},
-                {"$set": update_data}
+                {"$set": update_data, "$inc": {"version": 1}}
             )
         else:
             update_data["createdAt"] = datetime.utcnow()
+            update_data["version"] = 1
             await db.certificate_templates.insert_one(update_data)
+        await warm_renderer_template()
         
         return {"success": True, "message": "Template updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+CERTIFICATE_ASSET_FIELDS = ("backgroundUrl", "logoUrl", "signatureUrl")
+
+blob_store.track("certificate_templates", *CERTIFICATE_ASSET_FIELDS)
+
+async def record_asset_variants(url: str, srcset: dict):
+    for field in CERTIFICATE_ASSET_FIELDS:
+        await db.certificate_templates.update_many({field: url}, {"$set": {f"{field}Srcset": srcset}})
+
+image_pipeline.on_ready(record_asset_variants)
+
 @router.post("/template/upload/{asset_type}", response_model=dict)
 async def upload_certificate_asset(
     asset_type: str,
@@ -125,14 +154,9 @@ async def upload_certificate_asset(
         if file_extension not in allowed_extensions:
             raise HTTPException(status_code=400, detail="File type not allowed")
         
-        unique_filename = f"cert_{asset_type}_{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/certificates", file_extension)
         
-        file_url = f"/uploads/certificates/{unique_filename}"
+        file_url = stored.url
         
         # Update template
         field_map = {
@@ -145,8 +169,18 @@ async def upload_certificate_asset(
         if template:
             await db.certificate_templates.update_one(
                 {"_id": template["_id"]},
-                {"$set": {field_map[asset_type]: file_url, "updatedAt": datetime.utcnow()}}
+                {
+                    "$set": {
+                        field_map[asset_type]: file_url,
+                        f"{field_map[asset_type]}Srcset": None,
+                        "updatedAt": datetime.utcnow()
+                    },
+                    "$inc": {"version": 1}
+                }
             )
+            await blob_store.refresh(template.get(field_map[asset_type]), file_url)
+            await warm_renderer_template()
+        image_pipeline.schedule(stored.path, file_url)
         
         return {"success": True, "url": file_url, "message": f"{asset_type} uploaded successfully"}
     except HTTPException:
@@ -167,10 +201,7 @@ async def get_issued_certificates(
         cursor = db.issued_certificates.find().skip(skip).limit(limit).sort("issuedAt", -1)
         certificates = await cursor.to_list(length=limit)
         
-        for cert in certificates:
-            cert["_id"] = str(cert["_id"])
-        
-        return certificates
+        return MongoJSONResponse(certificates)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -198,15 +229,20 @@ async def issue_certificate(
             "certificateNumber": f"NEWME-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}",
             "issuedAt": datetime.utcnow(),
             "completionDate": completionDate or datetime.utcnow().strftime("%Y-%m-%d"),
-            "issuedBy": token_data["sub"]
+            "issuedBy": token_data["sub"],
+            "renderStatus": "pending",
+            "renderRequestedAt": datetime.utcnow()
         }
         
         result = await db.issued_certificates.insert_one(certificate_data)
+        # The PDF is rendered in the background so the first download is a cache hit
+        schedule_certificate_prerender(result.inserted_id, certificate_data["certificateNumber"])
         
         return {
             "success": True,
             "certificateId": str(result.inserted_id),
             "certificateNumber": certificate_data["certificateNumber"],
+            "renderStatus": "pending",
             "message": "Certificate issued successfully"
         }
     except HTTPException:
@@ -214,6 +250,176 @@ async def issue_certificate(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+MAX_BULK_CERTIFICATES = int(os.environ.get("CERTIFICATE_BULK_MAX", "500"))
+
+class BulkCertificateIssue(BaseModel):
+    courseName: str = Field(..., min_length=1, max_length=200)
+    completionDate: Optional[str] = None
+    # Either explicit registrations...
+    userIds: Optional[List[str]] = None
+    # ...or a filter on registrations
+    testStatus: Optional[str] = None
+    registeredFrom: Optional[datetime] = None
+    registeredTo: Optional[datetime] = None
+    # Leave out users who already hold a certificate for this course
+    skipIssued: bool = True
+
+async def select_bulk_recipients(bulk_data: BulkCertificateIssue) -> List[dict]:
+    projection = {"name": 1, "email": 1}
+    if bulk_data.userIds:
+        user_ids = list(dict.fromkeys(bulk_data.userIds))
+        invalid = [user_id for user_id in user_ids if not ObjectId.is_valid(user_id)]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Invalid user IDs: {', '.join(invalid)}")
+        if len(user_ids) > MAX_BULK_CERTIFICATES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_CERTIFICATES} certificates per request")
+        users = await db.registrations.find(
+            {"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}}, projection
+        ).to_list(len(user_ids))
+        missing = set(user_ids) - {str(user["_id"]) for user in users}
+        if missing:
+            raise HTTPException(status_code=404, detail=f"User not found: {', '.join(sorted(missing))}")
+    else:
+        query = {}
+        if bulk_data.testStatus:
+            query["testStatus"] = bulk_data.testStatus
+        if bulk_data.registeredFrom or bulk_data.registeredTo:
+            query["registrationDate"] = {}
+            if bulk_data.registeredFrom:
+                query["registrationDate"]["$gte"] = bulk_data.registeredFrom
+            if bulk_data.registeredTo:
+                query["registrationDate"]["$lte"] = bulk_data.registeredTo
+        if not query:
+            raise HTTPException(status_code=400, detail="Provide userIds or a registration filter")
+        users = await db.registrations.find(query, projection).sort("registrationDate", 1).to_list(
+            MAX_BULK_CERTIFICATES + 1
+        )
+        if len(users) > MAX_BULK_CERTIFICATES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_CERTIFICATES} certificates per request")
+
+    if bulk_data.skipIssued and users:
+        issued = await db.issued_certificates.distinct("userId", {
+            "courseName": bulk_data.courseName,
+            "userId": {"$in": [str(user["_id"]) for user in users]}
+        })
+        issued = set(issued)
+        users = [user for user in users if str(user["_id"]) not in issued]
+    return users
+
+async def bulk_certificate_archive(certificates: List[dict], template: dict) -> AsyncIterator[bytes]:
+    """
+    Render certificates through the process pool, at most one per worker at
+    a time, and stream them as a ZIP in the order they finish. Each PDF goes
+    through the rendered-PDF cache and is copied into the archive from disk,
+    so memory holds one entry at a time. A certificates.csv at the end lists
+    every certificate with its render result.
+
+    If the client goes away, the certificates that were not rendered yet
+    are handed to the background pre-render queue instead.
+    """
+    async def build_job(certificate: dict) -> RenderJob:
+        return certificate_render_job(certificate, template)
+
+    def start(certificate: dict) -> asyncio.Task:
+        return asyncio.create_task(prerender(
+            "issued_certificates",
+            certificate["_id"],
+            certificate_render_topic(certificate["certificateNumber"]),
+            build_job,
+            f"/api/certificates/download/{certificate['certificateNumber']}"
+        ))
+
+    archive = ZipStreamWriter()
+    remaining = iter(certificates)
+    running: Dict[asyncio.Task, dict] = {}
+    summary = io.StringIO()
+    rows = csv.writer(summary)
+    rows.writerow(["certificateNumber", "userId", "userName", "userEmail", "file", "renderStatus", "renderError"])
+    try:
+        while True:
+            while len(running) < pdf_renderer.max_workers:
+                certificate = next(remaining, None)
+                if certificate is None:
+                    break
+                running[start(certificate)] = certificate
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                certificate = running.pop(task)
+                number = certificate["certificateNumber"]
+                filename, error = f"certificate_{number}.pdf", None
+                try:
+                    path = task.result()
+                    if path is None:
+                        error = "Rendering failed"
+                    else:
+                        yield await archive.add_file(filename, path, certificate["issuedAt"])
+                except Exception as e:
+                    error = str(e)
+                rows.writerow([
+                    number, certificate["userId"], certificate.get("userName"), certificate.get("userEmail"),
+                    filename if error is None else "", "ready" if error is None else "failed", error or ""
+                ])
+
+        yield archive.add_bytes("certificates.csv", summary.getvalue().encode("utf-8-sig"))
+        yield archive.close()
+    finally:
+        for task, certificate in running.items():
+            task.cancel()
+            schedule_certificate_prerender(certificate["_id"], certificate["certificateNumber"])
+        for certificate in remaining:
+            schedule_certificate_prerender(certificate["_id"], certificate["certificateNumber"])
+
+@router.post("/issue-bulk")
+async def issue_certificates_bulk(
+    bulk_data: BulkCertificateIssue,
+    token_data: dict = Depends(verify_token)
+):
+    """
+    Issue certificates to a list of users or to every registration matching
+    a filter (admin only), and download them all as one ZIP
+    """
+    try:
+        users = await select_bulk_recipients(bulk_data)
+        if not users:
+            raise HTTPException(status_code=404, detail="No users to issue certificates to")
+
+        now = datetime.utcnow()
+        certificates = [
+            {
+                "userId": str(user["_id"]),
+                "userName": user.get("name"),
+                "userEmail": user.get("email"),
+                "courseName": bulk_data.courseName,
+                "certificateNumber": f"NEWME-{now.strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}",
+                "issuedAt": now,
+                "completionDate": bulk_data.completionDate or now.strftime("%Y-%m-%d"),
+                "issuedBy": token_data["sub"],
+                "renderStatus": "pending",
+                "renderRequestedAt": now
+            }
+            for user in users
+        ]
+        # insert_many sets _id on each document
+        await db.issued_certificates.insert_many(certificates)
+
+        template = await db.certificate_templates.find_one() or DEFAULT_TEMPLATE
+
+        return StreamingResponse(
+            bulk_certificate_archive(certificates, template),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f"attachment; filename=certificates_{now.strftime('%Y%m%d_%H%M%S')}.zip",
+                "X-Certificates-Issued": str(len(certificates))
+            }
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
 @router.get("/verify/{certificate_number}", response_model=dict)
 async def verify_certificate(certificate_number: str):
     """
@@ -240,481 +446,211 @@ async def verify_certificate(certificate_number: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-def generate_certificate_pdf(certificate: dict, template: dict) -> BytesIO:
-    """
-    Generate PDF certificate
-    """
-    buffer = BytesIO()
-    
-    # Create landscape A4 PDF
-    page_width, page_height = landscape(A4)
-    c = canvas.Canvas(buffer, pagesize=landscape(A4))
-    
-    # Colors from template
-    accent_color_hex = template.get("accentColor", "#FFD700")
-    text_color_hex = template.get("textColor", "#000000")
-    
-    # Convert hex to RGB
-    def hex_to_rgb(hex_color):
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4))
-    
-    accent_rgb = hex_to_rgb(accent_color_hex)
-    text_rgb = hex_to_rgb(text_color_hex)
-    
-    # Background
-    background_url = template.get("backgroundUrl")
-    if background_url:
-        try:
-            bg_path = Path(f"/app/frontend/public{background_url}")
-            if bg_path.exists():
-                c.drawImage(str(bg_path), 0, 0, width=page_width, height=page_height)
-        except:
-            pass
-    else:
-        # Default elegant background
-        c.setFillColorRGB(0.98, 0.98, 0.95)
-        c.rect(0, 0, page_width, page_height, fill=1)
-        
-        # Border
-        c.setStrokeColorRGB(*accent_rgb)
-        c.setLineWidth(3)
-        c.rect(30, 30, page_width - 60, page_height - 60, stroke=1, fill=0)
-        
-        # Inner border
-        c.setLineWidth(1)
-        c.rect(40, 40, page_width - 80, page_height - 80, stroke=1, fill=0)
-    
-    # Logo
-    logo_url = template.get("logoUrl")
-    if logo_url:
-        try:
-            logo_path = Path(f"/app/frontend/public{logo_url}")
-            if logo_path.exists():
-                c.drawImage(str(logo_path), page_width/2 - 40, page_height - 120, width=80, height=80, preserveAspectRatio=True)
-        except:
-            pass
-    
-    # Title
-    title_text = template.get("titleText", "SERTIFIKAT")
-    c.setFillColorRGB(*accent_rgb)
-    c.setFont("Helvetica-Bold", 48)
-    c.drawCentredString(page_width/2, page_height - 160, title_text)
-    
-    # Subtitle
-    subtitle_text = template.get("subtitleText", "Diberikan kepada")
-    c.setFillColorRGB(*text_rgb)
-    c.setFont("Helvetica", 18)
-    c.drawCentredString(page_width/2, page_height - 200, subtitle_text)
-    
-    # Recipient Name
-    recipient_name = certificate.get("userName", "")
-    c.setFillColorRGB(*text_rgb)
-    c.setFont("Helvetica-Bold", 36)
-    c.drawCentredString(page_width/2, page_height - 260, recipient_name)
-    
-    # Decorative line under name
-    c.setStrokeColorRGB(*accent_rgb)
-    c.setLineWidth(2)
-    name_width = c.stringWidth(recipient_name, "Helvetica-Bold", 36)
-    c.line(page_width/2 - name_width/2 - 20, page_height - 275, 
-           page_width/2 + name_width/2 + 20, page_height - 275)
-    
-    # Completion text
-    completion_text = template.get("completionText", "Telah berhasil menyelesaikan")
-    c.setFillColorRGB(*text_rgb)
-    c.setFont("Helvetica", 16)
-    c.drawCentredString(page_width/2, page_height - 310, completion_text)
-    
-    # Course name
-    course_name = certificate.get("courseName", "")
-    c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(page_width/2, page_height - 350, course_name)
-    
-    # Date
-    completion_date = certificate.get("completionDate", "")
-    if completion_date:
-        c.setFont("Helvetica", 14)
-        c.drawCentredString(page_width/2, page_height - 390, f"Pada tanggal: {completion_date}")
-    
-    # Certificate number
-    cert_number = certificate.get("certificateNumber", "")
-    c.setFont("Helvetica", 12)
-    c.setFillColorRGB(0.5, 0.5, 0.5)
-    c.drawCentredString(page_width/2, 80, f"No. Sertifikat: {cert_number}")
-    
-    # Signature section
-    signer_name = template.get("signerName", "Director NEWME CLASS")
-    signer_title = template.get("signerTitle", "Direktur")
-    
-    # Signature image
-    signature_url = template.get("signatureUrl")
-    if signature_url:
-        try:
-            sig_path = Path(f"/app/frontend/public{signature_url}")
-            if sig_path.exists():
-                c.drawImage(str(sig_path), page_width/2 - 50, 120, width=100, height=50, preserveAspectRatio=True)
-        except:
-            pass
-    
-    # Signature line
-    c.setStrokeColorRGB(*text_rgb)
-    c.setLineWidth(1)
-    c.line(page_width/2 - 80, 115, page_width/2 + 80, 115)
-    
-    # Signer info
-    c.setFillColorRGB(*text_rgb)
-    c.setFont("Helvetica-Bold", 14)
-    c.drawCentredString(page_width/2, 95, signer_name)
-    c.setFont("Helvetica", 12)
-    c.drawCentredString(page_width/2, 75, signer_title)
-    
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-
-def generate_ai_certificate_pdf(user: dict, ai_analysis: dict, template: dict) -> BytesIO:
-    """
-    Generate PDF certificate dengan layout seperti template NEWME CLASS
-    Termasuk 5 Element, Kepribadian, Kekuatan Jatidiri, dll
-    """
-    buffer = BytesIO()
-    
-    page_width, page_height = landscape(A4)
-    c = canvas.Canvas(buffer, pagesize=landscape(A4))
-    
-    # Colors
-    gold_rgb = (0.85, 0.65, 0.13)  # Gold/Yellow
-    black_rgb = (0, 0, 0)
-    gray_rgb = (0.3, 0.3, 0.3)
-    
-    def draw_wrapped_text(c, text, x, y, max_width, font_name, font_size, line_height=None):
-        """Helper to draw wrapped text"""
-        if line_height is None:
-            line_height = font_size + 2
-        c.setFont(font_name, font_size)
-        words = text.split()
-        lines = []
-        current_line = ""
-        for word in words:
-            test_line = current_line + " " + word if current_line else word
-            if c.stringWidth(test_line, font_name, font_size) < max_width:
-                current_line = test_line
-            else:
-                lines.append(current_line)
-                current_line = word
-        if current_line:
-            lines.append(current_line)
-        
-        for line in lines:
-            c.drawString(x, y, line)
-            y -= line_height
-        return y
-    
-    # ========== PAGE 1: Main Certificate ==========
-    # Background
-    c.setFillColorRGB(1, 1, 0.95)  # Light cream
-    c.rect(0, 0, page_width, page_height, fill=1)
-    
-    # Gold gradient-like border (top and bottom)
-    c.setFillColorRGB(*gold_rgb)
-    c.rect(0, page_height - 25, page_width, 25, fill=1)
-    c.rect(0, 0, page_width, 25, fill=1)
-    
-    # Inner border
-    c.setStrokeColorRGB(*gold_rgb)
-    c.setLineWidth(2)
-    c.rect(15, 35, page_width - 30, page_height - 70, stroke=1, fill=0)
-    
-    # Logo placeholder (left side)
-    c.setFillColorRGB(*gold_rgb)
-    c.setFont("Helvetica-Bold", 24)
-    c.drawString(40, page_height - 80, "NEWME")
-    c.setFont("Helvetica", 10)
-    c.drawString(40, page_height - 95, "CLASS")
-    c.setFont("Helvetica-Oblique", 8)
-    c.drawString(40, page_height - 108, "Jatidirimu di Sini")
-    
-    # Title Section (right side)
-    c.setFillColorRGB(*black_rgb)
-    c.setFont("Helvetica-Bold", 36)
-    c.drawRightString(page_width - 40, page_height - 70, "SERTIFIKAT")
-    c.setFont("Helvetica", 12)
-    c.drawRightString(page_width - 40, page_height - 88, "ANALISA KEPRIBADIAN & JATIDIRI")
-    
-    # Certificate number
-    cert_number = f"1-{datetime.utcnow().strftime('%m.%d')}-{str(user.get('_id', ''))[-6:]}"
-    c.setFont("Helvetica", 10)
-    c.drawRightString(page_width - 40, page_height - 105, cert_number)
-    
-    # Sub header
-    c.setFont("Helvetica", 11)
-    c.drawCentredString(page_width/2, page_height - 130, "OPTIMALKAN VERSI TERBAIK_MU")
-    
-    # User Name (large, centered)
-    recipient_name = user.get("fullName", "Pengguna")
-    c.setFont("Helvetica-Bold", 28)
-    c.drawCentredString(page_width/2, page_height - 165, recipient_name)
-    
-    # Dominant Type
-    dominant_type = ai_analysis.get("dominantType", "DOMINAN")
-    c.setFont("Helvetica-Bold", 14)
-    c.drawCentredString(page_width/2, page_height - 190, f"- {dominant_type} -")
-    
-    # Personality Type and Element (two columns)
-    personality_type = ai_analysis.get("personalityType", "AMBIVERT")
-    dominant_element = ai_analysis.get("dominantElement", "AIR")
-    element_scores = ai_analysis.get("elementScores", {})
-    
-    # Get dominant element percentage
-    dominant_pct = 0
-    dominant_label = "SI ADAPTIF"
-    if dominant_element in element_scores:
-        dominant_pct = element_scores[dominant_element].get("percentage", 0)
-        dominant_label = element_scores[dominant_element].get("label", "SI ADAPTIF")
-    
-    # Left column header: Kepribadian
-    c.setFont("Helvetica", 10)
-    c.drawString(60, page_height - 215, "Kepribadian:")
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(60, page_height - 235, f"{personality_type} (#)")
-    
-    # Right column header: Simbol Karakter
-    c.drawString(page_width/2 + 50, page_height - 215, "Simbol Karakter:")
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(page_width/2 + 50, page_height - 235, f"{dominant_element} ({dominant_label})")
-    c.setFont("Helvetica", 12)
-    c.drawString(page_width/2 + 50, page_height - 252, f"{dominant_pct:.2f} %")
-    
-    # Symbol display (like -aA-)
-    c.setFont("Helvetica-Bold", 20)
-    c.drawCentredString(page_width/2, page_height - 275, f"- {personality_type[0].lower()}{dominant_element[0].upper()} -")
-    
-    # ========== Three Column Layout ==========
-    col_width = (page_width - 100) / 3
-    col1_x = 50
-    col2_x = 50 + col_width + 15
-    col3_x = 50 + (col_width + 15) * 2
-    y_start = page_height - 310
-    
-    # Column 1: KEPRIBADIAN
-    c.setFillColorRGB(*black_rgb)
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col1_x, y_start, "KEPRIBADIAN:")
-    
-    kepribadian = ai_analysis.get("kepribadian", ["Responsif", "Investigatif", "Aktif", "Peka", "Sensitif"])
-    y = y_start - 15
-    c.setFont("Helvetica", 8)
-    for trait in kepribadian[:8]:
-        c.drawString(col1_x + 5, y, trait)
-        y -= 11
-    
-    # CIRI KHAS section
-    y -= 10
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col1_x, y, "CIRI KHAS:")
-    y -= 15
-    c.setFont("Helvetica", 8)
-    ciri_khas = ai_analysis.get("ciriKhas", ["Penampil", "Entertainer", "Kulineran", "BB Stabil"])
-    for ciri in ciri_khas[:6]:
-        c.drawString(col1_x + 5, y, ciri)
-        y -= 11
-    
-    # KARAKTER section
-    y -= 10
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col1_x, y, "(+/-) KARAKTER:")
-    y -= 15
-    c.setFont("Helvetica", 8)
-    c.drawString(col1_x + 5, y, f"{dominant_element}/TENANG")
-    y -= 11
-    karakter = ai_analysis.get("karakter", ["Pengamat", "Performer", "Investigator"])
-    for kar in karakter[:5]:
-        c.drawString(col1_x + 5, y, kar)
-        y -= 11
-    
-    # Column 2: Kekuatan JATIDIRI
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col2_x, y_start, "Kekuatan JATIDIRI")
-    
-    kekuatan = ai_analysis.get("kekuatanJatidiri", {})
-    y = y_start - 15
-    c.setFont("Helvetica", 8)
-    
-    jatidiri_items = [
-        ("1- Kehidupan:", kekuatan.get("kehidupan", "RELA BERKORBAN")),
-        ("2- Kesehatan:", kekuatan.get("kesehatan", "JANTUNG")),
-        ("3- Kontribusi:", kekuatan.get("kontribusi", "PERDAMAIAN")),
-        ("4- Kekhasan:", kekuatan.get("kekhasan", "TATAPAN")),
-        ("5- Kharisma:", kekuatan.get("kharisma", "SENYUMAN")),
-    ]
-    
-    for label, value in jatidiri_items:
-        c.drawString(col2_x, y, f"{label} {value}")
-        y -= 12
-    
-    # Kompilasi ADAPTASI
-    y -= 10
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col2_x, y, "Kompilasi ADAPTASI")
-    y -= 15
-    c.setFont("Helvetica", 7)
-    
-    kompilasi = ai_analysis.get("kompilasiAdaptasi", [
-        "Belajar: Merangkum", "Bekerja: Bebas dalam aturan", "Kalibrasi: Ganti Suasana",
-        "Daya Raga: Refleks Emosi", "Memimpin: Org. Swadaya/Seni", "Jalur Bisnis: Pemodal",
-        "Pendukung Karir: Serba Bisa", "Keahlian: Mendaramaikan", "Karya: Inspirator Kemanusiaan"
-    ])
-    
-    for i, item in enumerate(kompilasi[:15], 1):
-        c.drawString(col2_x, y, f"{i}- {item}")
-        y -= 10
-    
-    # Column 3: Orientasi / Other Elements
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col3_x, y_start, "Orientasi")
-    c.setFont("Helvetica", 9)
-    c.drawString(col3_x, y_start - 15, "Kamu yang lain:")
-    
-    y = y_start - 35
-    # Show other elements with percentages
-    for element, data in element_scores.items():
-        if element != dominant_element:
-            pct = data.get("percentage", 0)
-            label = data.get("label", "")
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(col3_x, y, element)
-            c.setFont("Helvetica", 9)
-            c.drawString(col3_x + 50, y, f"({label})")
-            c.drawString(col3_x, y - 12, f"{pct:.2f} %")
-            y -= 35
-    
-    # Footer with quote
-    y -= 20
-    c.setFont("Helvetica-Oblique", 8)
-    quote = f'"JATIDIRI {dominant_type.lower()}_mu,'
-    c.drawString(col3_x, y, quote)
-    c.drawString(col3_x, y - 10, 'adalah versi TERBAIK_mu"')
-    
-    # Bottom footer
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(col3_x, 60, "NEW ME CLASS")
-    c.setFont("Helvetica", 8)
-    c.drawString(col3_x, 48, "- Jatidirimu di Sini -")
-    
-    # Contact info
-    c.setFont("Helvetica", 8)
-    c.drawRightString(page_width - 40, 50, "0895.0267.1691")
-    
-    # Note at bottom left
-    c.setFont("Helvetica-Oblique", 7)
-    c.drawString(50, 45, "Catt: Point positif only, negatif by private.")
-    
-    # ========== PAGE 2: Detailed Analysis ==========
-    c.showPage()
-    
-    # Background
-    c.setFillColorRGB(1, 1, 0.97)
-    c.rect(0, 0, page_width, page_height, fill=1)
-    
-    # Header bars
-    c.setFillColorRGB(*gold_rgb)
-    c.rect(0, page_height - 20, page_width, 20, fill=1)
-    c.rect(0, 0, page_width, 20, fill=1)
-    
-    # Border
-    c.setStrokeColorRGB(*gold_rgb)
-    c.setLineWidth(1)
-    c.rect(15, 25, page_width - 30, page_height - 50, stroke=1, fill=0)
-    
-    # Title
-    c.setFillColorRGB(*black_rgb)
-    c.setFont("Helvetica-Bold", 20)
-    c.drawCentredString(page_width/2, page_height - 50, "LAPORAN ANALISIS AI")
-    c.setFont("Helvetica", 11)
-    c.drawCentredString(page_width/2, page_height - 68, f"Untuk: {recipient_name}")
-    
-    # Two column layout
-    col_width = (page_width - 100) / 2
-    col1_x = 50
-    col2_x = page_width/2 + 20
-    y_start = page_height - 100
-    
-    # Left Column
-    c.setFillColorRGB(*gold_rgb)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(col1_x, y_start, "KEKUATAN ANDA")
-    
-    y = y_start - 20
-    c.setFillColorRGB(*black_rgb)
-    c.setFont("Helvetica", 9)
-    for strength in ai_analysis.get("strengths", [])[:6]:
-        c.drawString(col1_x + 10, y, f"• {strength[:55]}")
-        y -= 14
-    
-    y -= 15
-    c.setFillColorRGB(*gold_rgb)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(col1_x, y, "AREA PENGEMBANGAN")
-    y -= 20
-    c.setFillColorRGB(*black_rgb)
-    c.setFont("Helvetica", 9)
-    for area in ai_analysis.get("areasToImprove", [])[:5]:
-        c.drawString(col1_x + 10, y, f"• {area[:55]}")
-        y -= 14
-    
-    # Right Column
-    y = y_start
-    c.setFillColorRGB(*gold_rgb)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(col2_x, y, "REKOMENDASI KARIR")
-    y -= 20
-    c.setFillColorRGB(*black_rgb)
-    c.setFont("Helvetica", 9)
-    for career in ai_analysis.get("careerRecommendations", [])[:7]:
-        c.drawString(col2_x + 10, y, f"• {career[:45]}")
-        y -= 14
-    
-    y -= 15
-    c.setFillColorRGB(*gold_rgb)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(col2_x, y, "TIPS PENGEMBANGAN")
-    y -= 20
-    c.setFillColorRGB(*black_rgb)
-    c.setFont("Helvetica", 9)
-    for i, tip in enumerate(ai_analysis.get("tips", [])[:6], 1):
-        c.drawString(col2_x + 10, y, f"{i}. {tip[:50]}")
-        y -= 14
-    
-    # Summary box at bottom
-    summary = ai_analysis.get("summary", "")
-    if summary:
-        y = 120
-        c.setFillColorRGB(0.95, 0.95, 0.90)
-        c.rect(50, 50, page_width - 100, 70, fill=1)
-        c.setStrokeColorRGB(*gold_rgb)
-        c.rect(50, 50, page_width - 100, 70, stroke=1, fill=0)
-        
-        c.setFillColorRGB(*black_rgb)
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(60, 105, "RINGKASAN:")
-        c.setFont("Helvetica", 9)
-        draw_wrapped_text(c, summary, 60, 90, page_width - 130, "Helvetica", 9, 12)
-    
-    # Footer
-    c.setFillColorRGB(0.5, 0.5, 0.5)
-    c.setFont("Helvetica", 7)
-    c.drawCentredString(page_width/2, 35, "Sertifikat ini dihasilkan berdasarkan analisis AI dari jawaban test kepribadian Anda.")
-    c.drawCentredString(page_width/2, 25, f"© NEWME CLASS - Jatidirimu di Sini | Diterbitkan: {datetime.utcnow().strftime('%d %B %Y')}")
-    
-    c.save()
-    buffer.seek(0)
-    return buffer
+CERTIFICATE_RENDER_FIELDS = ("userName", "courseName", "completionDate", "certificateNumber")
+
+DEFAULT_TEMPLATE = {
+    "titleText": "SERTIFIKAT",
+    "subtitleText": "Diberikan kepada",
+    "completionText": "Telah berhasil menyelesaikan",
+    "signerName": "Director NEWME CLASS",
+    "signerTitle": "Direktur",
+    "textColor": "#000000",
+    "accentColor": "#FFD700"
+}
+
+DEFAULT_AI_TEMPLATE = {
+    "signerName": "Director NEWME CLASS",
+    "textColor": "#000000",
+    "accentColor": "#FFD700"
+}
+
+PAID_TEST_PAYMENT_TYPES = ["test", "paid_test", "premium_test"]
+
+# renderStatus: pending -> rendering -> ready | failed
+FINAL_RENDER_STATUSES = {"ready", "failed"}
+# A pending/rendering status this old was lost (e.g. restart) and is scheduled again
+RENDER_STALE_AFTER = timedelta(minutes=5)
+
+certificate_renders = BackgroundJobs(
+    "certificate-render",
+    max_concurrency=int(os.environ.get("CERTIFICATE_PRERENDER_CONCURRENCY", "2"))
+)
+
+async def warm_renderer_template() -> None:
+    """Preload the current template's images and colours into every render worker"""
+    template = await db.certificate_templates.find_one() or DEFAULT_TEMPLATE
+    pdf_renderer.warm(warm_template_assets, template_render_data(template))
+
+def certificate_render_data(certificate: dict) -> dict:
+    """The fields of an issued certificate that end up on the PDF"""
+    return {field: certificate.get(field) for field in CERTIFICATE_RENDER_FIELDS}
+
+def template_render_data(template: dict) -> dict:
+    return {key: value for key, value in template.items() if key != "_id"}
+
+def ai_certificate_analysis(analysis_doc: dict) -> dict:
+    """The analysis printed on the AI certificate; older documents stored it flat"""
+    ai_analysis = analysis_doc.get("aiAnalysis", {})
+    if not ai_analysis:
+        ai_analysis = {
+            "personalityType": analysis_doc.get("personalityType", ""),
+            "summary": analysis_doc.get("summary", ""),
+            "strengths": analysis_doc.get("strengths", []),
+            "areasToImprove": analysis_doc.get("areasToImprove", []),
+            "careerRecommendations": analysis_doc.get("careerRecommendations", []),
+            "tips": analysis_doc.get("tips", [])
+        }
+    return ai_analysis
+
+async def has_paid_test(user: dict) -> bool:
+    if user.get("paymentStatus") == "approved" or user.get("paidTestStatus") == "completed":
+        return True
+    payment = await db.payments.find_one({
+        "userId": str(user["_id"]),
+        "status": "approved",
+        "type": {"$in": PAID_TEST_PAYMENT_TYPES}
+    })
+    return payment is not None
+
+RenderJob = Tuple[str, Callable[[], Awaitable[bytes]]]
+
+def certificate_render_job(certificate: dict, template: dict) -> RenderJob:
+    """Cache key and render call for an issued certificate"""
+    certificate_data = certificate_render_data(certificate)
+    cache_key = certificate_pdf_cache.key(
+        "certificate", LAYOUT_VERSION, template.get("version", 0), certificate_data
+    )
+    return cache_key, lambda: pdf_renderer.render(
+        generate_certificate_pdf, certificate_data, template_render_data(template)
+    )
+
+def ai_certificate_render_job(user: dict, analysis_doc: dict, template: dict) -> RenderJob:
+    """Cache key and render call for the AI certificate of one analysis"""
+    user_data = {"_id": str(user["_id"]), "fullName": user.get("fullName", "Pengguna")}
+    ai_analysis = ai_certificate_analysis(analysis_doc)
+    # The analysis date is printed as the issue date, so the PDF is the same on every download
+    issued_at = analysis_doc.get("createdAt") or datetime.utcnow()
+    cache_key = certificate_pdf_cache.key(
+        "ai-certificate", LAYOUT_VERSION, template.get("version", 0), user_data, ai_analysis, issued_at
+    )
+    return cache_key, lambda: pdf_renderer.render(
+        generate_ai_certificate_pdf, user_data, ai_analysis, template_render_data(template), issued_at
+    )
+
+async def send_certificate_pdf(request: Request, job: RenderJob, filename: str) -> Response:
+    """Serve a PDF from the rendered-PDF cache, rendering it on a miss"""
+    cache_key, render = job
+    etag = f'"{cache_key}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename={filename}"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    path = await certificate_pdf_cache.get_or_render(cache_key, render)
+    return await file_range_response(request, path, "application/pdf", headers)
+
+def render_status_view(doc: Optional[dict]) -> Optional[dict]:
+    if doc is None or not doc.get("renderStatus"):
+        return None
+    return {
+        "renderStatus": doc["renderStatus"],
+        "pdfUrl": doc.get("pdfUrl") if doc["renderStatus"] == "ready" else None,
+        "renderedAt": doc.get("renderedAt"),
+        "renderError": doc.get("renderError")
+    }
+
+def render_is_stale(doc: dict) -> bool:
+    requested_at = doc.get("renderRequestedAt")
+    return (
+        doc.get("renderStatus") not in FINAL_RENDER_STATUSES
+        and (requested_at is None or datetime.utcnow() - requested_at > RENDER_STALE_AFTER)
+    )
+
+async def prerender(
+    collection: str,
+    doc_id: ObjectId,
+    topic: str,
+    build_job: Callable[[dict], Awaitable[RenderJob]],
+    pdf_url: str
+) -> Optional[Path]:
+    """
+    Render a certificate PDF into the rendered-PDF cache ahead of the first
+    download, tracking progress in the document's renderStatus and
+    publishing every change on topic. Returns the cached file, or None if
+    rendering failed.
+    """
+    doc = await db[collection].find_one_and_update(
+        {"_id": doc_id},
+        {"$set": {"renderStatus": "rendering", "renderRequestedAt": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        return None
+    pubsub.publish(topic, render_status_view(doc))
+
+    path = None
+    try:
+        cache_key, render = await build_job(doc)
+        path = await certificate_pdf_cache.get_or_render(cache_key, render)
+        update = {
+            "renderStatus": "ready",
+            "pdfKey": cache_key,
+            "pdfUrl": pdf_url,
+            "renderedAt": datetime.utcnow(),
+            "renderError": None
+        }
+    except Exception as e:
+        update = {"renderStatus": "failed", "renderError": getattr(e, "detail", None) or str(e)}
+
+    doc = await db[collection].find_one_and_update(
+        {"_id": doc_id},
+        {"$set": update},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is not None:
+        pubsub.publish(topic, render_status_view(doc))
+    return path
+
+def certificate_render_topic(certificate_number: str) -> str:
+    return f"certificate:{certificate_number}"
+
+def ai_certificate_render_topic(user_id: str) -> str:
+    return f"ai-certificate:{user_id}"
+
+async def build_issued_certificate_job(certificate: dict) -> RenderJob:
+    template = await db.certificate_templates.find_one() or DEFAULT_TEMPLATE
+    return certificate_render_job(certificate, template)
 
+async def build_ai_certificate_job(analysis_doc: dict) -> RenderJob:
+    user = await db.users.find_one({"_id": ObjectId(analysis_doc["userId"])}, {"fullName": 1})
+    if user is None:
+        raise ValueError("User not found")
+    template = await db.certificate_templates.find_one() or DEFAULT_AI_TEMPLATE
+    return ai_certificate_render_job(user, analysis_doc, template)
+
+def schedule_certificate_prerender(certificate_id: ObjectId, certificate_number: str) -> None:
+    certificate_renders.schedule(("certificate", certificate_id), lambda: prerender(
+        "issued_certificates",
+        certificate_id,
+        certificate_render_topic(certificate_number),
+        build_issued_certificate_job,
+        f"/api/certificates/download/{certificate_number}"
+    ))
+
+def schedule_ai_certificate_prerender(analysis_id: ObjectId, user_id: str) -> None:
+    """Called once an analysis of a paid user is stored; renderStatus lives on the ai_analyses document"""
+    certificate_renders.schedule(("ai-certificate", analysis_id), lambda: prerender(
+        "ai_analyses",
+        analysis_id,
+        ai_certificate_render_topic(user_id),
+        build_ai_certificate_job,
+        "/api/certificates/download-ai-certificate"
+    ))
 
 @router.get("/download/{certificate_number}")
-async def download_certificate(certificate_number: str):
+async def download_certificate(request: Request, certificate_number: str):
     """
     Download certificate as PDF (public)
     """
@@ -724,56 +660,74 @@ async def download_certificate(certificate_number: str):
         if not certificate:
             raise HTTPException(status_code=404, detail="Certificate not found")
         
-        # Get template
-        template = await db.certificate_templates.find_one()
-        if not template:
-            template = {
-                "titleText": "SERTIFIKAT",
-                "subtitleText": "Diberikan kepada",
-                "completionText": "Telah berhasil menyelesaikan",
-                "signerName": "Director NEWME CLASS",
-                "signerTitle": "Direktur",
-                "textColor": "#000000",
-                "accentColor": "#FFD700"
-            }
-        
-        # Generate PDF
-        pdf_buffer = generate_certificate_pdf(certificate, template)
+        template = await db.certificate_templates.find_one() or DEFAULT_TEMPLATE
         
-        return StreamingResponse(
-            pdf_buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=certificate_{certificate_number}.pdf"
-            }
+        return await send_certificate_pdf(
+            request,
+            certificate_render_job(certificate, template),
+            f"certificate_{certificate_number}.pdf"
         )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+async def load_certificate_render_status(certificate_number: str) -> Optional[dict]:
+    certificate = await db.issued_certificates.find_one(
+        {"certificateNumber": certificate_number},
+        {"renderStatus": 1, "renderRequestedAt": 1, "pdfUrl": 1, "renderedAt": 1, "renderError": 1}
+    )
+    if certificate is None:
+        return None
+    # Certificates issued before pre-rendering existed have no status yet
+    certificate.setdefault("renderStatus", "pending")
+    if render_is_stale(certificate):
+        schedule_certificate_prerender(certificate["_id"], certificate_number)
+    return render_status_view(certificate)
 
-from routes.auth import get_current_user
+@router.get("/render-status/{certificate_number}", response_model=dict)
+async def get_certificate_render_status(certificate_number: str):
+    """
+    PDF pre-render status of an issued certificate (public, for polling)
+    """
+    try:
+        status = await load_certificate_render_status(certificate_number)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Certificate not found")
+        return {"certificateNumber": certificate_number, **status}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@router.get("/render-status/{certificate_number}/stream")
+async def stream_certificate_render_status(request: Request, certificate_number: str):
+    """
+    Server-Sent Events with the pre-render status; ends once the PDF is ready or failed
+    """
+    if await db.issued_certificates.count_documents({"certificateNumber": certificate_number}, limit=1) == 0:
+        raise HTTPException(status_code=404, detail="Certificate not found")
+    return StreamingResponse(
+        status_event_stream(
+            request,
+            certificate_render_topic(certificate_number),
+            lambda: load_certificate_render_status(certificate_number),
+            lambda status: status["renderStatus"] in FINAL_RENDER_STATUSES
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+from routes.auth import get_current_user, create_stream_token, resolve_stream_token, STREAM_TOKEN_TTL_SECONDS
 
 @router.get("/download-ai-certificate")
-async def download_ai_certificate(current_user: dict = Depends(get_current_user)):
+async def download_ai_certificate(request: Request, current_user: dict = Depends(get_current_user)):
     """
     Download AI analysis certificate - ONLY for PAID test users
     """
     try:
-        user_id = str(current_user["_id"])
-        
-        # Check if user has paid for test from payments collection
-        payment = await db.payments.find_one({
-            "userId": user_id,
-            "status": "approved",
-            "type": {"$in": ["test", "paid_test", "premium_test"]}
-        })
-        
-        # Also check user's paymentStatus field
-        user_paid = current_user.get("paymentStatus") == "approved" or current_user.get("paidTestStatus") == "completed"
-        
-        if not payment and not user_paid:
+        if not await has_paid_test(current_user):
             raise HTTPException(
                 status_code=403, 
                 detail="Sertifikat hanya tersedia untuk pengguna yang telah membayar test. Silakan upgrade ke Test Premium."
@@ -781,7 +735,7 @@ async def download_ai_certificate(current_user: dict = Depends(get_current_user)
         
         # Get latest AI analysis
         ai_analysis_doc = await db.ai_analyses.find_one(
-            {"userId": user_id},
+            {"userId": str(current_user["_id"])},
             sort=[("createdAt", -1)]
         )
         
@@ -791,43 +745,85 @@ async def download_ai_certificate(current_user: dict = Depends(get_current_user)
                 detail="Belum ada hasil analisis AI. Silakan selesaikan test terlebih dahulu."
             )
         
-        ai_analysis = ai_analysis_doc.get("aiAnalysis", {})
-        if not ai_analysis:
-            ai_analysis = {
-                "personalityType": ai_analysis_doc.get("personalityType", ""),
-                "summary": ai_analysis_doc.get("summary", ""),
-                "strengths": ai_analysis_doc.get("strengths", []),
-                "areasToImprove": ai_analysis_doc.get("areasToImprove", []),
-                "careerRecommendations": ai_analysis_doc.get("careerRecommendations", []),
-                "tips": ai_analysis_doc.get("tips", [])
-            }
-        
-        # Get certificate template
-        template = await db.certificate_templates.find_one()
-        if not template:
-            template = {
-                "signerName": "Director NEWME CLASS",
-                "textColor": "#000000",
-                "accentColor": "#FFD700"
-            }
-        
-        # Generate PDF
-        pdf_buffer = generate_ai_certificate_pdf(current_user, ai_analysis, template)
+        template = await db.certificate_templates.find_one() or DEFAULT_AI_TEMPLATE
         
         filename = f"sertifikat_ai_{current_user.get('fullName', 'user').replace(' ', '_')}_{datetime.utcnow().strftime('%Y%m%d')}.pdf"
         
-        return StreamingResponse(
-            pdf_buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
+        return await send_certificate_pdf(
+            request,
+            ai_certificate_render_job(current_user, ai_analysis_doc, template),
+            filename
         )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+async def load_ai_certificate_render_status(user: dict) -> Optional[dict]:
+    user_id = str(user["_id"])
+    analysis = await db.ai_analyses.find_one(
+        {"userId": user_id},
+        {"renderStatus": 1, "renderRequestedAt": 1, "pdfUrl": 1, "renderedAt": 1, "renderError": 1},
+        sort=[("createdAt", -1)]
+    )
+    if analysis is None:
+        return None
+    if not analysis.get("renderStatus"):
+        # Analyses stored before the user paid were never pre-rendered
+        if not await has_paid_test(user):
+            return None
+        analysis["renderStatus"] = "pending"
+    if render_is_stale(analysis):
+        schedule_ai_certificate_prerender(analysis["_id"], user_id)
+    return render_status_view(analysis)
+
+@router.get("/ai-certificate/render-status", response_model=dict)
+async def get_ai_certificate_render_status(current_user: dict = Depends(get_current_user)):
+    """
+    Pre-render status of the current user's AI certificate (for polling)
+    """
+    try:
+        status = await load_ai_certificate_render_status(current_user)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Sertifikat belum tersedia")
+        return status
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+# The stream always belongs to the token's user, so the scope needs no id
+AI_CERTIFICATE_STREAM_SCOPE = "ai-certificate-render"
+
+@router.post("/ai-certificate/render-status/stream/token", response_model=dict)
+async def create_ai_certificate_stream_token(current_user: dict = Depends(get_current_user)):
+    """
+    Short-lived token for the AI certificate pre-render stream
+    """
+    return {
+        "token": create_stream_token(str(current_user["_id"]), AI_CERTIFICATE_STREAM_SCOPE),
+        "expiresIn": STREAM_TOKEN_TTL_SECONDS
+    }
+
+@router.get("/ai-certificate/render-status/stream")
+async def stream_ai_certificate_render_status(request: Request, token: Optional[str] = Query(None)):
+    """
+    Server-Sent Events for the AI certificate pre-render. EventSource cannot
+    send headers, so ?token= carries a stream token from
+    POST /ai-certificate/render-status/stream/token (never the login token)
+    """
+    current_user = await resolve_stream_token(token, AI_CERTIFICATE_STREAM_SCOPE)
+    return StreamingResponse(
+        status_event_stream(
+            request,
+            ai_certificate_render_topic(str(current_user["_id"])),
+            lambda: load_ai_certificate_render_status(current_user),
+            lambda status: status["renderStatus"] in FINAL_RENDER_STATUSES
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 @router.get("/check-eligibility")
 async def check_certificate_eligibility(current_user: dict = Depends(get_current_user)):
@@ -837,20 +833,10 @@ async def check_certificate_eligibility(current_user: dict = Depends(get_current
     try:
         user_id = str(current_user["_id"])
         
-        # Check payment from payments collection
-        payment = await db.payments.find_one({
-            "userId": user_id,
-            "status": "approved",
-            "type": {"$in": ["test", "paid_test", "premium_test"]}
-        })
-        
-        # Also check user's paymentStatus field
-        user_paid = current_user.get("paymentStatus") == "approved" or current_user.get("paidTestStatus") == "completed"
-        
-        has_paid = payment is not None or user_paid
+        has_paid = await has_paid_test(current_user)
         
         # Check AI analysis
-        ai_analysis = await db.ai_analyses.find_one({"userId": user_id})
+        ai_analysis = await db.ai_analyses.find_one({"userId": user_id}, sort=[("createdAt", -1)])
         has_analysis = ai_analysis is not None
         
         # Check free test usage
@@ -865,6 +851,7 @@ async def check_certificate_eligibility(current_user: dict = Depends(get_current
             "hasAnalysis": has_analysis,
             "hasUsedFreeTest": has_used_free_test,
             "canDownloadCertificate": has_paid and has_analysis,
+            "renderStatus": ai_analysis.get("renderStatus") if ai_analysis else None,
             "message": "Eligible to download certificate" if (has_paid and has_analysis) else "Upgrade ke Test Premium untuk download sertifikat"
         }
     except Exception as e:
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from typing import List, Optional
 from models.contact import ContactCreate, Contact, ContactResponse
 from database import get_db
+from utils.responses import MongoJSONResponse
 from datetime import datetime
 from bson import ObjectId
 
@@ -49,10 +50,7 @@ async def get_contacts(
         cursor = db.contacts.find(query).skip(skip).limit(limit).sort("submittedAt", -1)
         contacts = await cursor.to_list(length=limit)
         
-        for contact in contacts:
-            contact["_id"] = str(contact["_id"])
-        
-        return contacts
+        return MongoJSONResponse(contacts)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Terjadi kesalahan: {str(e)}")
 
@@ -69,8 +67,7 @@ async def get_contact(contact_id: str):
         if not contact:
             raise HTTPException(status_code=404, detail="Kontak tidak ditemukan")
         
-        contact["_id"] = str(contact["_id"])
-        return contact
+        return MongoJSONResponse(contact)
     except HTTPException:
         raise
     except Exception as e:
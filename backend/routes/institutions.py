@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from typing import List, Optional
 from models.institution import InstitutionInquiryCreate, InstitutionInquiry
 from database import get_db
+from utils.responses import MongoJSONResponse
 from datetime import datetime
 from bson import ObjectId
 
@@ -47,10 +48,7 @@ async def get_institutions(
         cursor = db.institutions.find(query).skip(skip).limit(limit).sort("createdAt", -1)
         institutions = await cursor.to_list(length=limit)
         
-        for inst in institutions:
-            inst["_id"] = str(inst["_id"])
-        
-        return institutions
+        return MongoJSONResponse(institutions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Terjadi kesalahan: {str(e)}")
 
@@ -67,8 +65,7 @@ async def get_institution(institution_id: str):
         if not institution:
             raise HTTPException(status_code=404, detail="Institution tidak ditemukan")
         
-        institution["_id"] = str(institution["_id"])
-        return institution
+        return MongoJSONResponse(institution)
     except HTTPException:
         raise
     except Exception as e:
@@ -1,21 +1,47 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query
 from typing import List, Optional
 from models.payment import Payment, PaymentApproval
 from database import get_db
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
+from utils.pagination import encode_cursor, decode_cursor, keyset_filter, merge_desc
+from utils.stats_counters import stats_counters
+from utils.blobs import blob_store
 from datetime import datetime
 from bson import ObjectId
 import os
-import uuid
 from pathlib import Path
 from routes.admin import verify_token
+from routes.auth import invalidate_user_cache
+from routes.user_payments import publish_payment_status
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 db = get_db()
 
+declare_indexes(
+    "payments",
+    IndexModel([("registrationId", ASCENDING)], name="registrationId_1"),
+    IndexModel([("userId", ASCENDING), ("status", ASCENDING)], name="userId_1_status_1"),
+    IndexModel([("uploadedAt", DESCENDING)], name="uploadedAt_-1"),
+    # Keyset pagination of the admin payments feed
+    IndexModel([("uploadedAt", DESCENDING), ("_id", DESCENDING)], name="uploadedAt_-1__id_-1"),
+    IndexModel([("status", ASCENDING), ("uploadedAt", DESCENDING), ("_id", DESCENDING)], name="status_1_uploadedAt_-1__id_-1"),
+)
+declare_indexes(
+    "payment_proofs",
+    IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt_-1__id_-1"),
+    IndexModel([("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="status_1_createdAt_-1__id_-1"),
+)
+
+stats_counters.register("payments", "payments", amount_field="paymentAmount", revenue_statuses=["approved"])
+
 # Upload directory
 UPLOAD_DIR = Path("/app/frontend/public/uploads/payments")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+blob_store.track("payments", "paymentProofUrl")
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
 def allowed_file(filename: str) -> bool:
@@ -55,12 +81,7 @@ async def upload_payment_proof(
         
         # Save file
         file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/payments", file_extension)
         
         # Create payment record
         payment_data = {
@@ -70,7 +91,7 @@ async def upload_payment_proof(
             "userEmail": registration["email"],
             "paymentAmount": paymentAmount,
             "paymentMethod": paymentMethod,
-            "paymentProofUrl": f"/uploads/payments/{unique_filename}",
+            "paymentProofUrl": stored.url,
             "status": "pending",
             "uploadedAt": datetime.utcnow(),
             "notes": notes
@@ -78,15 +99,25 @@ async def upload_payment_proof(
         
         # Update existing or create new
         if existing_payment:
-            await db.payments.update_one(
+            previous = await db.payments.find_one_and_update(
                 {"_id": existing_payment["_id"]},
                 {"$set": payment_data}
             )
+            if previous:
+                await stats_counters.record_transition(
+                    "payments", previous.get("status"), "pending", previous.get("paymentAmount", 0)
+                )
             payment_id = str(existing_payment["_id"])
         else:
             result = await db.payments.insert_one(payment_data)
+            await stats_counters.record_insert("payments", "pending", paymentAmount)
             payment_id = str(result.inserted_id)
         
+        await blob_store.refresh(
+            existing_payment.get("paymentProofUrl") if existing_payment else None,
+            stored.url
+        )
+        
         return {
             "success": True,
             "paymentId": payment_id,
@@ -97,67 +128,89 @@ async def upload_payment_proof(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+def normalize_payment_proof(payment: dict) -> dict:
+    return {
+        "_id": str(payment["_id"]),
+        "userId": payment.get("userId"),
+        "userName": payment.get("userName"),
+        "userEmail": payment.get("userEmail"),
+        "paymentAmount": payment.get("grossAmount", 0),
+        "paymentMethod": payment.get("paymentMethod", ""),
+        "paymentProofUrl": payment.get("proofUrl", ""),
+        "status": payment.get("status", "pending"),
+        "uploadedAt": payment.get("createdAt"),
+        "notes": payment.get("notes", ""),
+        "orderId": payment.get("orderId", "")
+    }
+
+def normalize_registration_payment(payment: dict) -> dict:
+    return {
+        "_id": str(payment["_id"]),
+        "userId": payment.get("userId"),
+        "userName": payment.get("userName"),
+        "userEmail": payment.get("userEmail"),
+        "paymentAmount": payment.get("paymentAmount", 0),
+        "paymentMethod": payment.get("paymentMethod", ""),
+        "paymentProofUrl": payment.get("paymentProofUrl", ""),
+        "status": payment.get("status", "pending"),
+        "uploadedAt": payment.get("uploadedAt"),
+        "notes": payment.get("notes", ""),
+        "registrationId": payment.get("registrationId", "")
+    }
+
+# (collection, timestamp field, normalizer) for each source of the admin feed
+PAYMENT_FEED_SOURCES = (
+    ("payment_proofs", "createdAt", normalize_payment_proof),
+    ("payments", "uploadedAt", normalize_registration_payment),
+)
+
+def feed_key(item: dict) -> tuple:
+    # datetime.min sorts a missing timestamp last, as MongoDB does; see keyset_filter()
+    return (item["uploadedAt"] or datetime.min, ObjectId(item["_id"]))
+
+async def feed_stream(collection: str, field: str, normalize, query: dict, fetch: int):
+    cursor = db[collection].find(query).sort([(field, -1), ("_id", -1)]).limit(fetch).batch_size(fetch)
+    async for payment in cursor:
+        yield normalize(payment)
+
 @router.get("", response_model=List[dict])
 async def get_payments(
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=200),
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
     token_data: dict = Depends(verify_token)
 ):
     """
     Get all payments (admin only)
+    Merges payment_proofs and payments newest first. Pass the X-Next-Cursor
+    response header back as `cursor` to get the next page; `skip` still
+    works but costs O(skip).
     """
     try:
-        query = {}
-        if status:
-            query["status"] = status
-        
-        # Check both payment_proofs and payments collections
-        cursor1 = db.payment_proofs.find(query).skip(skip).limit(limit).sort("createdAt", -1)
-        payments1 = await cursor1.to_list(length=limit)
-        
-        cursor2 = db.payments.find(query).skip(skip).limit(limit).sort("uploadedAt", -1)
-        payments2 = await cursor2.to_list(length=limit)
-        
-        # Combine and normalize data
-        all_payments = []
+        position = decode_cursor(cursor) if cursor else None
+        if position is not None:
+            skip = 0
+        fetch = skip + limit
         
-        # Process payment_proofs
-        for payment in payments1:
-            all_payments.append({
-                "_id": str(payment["_id"]),
-                "userId": payment.get("userId"),
-                "userName": payment.get("userName"),
-                "userEmail": payment.get("userEmail"),
-                "paymentAmount": payment.get("grossAmount", 0),
-                "paymentMethod": payment.get("paymentMethod", ""),
-                "paymentProofUrl": payment.get("proofUrl", ""),
-                "status": payment.get("status", "pending"),
-                "uploadedAt": payment.get("createdAt"),
-                "notes": payment.get("notes", ""),
-                "orderId": payment.get("orderId", "")
-            })
+        streams = []
+        for collection, field, normalize in PAYMENT_FEED_SOURCES:
+            query = keyset_filter(field, position)
+            if status:
+                query["status"] = status
+            streams.append(feed_stream(collection, field, normalize, query, fetch))
         
-        # Process payments
-        for payment in payments2:
-            all_payments.append({
-                "_id": str(payment["_id"]),
-                "userId": payment.get("userId"),
-                "userName": payment.get("userName"),
-                "userEmail": payment.get("userEmail"),
-                "paymentAmount": payment.get("paymentAmount", 0),
-                "paymentMethod": payment.get("paymentMethod", ""),
-                "paymentProofUrl": payment.get("paymentProofUrl", ""),
-                "status": payment.get("status", "pending"),
-                "uploadedAt": payment.get("uploadedAt"),
-                "notes": payment.get("notes", ""),
-                "registrationId": payment.get("registrationId", "")
-            })
+        merged = await merge_desc(streams, feed_key, fetch)
+        all_payments = merged[skip:]
         
-        # Sort by date
-        all_payments.sort(key=lambda x: x.get("uploadedAt", ""), reverse=True)
+        headers = {}
+        if len(all_payments) == limit:
+            last = all_payments[-1]
+            headers["X-Next-Cursor"] = encode_cursor(last["uploadedAt"], ObjectId(last["_id"]))
         
-        return all_payments
+        return MongoJSONResponse(all_payments, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -204,6 +257,8 @@ async def approve_payment(
                 {"_id": ObjectId(payment_id)},
                 {"$set": update_data}
             )
+            if payment.get("orderId"):
+                publish_payment_status(payment["orderId"], approval.status)
             
             # Update user status if approved
             if approval.status == "approved" and payment.get("userId"):
@@ -215,11 +270,16 @@ async def approve_payment(
                         "paymentDate": datetime.utcnow()
                     }}
                 )
+                invalidate_user_cache(payment["userId"])
         else:
-            await db.payments.update_one(
+            previous = await db.payments.find_one_and_update(
                 {"_id": ObjectId(payment_id)},
                 {"$set": update_data}
             )
+            if previous:
+                await stats_counters.record_transition(
+                    "payments", previous.get("status"), approval.status, previous.get("paymentAmount", 0)
+                )
             
             # Update registration status if approved
             if approval.status == "approved" and payment.get("registrationId"):
@@ -247,10 +307,7 @@ async def get_payment_by_registration(registration_id: str):
     """
     try:
         payment = await db.payments.find_one({"registrationId": registration_id})
-        if payment:
-            payment["_id"] = str(payment["_id"])
-            return payment
-        return None
+        return MongoJSONResponse(payment)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -258,27 +315,18 @@ async def get_payment_by_registration(registration_id: str):
 async def get_payment_stats(token_data: dict = Depends(verify_token)):
     """
     Get payment statistics
+    Read from stats_counters instead of counting the collection.
     """
     try:
-        total = await db.payments.count_documents({})
-        pending = await db.payments.count_documents({"status": "pending"})
-        approved = await db.payments.count_documents({"status": "approved"})
-        rejected = await db.payments.count_documents({"status": "rejected"})
-        
-        # Calculate total revenue
-        pipeline = [
-            {"$match": {"status": "approved"}},
-            {"$group": {"_id": None, "totalRevenue": {"$sum": "$paymentAmount"}}}
-        ]
-        revenue_result = await db.payments.aggregate(pipeline).to_list(1)
-        total_revenue = revenue_result[0]["totalRevenue"] if revenue_result else 0
+        counters = await stats_counters.get("payments")
+        by_status = counters.get("byStatus", {})
         
         return {
-            "total": total,
-            "pending": pending,
-            "approved": approved,
-            "rejected": rejected,
-            "totalRevenue": total_revenue
+            "total": counters.get("total", 0),
+            "pending": by_status.get("pending", 0),
+            "approved": by_status.get("approved", 0),
+            "rejected": by_status.get("rejected", 0),
+            "totalRevenue": counters.get("revenue", 0)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
\ No newline at end of file
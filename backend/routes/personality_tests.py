@@ -1,13 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import List, Optional
 from pydantic import BaseModel
 from database import get_db
+from pymongo import IndexModel, ASCENDING
+from utils.indexes import declare_indexes
 from routes.admin import verify_token
+from utils.etag import etag_response
 from datetime import datetime
 
 router = APIRouter(prefix="/api/personality-tests", tags=["personality-tests"])
 db = get_db()
 
+declare_indexes(
+    "questions",
+    IndexModel([("testType", ASCENDING), ("isPremium", ASCENDING), ("order", ASCENDING)], name="testType_1_isPremium_1_order_1"),
+)
+declare_indexes(
+    "personality_descriptions",
+    IndexModel([("personalityType", ASCENDING)], name="personalityType_1"),
+)
+
 # Pydantic Models
 class AnswerInput(BaseModel):
     questionId: str
@@ -25,6 +37,7 @@ class TestResultResponse(BaseModel):
 
 @router.get("/questions/{test_type}")
 async def get_test_questions(
+    request: Request,
     test_type: str,
     include_premium: bool = False
 ):
@@ -54,14 +67,14 @@ async def get_test_questions(
                 "isPremium": q["isPremium"]
             })
         
-        return {
+        return etag_response(request, {
             "success": True,
             "testType": test_type,
             "totalQuestions": len(formatted_questions),
             "freeQuestions": sum(1 for q in formatted_questions if not q["isPremium"]),
             "premiumQuestions": sum(1 for q in formatted_questions if q["isPremium"]),
             "questions": formatted_questions
-        }
+        })
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
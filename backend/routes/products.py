@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Form, Request
 from typing import List, Optional
 from models.product import Product, ProductCreate, ProductUpdate
 from database import get_db
 from datetime import datetime
 from bson import ObjectId
 from routes.admin import verify_token
-import uuid
+from utils.etag import etag_response
+from utils.blobs import blob_store
+from utils.images import image_pipeline
+from pymongo import ReturnDocument
 from pathlib import Path
 
 router = APIRouter(prefix="/api/products", tags=["products"])
@@ -15,8 +18,24 @@ db = get_db()
 UPLOAD_DIR = Path("/app/frontend/public/uploads/products")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+blob_store.track("products", "images")
+
+async def image_srcsets(images: List[str]) -> List[dict]:
+    """Srcsets of a product's images whose variants already exist, tagged with their url"""
+    srcsets = await image_pipeline.lookup(images)
+    return [{"url": url, **srcsets[url]} for url in images if url in srcsets]
+
+async def record_image_variants(url: str, srcset: dict):
+    await db.products.update_many(
+        {"images": url, "imageSrcsets.url": {"$ne": url}},
+        {"$push": {"imageSrcsets": {"url": url, **srcset}}}
+    )
+
+image_pipeline.on_ready(record_image_variants)
+
 @router.get("", response_model=List[dict])
 async def get_products(
+    request: Request,
     skip: int = 0,
     limit: int = 50,
     category: Optional[str] = None,
@@ -35,15 +54,12 @@ async def get_products(
         cursor = db.products.find(query).skip(skip).limit(limit).sort("createdAt", -1)
         products = await cursor.to_list(length=limit)
         
-        for product in products:
-            product["_id"] = str(product["_id"])
-        
-        return products
+        return etag_response(request, products)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @router.get("/{product_id}", response_model=dict)
-async def get_product(product_id: str):
+async def get_product(request: Request, product_id: str):
     """
     Get product by ID
     """
@@ -55,8 +71,7 @@ async def get_product(product_id: str):
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        product["_id"] = str(product["_id"])
-        return product
+        return etag_response(request, product)
     except HTTPException:
         raise
     except Exception as e:
@@ -75,8 +90,10 @@ async def create_product(
         product_data["createdAt"] = datetime.utcnow()
         product_data["updatedAt"] = datetime.utcnow()
         product_data["createdBy"] = token_data["sub"]
+        product_data["imageSrcsets"] = await image_srcsets(product_data["images"])
         
         result = await db.products.insert_one(product_data)
+        await blob_store.refresh(*product_data["images"])
         
         return {
             "success": True,
@@ -101,15 +118,22 @@ async def update_product(
         
         update_data = {k: v for k, v in updates.dict().items() if v is not None}
         update_data["updatedAt"] = datetime.utcnow()
+        if "images" in update_data:
+            update_data["imageSrcsets"] = await image_srcsets(update_data["images"])
         
-        result = await db.products.update_one(
+        previous = await db.products.find_one_and_update(
             {"_id": ObjectId(product_id)},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"images": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="Product not found")
         
+        if "images" in update_data:
+            await blob_store.refresh(*previous.get("images", []), *update_data["images"])
+        
         return {"success": True, "message": "Product updated successfully"}
     except HTTPException:
         raise
@@ -128,11 +152,13 @@ async def delete_product(
         if not ObjectId.is_valid(product_id):
             raise HTTPException(status_code=400, detail="Invalid product ID")
         
-        result = await db.products.delete_one({"_id": ObjectId(product_id)})
+        product = await db.products.find_one_and_delete({"_id": ObjectId(product_id)}, projection={"images": 1})
         
-        if result.deleted_count == 0:
+        if product is None:
             raise HTTPException(status_code=404, detail="Product not found")
         
+        await blob_store.refresh(*product.get("images", []))
+        
         return {"success": True, "message": "Product deleted successfully"}
     except HTTPException:
         raise
@@ -154,16 +180,13 @@ async def upload_product_image(
         if file_extension not in allowed_extensions:
             raise HTTPException(status_code=400, detail="File type not allowed")
         
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/products", file_extension)
+        image_url = stored.url
+        image_pipeline.schedule(stored.path, image_url)
         
         return {
             "success": True,
-            "url": f"/uploads/products/{unique_filename}",
+            "url": image_url,
             "message": "Image uploaded successfully"
         }
     except HTTPException:
@@ -1,17 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import List, Optional
 from models.question import Question, QuestionCreate, QuestionUpdate, Banner
 from database import get_db
+from pymongo import IndexModel, ASCENDING
+from utils.indexes import declare_indexes
 from datetime import datetime
 from bson import ObjectId
 from routes.admin import verify_token
+from utils.etag import etag_response
 
 router = APIRouter(prefix="/api/questions", tags=["questions"])
 db = get_db()
 
+declare_indexes(
+    "questions",
+    IndexModel([("order", ASCENDING)], name="order_1"),
+)
+
 # Questions Endpoints
 @router.get("", response_model=List[dict])
 async def get_questions(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
@@ -45,19 +54,18 @@ async def get_questions(
         
         # Convert and add testType field for frontend compatibility
         for question in questions:
-            question["_id"] = str(question["_id"])
             # Add testType field based on isFree
             question["testType"] = "free" if question.get("isFree", False) else "paid"
             # Ensure text field exists (frontend uses 'text', seed uses 'question')
             if "question" in question and "text" not in question:
                 question["text"] = question["question"]
         
-        return questions
+        return etag_response(request, questions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @router.get("/{question_id}", response_model=dict)
-async def get_question(question_id: str):
+async def get_question(request: Request, question_id: str):
     """
     Get question by ID
     """
@@ -69,8 +77,7 @@ async def get_question(question_id: str):
         if not question:
             raise HTTPException(status_code=404, detail="Question not found")
         
-        question["_id"] = str(question["_id"])
-        return question
+        return etag_response(request, question)
     except HTTPException:
         raise
     except Exception as e:
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
 from typing import List, Optional
 from database import get_db
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
 from datetime import datetime
 from bson import ObjectId
 from routes.admin import verify_token
@@ -12,6 +15,12 @@ from pathlib import Path
 router = APIRouter(prefix="/api/referrals", tags=["referrals"])
 db = get_db()
 
+declare_indexes(
+    "referral_transactions",
+    IndexModel([("referrerId", ASCENDING), ("referredId", ASCENDING)], name="referrerId_1_referredId_1"),
+    IndexModel([("createdAt", DESCENDING)], name="createdAt_-1"),
+)
+
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
@@ -41,9 +50,7 @@ async def get_referral_settings():
             await db.referral_settings.insert_one(default_settings)
             settings = default_settings
         
-        if "_id" in settings:
-            settings["_id"] = str(settings["_id"])
-        return settings
+        return MongoJSONResponse(settings)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -105,10 +112,8 @@ async def get_referral_leaderboard(
         ).sort("referralCount", -1).limit(limit)
         
         users = await cursor.to_list(length=limit)
-        for user in users:
-            user["_id"] = str(user["_id"])
         
-        return users
+        return MongoJSONResponse(users)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -131,7 +136,6 @@ async def get_referral_transactions(
         transactions = await cursor.to_list(length=limit)
         
         for tx in transactions:
-            tx["_id"] = str(tx["_id"])
             # Get referrer info
             if tx.get("referrerId"):
                 referrer = await db.users.find_one({"_id": ObjectId(tx["referrerId"])})
@@ -145,7 +149,7 @@ async def get_referral_transactions(
                     tx["referredName"] = referred.get("fullName")
                     tx["referredEmail"] = referred.get("email")
         
-        return transactions
+        return MongoJSONResponse(transactions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Request
 from typing import List, Optional
 from models.registration import RegistrationCreate, Registration, RegistrationResponse
 from database import get_db
+from utils.responses import MongoJSONResponse
 from datetime import datetime
 from bson import ObjectId
 
@@ -61,11 +62,7 @@ async def get_registrations(
         cursor = db.registrations.find(query).skip(skip).limit(limit).sort("registrationDate", -1)
         registrations = await cursor.to_list(length=limit)
         
-        # Convert ObjectId to string
-        for reg in registrations:
-            reg["_id"] = str(reg["_id"])
-        
-        return registrations
+        return MongoJSONResponse(registrations)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Terjadi kesalahan: {str(e)}")
 
@@ -82,8 +79,7 @@ async def get_registration(registration_id: str):
         if not registration:
             raise HTTPException(status_code=404, detail="Pendaftaran tidak ditemukan")
         
-        registration["_id"] = str(registration["_id"])
-        return registration
+        return MongoJSONResponse(registration)
     except HTTPException:
         raise
     except Exception as e:
@@ -1,39 +1,50 @@
 from fastapi import APIRouter, HTTPException, Depends, Form
 from typing import List, Optional
 from database import get_db
+from utils.responses import MongoJSONResponse
 from datetime import datetime
 from bson import ObjectId
 from routes.admin import verify_token
+from utils.cache import public_cache
 
 router = APIRouter(prefix="/api/running-info", tags=["running-info"])
 db = get_db()
 
+CACHE_PREFIX = "running-info:"
+# Entries have start/end dates, so the public list must not be served stale for long
+CACHE_TTL = 60
+
+async def load_running_info(isActive: Optional[bool] = None) -> List[dict]:
+    query = {}
+    if isActive is not None:
+        query["isActive"] = isActive
+    
+    # Filter by date range if set
+    now = datetime.utcnow()
+    query["$or"] = [
+        {"startDate": None, "endDate": None},
+        {"startDate": {"$lte": now}, "endDate": None},
+        {"startDate": None, "endDate": {"$gte": now}},
+        {"startDate": {"$lte": now}, "endDate": {"$gte": now}}
+    ]
+    
+    cursor = db.running_info.find(query).sort("priority", -1)
+    return await cursor.to_list(100)
+
+async def get_cached_running_info(isActive: Optional[bool] = None) -> List[dict]:
+    return await public_cache.get_or_load(
+        f"{CACHE_PREFIX}{isActive}",
+        lambda: load_running_info(isActive),
+        ttl=CACHE_TTL
+    )
+
 @router.get("", response_model=List[dict])
 async def get_running_info(isActive: Optional[bool] = None):
     """
     Get running info/marquee messages (public)
     """
     try:
-        query = {}
-        if isActive is not None:
-            query["isActive"] = isActive
-        
-        # Filter by date range if set
-        now = datetime.utcnow()
-        query["$or"] = [
-            {"startDate": None, "endDate": None},
-            {"startDate": {"$lte": now}, "endDate": None},
-            {"startDate": None, "endDate": {"$gte": now}},
-            {"startDate": {"$lte": now}, "endDate": {"$gte": now}}
-        ]
-        
-        cursor = db.running_info.find(query).sort("priority", -1)
-        infos = await cursor.to_list(100)
-        
-        for info in infos:
-            info["_id"] = str(info["_id"])
-        
-        return infos
+        return MongoJSONResponse(await get_cached_running_info(isActive))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -46,10 +57,7 @@ async def get_all_running_info(token_data: dict = Depends(verify_token)):
         cursor = db.running_info.find({}).sort("priority", -1)
         infos = await cursor.to_list(100)
         
-        for info in infos:
-            info["_id"] = str(info["_id"])
-        
-        return infos
+        return MongoJSONResponse(infos)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -87,6 +95,7 @@ async def create_running_info(
             info_doc["endDate"] = datetime.fromisoformat(endDate.replace('Z', '+00:00'))
         
         result = await db.running_info.insert_one(info_doc)
+        public_cache.invalidate_prefix(CACHE_PREFIX)
         
         return {
             "success": True,
@@ -146,6 +155,7 @@ async def update_running_info(
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Informasi tidak ditemukan")
         
+        public_cache.invalidate_prefix(CACHE_PREFIX)
         return {"success": True, "message": "Informasi berhasil diupdate"}
     except HTTPException:
         raise
@@ -169,6 +179,7 @@ async def delete_running_info(
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Informasi tidak ditemukan")
         
+        public_cache.invalidate_prefix(CACHE_PREFIX)
         return {"success": True, "message": "Informasi berhasil dihapus"}
     except HTTPException:
         raise
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from typing import List
 from models.settings import SiteSettings, SettingsUpdate
 from database import get_db
+from utils.responses import MongoJSONResponse
 from datetime import datetime
-from bson import ObjectId
 from routes.admin import verify_token
+from utils.cache import public_cache
+from utils.blobs import blob_store
+from utils.images import image_pipeline
 import os
-import uuid
 from pathlib import Path
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
@@ -15,26 +18,66 @@ db = get_db()
 UPLOAD_DIR = Path("/app/frontend/public/uploads/site")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-def serialize_settings(settings: dict) -> dict:
-    """Convert MongoDB document to JSON-serializable dict"""
+CACHE_KEY = "settings"
+
+ASSET_FIELDS = ("logoUrl", "faviconUrl", "certificateTemplateUrl", "certificateSignatureUrl", "qrisImageUrl")
+
+# Lists of people whose "photo" comes from /upload/team
+PEOPLE_FIELDS = ("boardOfDirectors", "teamSupport", "partners")
+
+blob_store.track(
+    "settings", *ASSET_FIELDS, "banners.url", *(f"{field}.photo" for field in PEOPLE_FIELDS)
+)
+
+def upload_urls(settings: dict) -> List[str]:
+    """Every upload URL referenced by a settings document (or a partial update)"""
+    urls = [settings.get(field) for field in ASSET_FIELDS]
+    urls += [banner.get("url") for banner in settings.get("banners") or []]
+    for field in PEOPLE_FIELDS:
+        urls += [person.get("photo") for person in settings.get(field) or []]
+    return [url for url in urls if url]
+
+async def load_settings() -> dict:
+    settings = await db.settings.find_one()
     if not settings:
-        return {}
-    result = {}
-    for key, value in settings.items():
-        if isinstance(value, ObjectId):
-            result[key] = str(value)
-        elif isinstance(value, datetime):
-            result[key] = value.isoformat()
-        elif isinstance(value, list):
-            result[key] = [
-                serialize_settings(item) if isinstance(item, dict) else item
-                for item in value
-            ]
-        elif isinstance(value, dict):
-            result[key] = serialize_settings(value)
-        else:
-            result[key] = value
-    return result
+        # Create default settings without _id field
+        default_settings = {
+            "siteName": "NEWME CLASS",
+            "siteTitle": "NEWME CLASS - Kelas Peduli Talenta",
+            "siteDescription": "Platform pengembangan talenta dan potensi diri",
+            "logoUrl": None,
+            "faviconUrl": None,
+            "email": "newmeclass@gmail.com",
+            "phone": "0895.0267.1691",
+            "whatsapp": "6289502671691",
+            "address": "Jl. Puskesmas I - Komp. Golden Seroja - A1",
+            "instagram": "@newmeclass",
+            "primaryColor": "#FFD700",
+            "secondaryColor": "#1a1a1a",
+            "accentColor": "#2a2a2a",
+            "backgroundColor": "#1a1a1a",
+            "textColor": "#ffffff",
+            "banners": [],
+            "seoKeywords": None,
+            "seoMetaDescription": None,
+            "googleAnalyticsId": None,
+            "facebookPixelId": None,
+            "maintenanceMode": False,
+            "maintenanceMessage": None,
+            "allowRegistration": True,
+            "requirePayment": True,
+            "paymentAmount": 50000.0,
+            "certificateTemplateUrl": None,
+            "certificateSignatureUrl": None,
+            "updatedAt": datetime.utcnow()
+        }
+        result = await db.settings.insert_one(default_settings)
+        settings = await db.settings.find_one({"_id": result.inserted_id})
+    
+    return settings
+
+async def get_cached_settings() -> dict:
+    return await public_cache.get_or_load(CACHE_KEY, load_settings)
 
 @router.get("", response_model=dict)
 async def get_settings():
@@ -42,43 +85,7 @@ async def get_settings():
     Get site settings (public)
     """
     try:
-        settings = await db.settings.find_one()
-        if not settings:
-            # Create default settings without _id field
-            default_settings = {
-                "siteName": "NEWME CLASS",
-                "siteTitle": "NEWME CLASS - Kelas Peduli Talenta",
-                "siteDescription": "Platform pengembangan talenta dan potensi diri",
-                "logoUrl": None,
-                "faviconUrl": None,
-                "email": "newmeclass@gmail.com",
-                "phone": "0895.0267.1691",
-                "whatsapp": "6289502671691",
-                "address": "Jl. Puskesmas I - Komp. Golden Seroja - A1",
-                "instagram": "@newmeclass",
-                "primaryColor": "#FFD700",
-                "secondaryColor": "#1a1a1a",
-                "accentColor": "#2a2a2a",
-                "backgroundColor": "#1a1a1a",
-                "textColor": "#ffffff",
-                "banners": [],
-                "seoKeywords": None,
-                "seoMetaDescription": None,
-                "googleAnalyticsId": None,
-                "facebookPixelId": None,
-                "maintenanceMode": False,
-                "maintenanceMessage": None,
-                "allowRegistration": True,
-                "requirePayment": True,
-                "paymentAmount": 50000.0,
-                "certificateTemplateUrl": None,
-                "certificateSignatureUrl": None,
-                "updatedAt": datetime.utcnow()
-            }
-            result = await db.settings.insert_one(default_settings)
-            settings = await db.settings.find_one({"_id": result.inserted_id})
-        
-        return serialize_settings(settings)
+        return MongoJSONResponse(await get_cached_settings())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -98,11 +105,20 @@ async def update_settings(
         update_data = {k: v for k, v in updates.dict().items() if v is not None}
         update_data["updatedAt"] = datetime.utcnow()
         update_data["updatedBy"] = token_data["sub"]
+        people = [person for field in PEOPLE_FIELDS for person in update_data.get(field) or []]
+        if people:
+            srcsets = await image_pipeline.lookup(person.get("photo") for person in people)
+            for person in people:
+                person["photoSrcset"] = srcsets.get(person.get("photo"))
         
         await db.settings.update_one(
             {"_id": settings["_id"]},
             {"$set": update_data}
         )
+        public_cache.invalidate(CACHE_KEY)
+        
+        replaced = {field: settings.get(field) for field in update_data}
+        await blob_store.refresh(*upload_urls(replaced), *upload_urls(update_data))
         
         return {"success": True, "message": "Settings updated successfully"}
     except HTTPException:
@@ -110,6 +126,22 @@ async def update_settings(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+async def record_team_photo_variants(url: str, srcset: dict):
+    if not url.startswith("/uploads/team/"):
+        return
+    modified = 0
+    for field in PEOPLE_FIELDS:
+        result = await db.settings.update_many(
+            {f"{field}.photo": url},
+            {"$set": {f"{field}.$[person].photoSrcset": srcset}},
+            array_filters=[{"person.photo": url}]
+        )
+        modified += result.modified_count
+    if modified:
+        public_cache.invalidate(CACHE_KEY)
+
+image_pipeline.on_ready(record_team_photo_variants)
+
 @router.post("/upload/team", response_model=dict)
 async def upload_team_photo(
     file: UploadFile = File(...),
@@ -125,16 +157,14 @@ async def upload_team_photo(
         
         # Save file
         file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'png'
-        unique_filename = f"team_{uuid.uuid4()}.{file_extension}"
-        file_path = team_upload_dir / unique_filename
+        stored = await blob_store.save(file, team_upload_dir, "/uploads/team", file_extension)
         
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
-        
-        file_url = f"/uploads/team/{unique_filename}"
+        file_url = stored.url
+        image_pipeline.schedule(stored.path, file_url)
         
         return {"success": True, "url": file_url, "message": "Team photo uploaded successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -154,14 +184,9 @@ async def upload_asset(
         
         # Save file
         file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'png'
-        unique_filename = f"{asset_type}_{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/site", file_extension)
         
-        file_url = f"/uploads/site/{unique_filename}"
+        file_url = stored.url
         
         # Update settings based on asset type
         settings = await db.settings.find_one()
@@ -187,6 +212,8 @@ async def upload_asset(
                         "order": 0
                     }}}
                 )
+                public_cache.invalidate(CACHE_KEY)
+                await blob_store.refresh(file_url)
                 return {"success": True, "url": file_url, "message": "Banner uploaded"}
             
             if update_field:
@@ -194,6 +221,9 @@ async def upload_asset(
                     {"_id": settings["_id"]},
                     {"$set": update_field}
                 )
+                replaced = {field: settings.get(field) for field in update_field}
+                await blob_store.refresh(*upload_urls(replaced), file_url)
+                public_cache.invalidate(CACHE_KEY)
         
         return {"success": True, "url": file_url, "message": f"{asset_type} uploaded successfully"}
     except HTTPException:
@@ -218,12 +248,14 @@ async def delete_banner(
         if index < 0 or index >= len(banners):
             raise HTTPException(status_code=400, detail="Invalid banner index")
         
-        banners.pop(index)
+        removed = banners.pop(index)
         
         await db.settings.update_one(
             {"_id": settings["_id"]},
             {"$set": {"banners": banners}}
         )
+        public_cache.invalidate(CACHE_KEY)
+        await blob_store.refresh(removed.get("url"))
         
         return {"success": True, "message": "Banner deleted successfully"}
     except HTTPException:
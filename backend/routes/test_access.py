@@ -2,12 +2,19 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
 from pydantic import BaseModel
 from database import get_db
+from pymongo import IndexModel, ASCENDING
+from utils.indexes import declare_indexes
 from routes.admin import verify_token
 from datetime import datetime
 
 router = APIRouter(prefix="/api/test-access", tags=["test-access"])
 db = get_db()
 
+declare_indexes(
+    "test_results",
+    IndexModel([("userEmail", ASCENDING), ("testType", ASCENDING)], name="userEmail_1_testType_1"),
+)
+
 class TestAccessResponse(BaseModel):
     canTakeFreeTest: bool
     hasTakenFreeTest: bool
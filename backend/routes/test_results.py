@@ -2,6 +2,9 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional, Dict
 from pydantic import BaseModel
 from database import get_db
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
 from routes.auth import get_current_user
 from datetime import datetime
 from bson import ObjectId
@@ -9,6 +12,11 @@ from bson import ObjectId
 router = APIRouter(prefix="/api/test-results", tags=["test-results"])
 db = get_db()
 
+declare_indexes(
+    "test_results",
+    IndexModel([("userId", ASCENDING), ("completedAt", DESCENDING)], name="userId_1_completedAt_-1"),
+)
+
 
 class TestResultSubmission(BaseModel):
     userId: str
@@ -215,8 +223,7 @@ async def get_test_result(result_id: str):
         if not result:
             raise HTTPException(status_code=404, detail="Result not found")
         
-        result["_id"] = str(result["_id"])
-        return result
+        return MongoJSONResponse(result)
     except HTTPException:
         raise
     except Exception as e:
@@ -230,14 +237,11 @@ async def get_user_test_results(user_id: str, limit: int = 10):
         cursor = db.test_results.find({"userId": user_id}).sort("completedAt", -1).limit(limit)
         results = await cursor.to_list(length=limit)
         
-        for r in results:
-            r["_id"] = str(r["_id"])
-        
-        return {
+        return MongoJSONResponse({
             "success": True,
             "count": len(results),
             "results": results
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -255,8 +259,7 @@ async def get_latest_result(user_id: str, test_type: Optional[str] = None):
         if not result:
             raise HTTPException(status_code=404, detail="No test results found")
         
-        result["_id"] = str(result["_id"])
-        return result
+        return MongoJSONResponse(result)
     except HTTPException:
         raise
     except Exception as e:
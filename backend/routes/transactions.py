@@ -2,9 +2,16 @@ from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
 from typing import List, Optional
 from database import get_db
-from datetime import datetime
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
+from datetime import datetime, timedelta
 from bson import ObjectId
 from routes.admin import verify_token
+from utils.midtrans import get_midtrans_service
+from utils.webhook_inbox import webhook_inbox
+from utils.reconciler import payment_reconciler
+from utils.stats_counters import stats_counters
 import os
 import uuid
 import hashlib
@@ -15,23 +22,22 @@ router = APIRouter(prefix="/api/transactions", tags=["transactions"])
 db = get_db()
 logger = logging.getLogger(__name__)
 
+declare_indexes(
+    "transactions",
+    IndexModel([("order_id", ASCENDING)], name="order_id_1"),
+    IndexModel([("created_at", DESCENDING)], name="created_at_-1"),
+)
+
 # Midtrans Configuration - Keys will be filled by user
 MIDTRANS_SERVER_KEY = os.environ.get("MIDTRANS_SERVER_KEY", "")
 MIDTRANS_CLIENT_KEY = os.environ.get("MIDTRANS_CLIENT_KEY", "")
 MIDTRANS_IS_PRODUCTION = os.environ.get("MIDTRANS_IS_PRODUCTION", "False") == "True"
 
-# Initialize Midtrans only if keys are provided
-snap = None
-if MIDTRANS_SERVER_KEY:
-    try:
-        import midtransclient
-        snap = midtransclient.Snap(
-            is_production=MIDTRANS_IS_PRODUCTION,
-            server_key=MIDTRANS_SERVER_KEY,
-            client_key=MIDTRANS_CLIENT_KEY
-        )
-    except Exception as e:
-        logger.warning(f"Midtrans not initialized: {str(e)}")
+midtrans = get_midtrans_service()
+
+WEBHOOK_SOURCE = "transactions"
+
+stats_counters.register("transactions", "transactions", amount_field="gross_amount", revenue_statuses=["settlement"])
 
 # Pydantic Models
 class ItemDetails(BaseModel):
@@ -63,7 +69,7 @@ async def create_transaction(request: TransactionRequest):
     Create a new transaction with Midtrans
     """
     try:
-        if not snap:
+        if not midtrans.is_configured:
             raise HTTPException(
                 status_code=503,
                 detail="Payment service not configured. Please add Midtrans API keys."
@@ -106,7 +112,7 @@ async def create_transaction(request: TransactionRequest):
         }
         
         # Call Midtrans API to create transaction
-        transaction = snap.create_transaction(param)
+        transaction = await midtrans.create_snap_transaction(param)
         
         # Store transaction record in MongoDB
         transaction_record = {
@@ -123,6 +129,7 @@ async def create_transaction(request: TransactionRequest):
         }
         
         await db.transactions.insert_one(transaction_record)
+        await stats_counters.record_insert("transactions", "pending", request.gross_amount)
         
         return {
             "success": True,
@@ -140,41 +147,15 @@ async def create_transaction(request: TransactionRequest):
 @router.get("/{order_id}/status", response_model=dict)
 async def get_transaction_status(order_id: str):
     """
-    Get transaction status
+    Get transaction status.
+    Answered from the database; webhooks and the payment reconciler keep it current.
     """
     try:
-        # Get from local database first
         transaction = await db.transactions.find_one({"order_id": order_id})
         
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
-        # If Midtrans is configured, get real-time status
-        if snap:
-            try:
-                status_response = snap.transactions.status(order_id)
-                
-                # Update local record
-                await db.transactions.update_one(
-                    {"order_id": order_id},
-                    {
-                        "$set": {
-                            "status": status_response.get('transaction_status'),
-                            "payment_type": status_response.get('payment_type'),
-                            "updated_at": datetime.utcnow()
-                        }
-                    }
-                )
-                
-                return {
-                    "order_id": order_id,
-                    "status": status_response.get('transaction_status'),
-                    "payment_type": status_response.get('payment_type'),
-                    "gross_amount": transaction.get('gross_amount')
-                }
-            except Exception as e:
-                logger.warning(f"Could not get Midtrans status: {str(e)}")
-        
         return {
             "order_id": order_id,
             "status": transaction.get('status'),
@@ -187,64 +168,106 @@ async def get_transaction_status(order_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+# Midtrans statuses an order never leaves
+FINAL_TRANSACTION_STATUSES = ["settlement", "expire", "cancel", "deny", "failure"]
+
+async def apply_transaction_notification(notification: dict):
+    """
+    Inbox handler: apply a Midtrans notification to the transaction.
+    Stock is only decremented on the first transition to settlement,
+    so redelivered notifications do not sell the same items twice.
+    Orders in a final status are left alone: a "pending" the reconciler
+    fetched just before the settlement webhook must not reopen them.
+    """
+    order_id = notification.get('order_id')
+    transaction_status = notification.get('transaction_status')
+    fraud_status = notification.get('fraud_status', 'accept')
+    payment_type = notification.get('payment_type')
+    
+    # Update transaction in MongoDB
+    update_data = {
+        "status": transaction_status,
+        "payment_type": payment_type,
+        "fraud_status": fraud_status,
+        "updated_at": datetime.utcnow(),
+        "webhook_data": notification
+    }
+    
+    # Handle different statuses
+    if transaction_status == 'settlement':
+        update_data["settled_at"] = datetime.utcnow()
+    elif transaction_status == 'expire':
+        update_data["expired_at"] = datetime.utcnow()
+    
+    previous = await db.transactions.find_one_and_update(
+        {"order_id": order_id, "status": {"$nin": FINAL_TRANSACTION_STATUSES}},
+        {"$set": update_data}
+    )
+    
+    if previous:
+        await stats_counters.record_transition(
+            "transactions", previous.get("status"), transaction_status, previous.get("gross_amount", 0)
+        )
+    
+    if transaction_status == 'settlement' and previous and previous.get("status") != "settlement":
+        # Grant access to purchased items
+        await handle_successful_payment(previous)
+
+async def process_transaction_notification(notification: dict):
+    """Inbox handler: verify the notification with Midtrans, then apply it"""
+    await apply_transaction_notification(await midtrans.notification(notification))
+
+webhook_inbox.register(WEBHOOK_SOURCE, process_transaction_notification)
+payment_reconciler.register(
+    WEBHOOK_SOURCE,
+    "transactions",
+    apply_transaction_notification,
+    order_field="order_id",
+    created_field="created_at",
+    max_age=timedelta(hours=25)
+)
+
 @router.post("/webhook")
 async def handle_midtrans_webhook(request: Request):
     """
-    Handle Midtrans payment notification webhook
+    Handle Midtrans payment notification webhook.
+    Stores the notification in the webhook inbox and acknowledges it;
+    the inbox consumer applies it in the background.
     """
     try:
         body = await request.body()
         notification = json.loads(body.decode('utf-8'))
         
         order_id = notification.get('order_id')
-        transaction_status = notification.get('transaction_status')
-        fraud_status = notification.get('fraud_status', 'accept')
-        payment_type = notification.get('payment_type')
+        if not midtrans.verify_signature(notification):
+            logger.warning(f"Webhook for order {order_id} rejected: invalid signature")
+            raise HTTPException(status_code=403, detail="Invalid signature")
+        accepted = await webhook_inbox.accept(WEBHOOK_SOURCE, notification)
         
-        logger.info(f"Webhook received for order {order_id}: {transaction_status}")
-        
-        # Update transaction in MongoDB
-        update_data = {
-            "status": transaction_status,
-            "payment_type": payment_type,
-            "fraud_status": fraud_status,
-            "updated_at": datetime.utcnow(),
-            "webhook_data": notification
-        }
-        
-        # Handle different statuses
-        if transaction_status == 'settlement':
-            update_data["settled_at"] = datetime.utcnow()
-            # Grant access to purchased items
-            await handle_successful_payment(order_id)
-        elif transaction_status == 'expire':
-            update_data["expired_at"] = datetime.utcnow()
-        
-        await db.transactions.update_one(
-            {"order_id": order_id},
-            {"$set": update_data}
+        logger.info(
+            f"Webhook received for order {order_id}: {notification.get('transaction_status')}"
+            f"{'' if accepted else ' (duplicate)'}"
         )
-        
         return {"status": "ok"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Webhook processing failed: {str(e)}")
 
-async def handle_successful_payment(order_id: str):
+async def handle_successful_payment(transaction: dict):
     """
     Handle successful payment - update product stock, etc.
     """
     try:
-        transaction = await db.transactions.find_one({"order_id": order_id})
-        if transaction:
-            # Update product stock for each item
-            for item in transaction.get('items', []):
-                await db.products.update_one(
-                    {"_id": ObjectId(item['id'])},
-                    {"$inc": {"stock": -item['quantity']}}
-                )
-            logger.info(f"Processed successful payment for order: {order_id}")
+        # Update product stock for each item
+        for item in transaction.get('items', []):
+            await db.products.update_one(
+                {"_id": ObjectId(item['id'])},
+                {"$inc": {"stock": -item['quantity']}}
+            )
+        logger.info(f"Processed successful payment for order: {transaction.get('order_id')}")
     except Exception as e:
         logger.error(f"Error processing payment: {str(e)}")
 
@@ -266,10 +289,7 @@ async def get_transactions(
         cursor = db.transactions.find(query).skip(skip).limit(limit).sort("created_at", -1)
         transactions = await cursor.to_list(length=limit)
         
-        for txn in transactions:
-            txn["_id"] = str(txn["_id"])
-        
-        return transactions
+        return MongoJSONResponse(transactions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -277,27 +297,18 @@ async def get_transactions(
 async def get_transaction_stats(token_data: dict = Depends(verify_token)):
     """
     Get transaction statistics (admin only)
+    Read from stats_counters instead of counting the collection.
     """
     try:
-        total = await db.transactions.count_documents({})
-        pending = await db.transactions.count_documents({"status": "pending"})
-        settlement = await db.transactions.count_documents({"status": "settlement"})
-        expired = await db.transactions.count_documents({"status": "expire"})
-        
-        # Calculate total revenue
-        pipeline = [
-            {"$match": {"status": "settlement"}},
-            {"$group": {"_id": None, "totalRevenue": {"$sum": "$gross_amount"}}}
-        ]
-        revenue_result = await db.transactions.aggregate(pipeline).to_list(1)
-        total_revenue = revenue_result[0]["totalRevenue"] if revenue_result else 0
+        counters = await stats_counters.get("transactions")
+        by_status = counters.get("byStatus", {})
         
         return {
-            "total": total,
-            "pending": pending,
-            "settlement": settlement,
-            "expired": expired,
-            "totalRevenue": total_revenue
+            "total": counters.get("total", 0),
+            "pending": by_status.get("pending", 0),
+            "settlement": by_status.get("settlement", 0),
+            "expired": by_status.get("expire", 0),
+            "totalRevenue": counters.get("revenue", 0)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -1,9 +1,20 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from database import get_db
-from datetime import datetime
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ReturnDocument, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
+from datetime import datetime, timedelta
 from bson import ObjectId
-from routes.auth import get_current_user
+from routes.auth import (
+    get_current_user, create_stream_token, resolve_stream_token, invalidate_user_cache, STREAM_TOKEN_TTL_SECONDS
+)
+from utils.midtrans import get_midtrans_service
+from utils.webhook_inbox import webhook_inbox
+from utils.reconciler import payment_reconciler
+from utils.pubsub import pubsub, status_event_stream
+from utils.blobs import blob_store
 import uuid
 import os
 import logging
@@ -13,34 +24,33 @@ router = APIRouter(prefix="/api/user-payments", tags=["user-payments"])
 db = get_db()
 logger = logging.getLogger(__name__)
 
+declare_indexes(
+    "payment_proofs",
+    IndexModel([("orderId", ASCENDING)], name="orderId_1"),
+    IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)], name="userId_1_createdAt_-1"),
+)
+
 # Upload directory
 UPLOAD_DIR = Path("/app/frontend/public/uploads/payments")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+blob_store.track("payment_proofs", "proofUrl")
+blob_store.track("users", "paymentProofUrl")
+
 # Midtrans Configuration
-MIDTRANS_SERVER_KEY = os.environ.get("MIDTRANS_SERVER_KEY", "")
 MIDTRANS_CLIENT_KEY = os.environ.get("MIDTRANS_CLIENT_KEY", "")
-MIDTRANS_IS_PRODUCTION = os.environ.get("MIDTRANS_IS_PRODUCTION", "False") == "True"
 
-# Initialize Midtrans CoreAPI for QRIS
-core_api = None
-snap_api = None
-if MIDTRANS_SERVER_KEY:
-    try:
-        import midtransclient
-        core_api = midtransclient.CoreApi(
-            is_production=MIDTRANS_IS_PRODUCTION,
-            server_key=MIDTRANS_SERVER_KEY,
-            client_key=MIDTRANS_CLIENT_KEY
-        )
-        snap_api = midtransclient.Snap(
-            is_production=MIDTRANS_IS_PRODUCTION,
-            server_key=MIDTRANS_SERVER_KEY,
-            client_key=MIDTRANS_CLIENT_KEY
-        )
-        logger.info("Midtrans CoreAPI and Snap initialized")
-    except Exception as e:
-        logger.warning(f"Midtrans not initialized: {str(e)}")
+midtrans = get_midtrans_service()
+
+WEBHOOK_SOURCE = "user-payments"
+
+# Statuses after which a payment no longer changes (Midtrans or admin review)
+FINAL_PAYMENT_STATUSES = {"settlement", "failed", "approved", "rejected"}
+STREAM_REFRESH_INTERVAL = float(os.environ.get("PAYMENT_STREAM_REFRESH_INTERVAL", "10"))
+
+def publish_payment_status(order_id: str, status: str):
+    """Push a payment status change to open /stream/{order_id} connections"""
+    pubsub.publish(f"payment:{order_id}", {"orderId": order_id, "status": status})
 
 @router.post("/create-snap-payment", response_model=dict)
 async def create_snap_payment(current_user: dict = Depends(get_current_user)):
@@ -48,7 +58,7 @@ async def create_snap_payment(current_user: dict = Depends(get_current_user)):
     Create Snap payment (supports QRIS, GoPay, VA, Credit Card, etc)
     """
     try:
-        if not snap_api:
+        if not midtrans.is_configured:
             raise HTTPException(
                 status_code=503,
                 detail="Payment service not configured. Please add Midtrans API keys."
@@ -120,7 +130,7 @@ async def create_snap_payment(current_user: dict = Depends(get_current_user)):
         }
         
         # Call Midtrans Snap API
-        transaction = snap_api.create_transaction(param)
+        transaction = await midtrans.create_snap_transaction(param)
         
         # Store payment record
         payment_doc = {
@@ -147,6 +157,7 @@ async def create_snap_payment(current_user: dict = Depends(get_current_user)):
                 "currentOrderId": order_id
             }}
         )
+        invalidate_user_cache(current_user["_id"])
         
         return {
             "success": True,
@@ -211,6 +222,7 @@ async def create_qris_payment(current_user: dict = Depends(get_current_user)):
                 "currentOrderId": order_id
             }}
         )
+        invalidate_user_cache(current_user["_id"])
         
         return {
             "success": True,
@@ -241,58 +253,23 @@ async def check_payment_status(
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Check payment status from Midtrans
+    Check payment status.
+    Answered from the database; the Midtrans webhook and the payment
+    reconciler keep pending orders up to date.
     """
     try:
-        if not core_api:
-            # Fallback to local status
-            payment = await db.payment_proofs.find_one({"orderId": order_id})
-            if payment:
-                return {
-                    "orderId": order_id,
-                    "status": payment.get("status", "unknown"),
-                    "grossAmount": payment.get("grossAmount")
-                }
-            raise HTTPException(status_code=404, detail="Payment not found")
-        
-        # Get status from Midtrans
-        status_response = core_api.transactions.status(order_id)
-        transaction_status = status_response.get("transaction_status")
-        
-        # Update local payment record
-        update_data = {
-            "status": transaction_status,
-            "updatedAt": datetime.utcnow(),
-            "midtransStatusResponse": status_response
-        }
-        
-        await db.payment_proofs.update_one(
+        payment = await db.payment_proofs.find_one(
             {"orderId": order_id},
-            {"$set": update_data}
+            {"status": 1, "grossAmount": 1, "midtransNotification.payment_type": 1}
         )
-        
-        # If settled, update user status
-        if transaction_status == "settlement":
-            payment = await db.payment_proofs.find_one({"orderId": order_id})
-            if payment:
-                await db.users.update_one(
-                    {"_id": ObjectId(payment["userId"])},
-                    {"$set": {
-                        "paymentStatus": "approved",
-                        "paymentDate": datetime.utcnow()
-                    }}
-                )
-                
-                # Credit referral bonus if applicable
-                user = await db.users.find_one({"_id": ObjectId(payment["userId"])})
-                if user and user.get("usedReferralCode"):
-                    await credit_referral_bonus(user.get("usedReferralCode"), payment["userId"])
+        if not payment:
+            raise HTTPException(status_code=404, detail="Payment not found")
         
         return {
             "orderId": order_id,
-            "status": transaction_status,
-            "grossAmount": status_response.get("gross_amount"),
-            "paymentType": status_response.get("payment_type")
+            "status": payment.get("status", "unknown"),
+            "grossAmount": payment.get("grossAmount"),
+            "paymentType": (payment.get("midtransNotification") or {}).get("payment_type")
         }
         
     except HTTPException:
@@ -301,6 +278,60 @@ async def check_payment_status(
         logger.error(f"Payment status check error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+def payment_stream_scope(order_id: str) -> str:
+    return f"payment:{order_id}"
+
+async def find_own_payment(order_id: str, user: dict) -> dict:
+    payment = await db.payment_proofs.find_one({"orderId": order_id}, {"userId": 1})
+    if not payment or payment.get("userId") != str(user["_id"]):
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return payment
+
+@router.post("/stream/{order_id}/token", response_model=dict)
+async def create_payment_stream_token(order_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Short-lived token for the payment status stream of one order
+    """
+    await find_own_payment(order_id, current_user)
+    return {
+        "token": create_stream_token(str(current_user["_id"]), payment_stream_scope(order_id)),
+        "expiresIn": STREAM_TOKEN_TTL_SECONDS
+    }
+
+@router.get("/stream/{order_id}")
+async def stream_payment_status(
+    order_id: str,
+    request: Request,
+    token: Optional[str] = Query(None)
+):
+    """
+    Server-Sent Events with the payment status; replaces polling check-payment.
+    Sends the current status, then each transition as the webhook, the
+    reconciler or an admin records it. EventSource cannot set headers, so
+    ?token= carries a stream token from POST /stream/{order_id}/token
+    (never the login token).
+    """
+    current_user = await resolve_stream_token(token, payment_stream_scope(order_id))
+    await find_own_payment(order_id, current_user)
+    
+    async def load_status():
+        doc = await db.payment_proofs.find_one({"orderId": order_id}, {"status": 1})
+        return {"orderId": order_id, "status": doc.get("status", "unknown")} if doc else None
+    
+    events = status_event_stream(
+        request,
+        payment_stream_scope(order_id),
+        load_status,
+        lambda status: status["status"] in FINAL_PAYMENT_STATUSES,
+        refresh_interval=STREAM_REFRESH_INTERVAL
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Stop nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 async def credit_referral_bonus(referral_code: str, referred_user_id: str):
     """Credit referral bonus when payment is successful"""
     try:
@@ -311,13 +342,16 @@ async def credit_referral_bonus(referral_code: str, referred_user_id: str):
             bonus_amount = ref_settings.get("bonusPerReferral", 10000) if ref_settings else 10000
             
             # Update referral transaction status
-            await db.referral_transactions.update_one(
+            result = await db.referral_transactions.update_one(
                 {"referrerId": str(referrer["_id"]), "referredId": referred_user_id, "status": "pending"},
                 {"$set": {
                     "status": "credited",
                     "creditedAt": datetime.utcnow()
                 }}
             )
+            if result.modified_count == 0:
+                # Already credited by an earlier notification or status check
+                return
             
             # Add bonus to referrer
             await db.users.update_one(
@@ -350,14 +384,9 @@ async def upload_payment_proof(
             raise HTTPException(status_code=400, detail="Hanya file PNG, JPG, JPEG yang diperbolehkan")
         
         # Save file
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        contents = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        stored = await blob_store.save(file, UPLOAD_DIR, "/uploads/payments", file_extension)
         
-        proof_url = f"/uploads/payments/{unique_filename}"
+        proof_url = stored.url
         
         # Get test price from settings if not provided
         if not paymentAmount:
@@ -381,15 +410,23 @@ async def upload_payment_proof(
         result = await db.payment_proofs.insert_one(payment_doc)
         
         # Update user payment status if it's for test
+        previous_proof_url = None
         if paymentType == "test":
-            await db.users.update_one(
+            # The cached principal doesn't carry paymentProofUrl; read the replaced one from the update
+            previous = await db.users.find_one_and_update(
                 {"_id": current_user["_id"]},
                 {"$set": {
                     "paymentStatus": "pending",
                     "paymentProofUrl": proof_url,
                     "paymentMethod": paymentMethod
-                }}
+                }},
+                projection={"paymentProofUrl": 1},
+                return_document=ReturnDocument.BEFORE
             )
+            previous_proof_url = previous.get("paymentProofUrl") if previous else None
+            invalidate_user_cache(current_user["_id"])
+        
+        await blob_store.refresh(proof_url, previous_proof_url)
         
         return {
             "success": True,
@@ -411,10 +448,7 @@ async def get_my_payments(current_user: dict = Depends(get_current_user)):
         cursor = db.payment_proofs.find({"userId": str(current_user["_id"])}).sort("createdAt", -1)
         payments = await cursor.to_list(100)
         
-        for payment in payments:
-            payment["_id"] = str(payment["_id"])
-        
-        return payments
+        return MongoJSONResponse(payments)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -440,107 +474,136 @@ async def get_test_price():
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-@router.post("/midtrans-notification", response_model=dict)
-async def midtrans_notification_handler(notification: dict):
+async def apply_midtrans_status(status_response: dict) -> Optional[str]:
     """
-    Handle Midtrans payment notification (webhook)
-    This endpoint is called by Midtrans when payment status changes
+    Apply a verified Midtrans transaction status to the payment proof and
+    its user. Safe to run more than once for the same status: the user
+    side effects only fire on the transition itself.
     """
-    try:
-        if not core_api:
-            logger.warning("Midtrans notification received but CoreAPI not initialized")
-            return {"success": False, "message": "Payment service not configured"}
-        
-        logger.info(f"Received Midtrans notification: {notification}")
-        
-        # Verify notification from Midtrans
-        status_response = core_api.transactions.notification(notification)
-        
-        order_id = status_response.get('order_id')
-        transaction_status = status_response.get('transaction_status')
-        fraud_status = status_response.get('fraud_status')
-        payment_type = status_response.get('payment_type')
-        
-        logger.info(f"Order {order_id} - Status: {transaction_status}, Fraud: {fraud_status}")
-        
-        # Update payment record in database
-        payment = await db.payment_proofs.find_one({"orderId": order_id})
-        
-        if not payment:
-            logger.warning(f"Payment record not found for order {order_id}")
-            return {"success": False, "message": "Payment not found"}
-        
-        # Determine final status
-        final_status = "pending"
-        
-        if transaction_status == 'capture':
-            if fraud_status == 'accept':
-                final_status = "settlement"
-            else:
-                final_status = "pending"
-        elif transaction_status == 'settlement':
+    order_id = status_response.get('order_id')
+    transaction_status = status_response.get('transaction_status')
+    fraud_status = status_response.get('fraud_status')
+    
+    logger.info(f"Order {order_id} - Status: {transaction_status}, Fraud: {fraud_status}")
+    
+    # Determine final status
+    final_status = "pending"
+    
+    if transaction_status == 'capture':
+        if fraud_status == 'accept':
             final_status = "settlement"
-        elif transaction_status in ['cancel', 'deny', 'expire']:
-            final_status = "failed"
-        elif transaction_status == 'pending':
+        else:
             final_status = "pending"
-        
-        # Update payment proof record
-        await db.payment_proofs.update_one(
-            {"orderId": order_id},
+    elif transaction_status == 'settlement':
+        final_status = "settlement"
+    elif transaction_status in ['cancel', 'deny', 'expire']:
+        final_status = "failed"
+    elif transaction_status == 'pending':
+        final_status = "pending"
+    
+    # Update payment proof record; the previous document tells us whether
+    # this notification actually changed the status. A final status is never
+    # overwritten, so a stale "pending" from the reconciler cannot reopen a
+    # settled order and replay its side effects on the next settlement.
+    payment = await db.payment_proofs.find_one_and_update(
+        {"orderId": order_id, "status": {"$nin": list(FINAL_PAYMENT_STATUSES)}},
+        {"$set": {
+            "status": final_status,
+            "transactionStatus": transaction_status,
+            "fraudStatus": fraud_status,
+            "updatedAt": datetime.utcnow(),
+            "midtransNotification": status_response
+        }}
+    )
+    
+    if not payment:
+        current = await db.payment_proofs.find_one({"orderId": order_id}, {"status": 1})
+        if not current:
+            logger.warning(f"Payment record not found for order {order_id}")
+            return None
+        return current.get("status")
+    
+    if payment.get("status") == final_status:
+        return final_status
+    
+    publish_payment_status(order_id, final_status)
+    
+    user_id = payment.get("userId")
+    # If payment is successful, update user status
+    if final_status == "settlement" and user_id:
+        # Update user payment status
+        await db.users.update_one(
+            {"_id": ObjectId(user_id)},
             {"$set": {
-                "status": final_status,
-                "transactionStatus": transaction_status,
-                "fraudStatus": fraud_status,
-                "updatedAt": datetime.utcnow(),
-                "midtransNotification": status_response
+                "paymentStatus": "approved",
+                "paymentDate": datetime.utcnow(),
+                "paidTestStatus": "in_progress"  # Allow user to take paid test
             }}
         )
+        invalidate_user_cache(user_id)
         
-        # If payment is successful, update user status
-        if final_status == "settlement":
-            user_id = payment.get("userId")
-            if user_id:
-                # Update user payment status
-                await db.users.update_one(
-                    {"_id": ObjectId(user_id)},
-                    {"$set": {
-                        "paymentStatus": "approved",
-                        "paymentDate": datetime.utcnow(),
-                        "paidTestStatus": "in_progress"  # Allow user to take paid test
-                    }}
-                )
-                
-                # Credit referral bonus if user used a referral code
-                user = await db.users.find_one({"_id": ObjectId(user_id)})
-                if user and user.get("usedReferralCode"):
-                    await credit_referral_bonus(user.get("usedReferralCode"), user_id)
-                    logger.info(f"Referral bonus credited for order {order_id}")
-                
-                logger.info(f"User {user_id} payment approved for order {order_id}")
-        elif final_status == "failed":
-            # Update user status if payment failed
-            user_id = payment.get("userId")
-            if user_id:
-                await db.users.update_one(
-                    {"_id": ObjectId(user_id)},
-                    {"$set": {
-                        "paymentStatus": "unpaid",
-                        "currentOrderId": None
-                    }}
-                )
-                logger.info(f"Payment failed for order {order_id}")
-        
-        return {
-            "success": True,
-            "order_id": order_id,
-            "status": final_status,
-            "message": "Notification processed"
-        }
+        # Credit referral bonus if user used a referral code
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"usedReferralCode": 1})
+        if user and user.get("usedReferralCode"):
+            await credit_referral_bonus(user.get("usedReferralCode"), user_id)
+            logger.info(f"Referral bonus credited for order {order_id}")
         
+        logger.info(f"User {user_id} payment approved for order {order_id}")
+    elif final_status == "failed" and user_id:
+        # Update user status if payment failed
+        await db.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {
+                "paymentStatus": "unpaid",
+                "currentOrderId": None
+            }}
+        )
+        invalidate_user_cache(user_id)
+        logger.info(f"Payment failed for order {order_id}")
+    
+    return final_status
+
+async def process_midtrans_notification(notification: dict):
+    """Inbox handler: verify the notification with Midtrans, then apply it"""
+    status_response = await midtrans.notification(notification)
+    await apply_midtrans_status(status_response)
+
+webhook_inbox.register(WEBHOOK_SOURCE, process_midtrans_notification)
+# Only Snap orders exist at Midtrans; QRIS and manual proofs are approved by admins
+payment_reconciler.register(
+    WEBHOOK_SOURCE,
+    "payment_proofs",
+    apply_midtrans_status,
+    query={"paymentType": "snap"},
+    max_age=timedelta(hours=25)
+)
+
+@router.post("/midtrans-notification", response_model=dict)
+async def midtrans_notification_handler(notification: dict):
+    """
+    Handle Midtrans payment notification (webhook)
+    This endpoint is called by Midtrans when payment status changes.
+    The notification is stored in the webhook inbox and processed in the
+    background, so Midtrans gets its acknowledgement straight away.
+    """
+    if not midtrans.is_configured:
+        logger.warning("Midtrans notification received but Midtrans is not configured")
+        return {"success": False, "message": "Payment service not configured"}
+    
+    order_id = notification.get("order_id")
+    if not midtrans.verify_signature(notification):
+        logger.warning(f"Midtrans notification for order {order_id} rejected: invalid signature")
+        raise HTTPException(status_code=403, detail="Invalid signature")
+    try:
+        accepted = await webhook_inbox.accept(WEBHOOK_SOURCE, notification)
     except Exception as e:
-        logger.error(f"Error processing Midtrans notification: {str(e)}", exc_info=True)
-        return {
-            "success": False,
-            "error": str(e)
-        }
+        # Non-2xx makes Midtrans retry the notification later
+        logger.error(f"Error storing Midtrans notification for order {order_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Notification could not be stored")
+    
+    logger.info(f"Received Midtrans notification for order {order_id} ({'queued' if accepted else 'duplicate'})")
+    return {
+        "success": True,
+        "order_id": order_id,
+        "message": "Notification received"
+    }
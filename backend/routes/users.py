@@ -1,14 +1,25 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
 from database import get_db
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
 from datetime import datetime
 from bson import ObjectId
 from routes.admin import verify_token
+from routes.auth import invalidate_user_cache
+from utils.stats_counters import stats_counters
 from models.user import AdminUserUpdate
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 db = get_db()
 
+declare_indexes(
+    "users",
+    IndexModel([("createdAt", DESCENDING)], name="createdAt_-1"),
+    IndexModel([("paymentStatus", ASCENDING)], name="paymentStatus_1"),
+)
+
 @router.get("", response_model=List[dict])
 async def get_all_users(
     skip: int = 0,
@@ -41,11 +52,10 @@ async def get_all_users(
         users = await cursor.to_list(length=limit)
         
         for user in users:
-            user["_id"] = str(user["_id"])
             # Remove sensitive data
             user.pop("hashedPassword", None)
         
-        return users
+        return MongoJSONResponse(users)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -104,22 +114,17 @@ async def get_user(
         if not user:
             raise HTTPException(status_code=404, detail="User tidak ditemukan")
         
-        user["_id"] = str(user["_id"])
         user.pop("hashedPassword", None)
         
         # Get payment info
         payment = await db.payments.find_one({"userId": user_id})
         if payment:
-            payment["_id"] = str(payment["_id"])
             user["paymentDetails"] = payment
         
         # Get referral info
-        referrals = await db.referral_transactions.find({"referrerId": user_id}).to_list(100)
-        for ref in referrals:
-            ref["_id"] = str(ref["_id"])
-        user["referrals"] = referrals
+        user["referrals"] = await db.referral_transactions.find({"referrerId": user_id}).to_list(100)
         
-        return user
+        return MongoJSONResponse(user)
     except HTTPException:
         raise
     except Exception as e:
@@ -148,6 +153,7 @@ async def update_user(
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="User tidak ditemukan atau tidak ada perubahan")
+        invalidate_user_cache(user_id)
         
         return {"success": True, "message": "User berhasil diupdate"}
     except HTTPException:
@@ -180,6 +186,7 @@ async def ban_user(
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="User tidak ditemukan")
+        invalidate_user_cache(user_id)
         
         return {"success": True, "message": "User berhasil diblokir"}
     except HTTPException:
@@ -210,6 +217,7 @@ async def unban_user(
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="User tidak ditemukan")
+        invalidate_user_cache(user_id)
         
         return {"success": True, "message": "User berhasil di-unban"}
     except HTTPException:
@@ -234,9 +242,12 @@ async def delete_user(
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User tidak ditemukan")
+        invalidate_user_cache(user_id)
         
         # Delete associated data
-        await db.payments.delete_many({"userId": user_id})
+        deleted_payments = await db.payments.delete_many({"userId": user_id})
+        if deleted_payments.deleted_count:
+            await stats_counters.recompute("payments")
         await db.referral_transactions.delete_many({
             "$or": [{"referrerId": user_id}, {"referredId": user_id}]
         })
@@ -2,21 +2,37 @@ from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional
 from database import get_db
-from datetime import datetime
+from utils.responses import MongoJSONResponse
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from utils.indexes import declare_indexes
+from datetime import datetime, timedelta
 from bson import ObjectId
-import httpx
-import base64
-import hashlib
+from utils.midtrans import get_midtrans_service, MidtransError
+from utils.webhook_inbox import webhook_inbox
+from utils.reconciler import payment_reconciler
 import os
 
 router = APIRouter(prefix="/api/wallet", tags=["wallet"])
 db = get_db()
 
+declare_indexes(
+    "wallets",
+    IndexModel([("userId", ASCENDING)], name="userId_1"),
+)
+declare_indexes(
+    "wallet_transactions",
+    IndexModel([("orderId", ASCENDING)], name="orderId_1"),
+    IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)], name="userId_1_createdAt_-1"),
+)
+
 # Midtrans Config
 MIDTRANS_SERVER_KEY = os.environ.get("MIDTRANS_SERVER_KEY", "SB-Mid-server-YOUR_KEY")
 MIDTRANS_CLIENT_KEY = os.environ.get("MIDTRANS_CLIENT_KEY", "SB-Mid-client-YOUR_KEY")
 MIDTRANS_IS_PRODUCTION = os.environ.get("MIDTRANS_IS_PRODUCTION", "false").lower() == "true"
-MIDTRANS_API_URL = "https://api.midtrans.com" if MIDTRANS_IS_PRODUCTION else "https://api.sandbox.midtrans.com"
+
+midtrans = get_midtrans_service()
+
+WEBHOOK_SOURCE = "wallet"
 
 class TopUpRequest(BaseModel):
     amount: int
@@ -42,9 +58,6 @@ async def get_wallet_balance(user_id: str):
                 "updatedAt": datetime.utcnow()
             }
             await db.wallets.insert_one(wallet)
-            wallet["_id"] = str(wallet.get("_id", ""))
-        else:
-            wallet["_id"] = str(wallet["_id"])
         
         return {"balance": wallet.get("balance", 0), "userId": user_id}
     except Exception as e:
@@ -58,10 +71,7 @@ async def get_transactions(user_id: str, limit: int = 20):
             {"userId": user_id}
         ).sort("createdAt", -1).limit(limit).to_list(limit)
         
-        for t in transactions:
-            t["_id"] = str(t["_id"])
-        
-        return transactions
+        return MongoJSONResponse(transactions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -77,8 +87,6 @@ async def create_topup(request: TopUpRequest):
             raise HTTPException(status_code=404, detail="User not found")
         
         # Create Midtrans transaction
-        auth_string = base64.b64encode(f"{MIDTRANS_SERVER_KEY}:".encode()).decode()
-        
         payload = {
             "payment_type": "qris",
             "transaction_details": {
@@ -94,20 +102,9 @@ async def create_topup(request: TopUpRequest):
             }
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{MIDTRANS_API_URL}/v2/charge",
-                json=payload,
-                headers={
-                    "Authorization": f"Basic {auth_string}",
-                    "Content-Type": "application/json",
-                    "Accept": "application/json"
-                }
-            )
-            
-            result = response.json()
-        
-        if response.status_code != 200 and response.status_code != 201:
+        try:
+            result = await midtrans.charge(payload)
+        except MidtransError:
             # Fallback for sandbox/demo mode
             result = {
                 "status_code": "201",
@@ -154,96 +151,96 @@ async def create_topup(request: TopUpRequest):
 # Check payment status
 @router.get("/check-status/{order_id}")
 async def check_payment_status(order_id: str):
+    """Answered from the database; webhooks and the payment reconciler settle top-ups"""
     try:
-        auth_string = base64.b64encode(f"{MIDTRANS_SERVER_KEY}:".encode()).decode()
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{MIDTRANS_API_URL}/v2/{order_id}/status",
-                headers={
-                    "Authorization": f"Basic {auth_string}",
-                    "Accept": "application/json"
-                }
-            )
-            result = response.json()
-        
-        transaction_status = result.get("transaction_status", "pending")
+        transaction = await db.wallet_transactions.find_one(
+            {"orderId": order_id},
+            {"status": 1, "transactionStatus": 1, "midtransStatusResponse": 1}
+        )
+        if not transaction:
+            raise HTTPException(status_code=404, detail="Transaction not found")
         
-        # Update local transaction if settlement
-        if transaction_status == "settlement" or transaction_status == "capture":
-            transaction = await db.wallet_transactions.find_one({"orderId": order_id})
-            if transaction and transaction.get("status") == "pending":
-                # Update transaction status
-                await db.wallet_transactions.update_one(
-                    {"orderId": order_id},
-                    {"$set": {"status": "success", "updatedAt": datetime.utcnow()}}
-                )
-                
-                # Add balance to wallet
-                await db.wallets.update_one(
-                    {"userId": transaction["userId"]},
-                    {
-                        "$inc": {"balance": transaction["amount"]},
-                        "$set": {"updatedAt": datetime.utcnow()}
-                    },
-                    upsert=True
-                )
+        # Report the Midtrans status vocabulary the wallet page expects
+        status = transaction.get("status", "pending")
+        transaction_status = transaction.get("transactionStatus") or {"success": "settlement"}.get(status, status)
         
         return {
             "orderId": order_id,
             "status": transaction_status,
-            "midtransResponse": result
+            "midtransResponse": transaction.get("midtransStatusResponse")
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def apply_topup_status(status_response: dict):
+    """
+    Settle or fail a pending top-up from a Midtrans status response or
+    notification. Only a pending transaction can move, so the webhook and
+    the reconciler racing each other credit the wallet once.
+    """
+    order_id = status_response.get("order_id")
+    transaction_status = status_response.get("transaction_status")
+    fraud_status = status_response.get("fraud_status", "accept")
+    
+    if transaction_status == "settlement" or (transaction_status == "capture" and fraud_status == "accept"):
+        transaction = await db.wallet_transactions.find_one_and_update(
+            {"orderId": order_id, "status": "pending"},
+            {"$set": {
+                "status": "success",
+                "transactionStatus": transaction_status,
+                "midtransStatusResponse": status_response,
+                "updatedAt": datetime.utcnow()
+            }}
+        )
+        if transaction:
+            # Add balance
+            await db.wallets.update_one(
+                {"userId": transaction["userId"]},
+                {
+                    "$inc": {"balance": transaction["amount"]},
+                    "$set": {"updatedAt": datetime.utcnow()}
+                },
+                upsert=True
+            )
+    
+    elif transaction_status in ["deny", "cancel", "expire"]:
+        await db.wallet_transactions.update_one(
+            {"orderId": order_id, "status": "pending"},
+            {"$set": {
+                "status": "failed",
+                "transactionStatus": transaction_status,
+                "midtransStatusResponse": status_response,
+                "updatedAt": datetime.utcnow()
+            }}
+        )
+
+async def process_topup_notification(notification: dict):
+    """Inbox handler: verify the notification with Midtrans, then apply it"""
+    await apply_topup_status(await midtrans.notification(notification))
+
+webhook_inbox.register(WEBHOOK_SOURCE, process_topup_notification)
+payment_reconciler.register(
+    WEBHOOK_SOURCE,
+    "wallet_transactions",
+    apply_topup_status,
+    query={"type": "topup", "paymentMethod": "qris"},
+    max_age=timedelta(hours=2)
+)
+
 # Midtrans webhook/notification handler
 @router.post("/notification")
 async def handle_notification(request: Request):
     try:
         data = await request.json()
-        
-        order_id = data.get("order_id")
-        transaction_status = data.get("transaction_status")
-        fraud_status = data.get("fraud_status", "accept")
-        
-        # Verify signature
-        server_key = MIDTRANS_SERVER_KEY
-        signature_key = data.get("signature_key")
-        order_id_data = data.get("order_id")
-        status_code = data.get("status_code")
-        gross_amount = data.get("gross_amount")
-        
-        raw_string = f"{order_id_data}{status_code}{gross_amount}{server_key}"
-        expected_signature = hashlib.sha512(raw_string.encode()).hexdigest()
-        
-        # Process based on status
-        if transaction_status == "settlement" or (transaction_status == "capture" and fraud_status == "accept"):
-            transaction = await db.wallet_transactions.find_one({"orderId": order_id})
-            if transaction and transaction.get("status") == "pending":
-                # Update transaction
-                await db.wallet_transactions.update_one(
-                    {"orderId": order_id},
-                    {"$set": {"status": "success", "updatedAt": datetime.utcnow()}}
-                )
-                
-                # Add balance
-                await db.wallets.update_one(
-                    {"userId": transaction["userId"]},
-                    {
-                        "$inc": {"balance": transaction["amount"]},
-                        "$set": {"updatedAt": datetime.utcnow()}
-                    },
-                    upsert=True
-                )
-        
-        elif transaction_status in ["deny", "cancel", "expire"]:
-            await db.wallet_transactions.update_one(
-                {"orderId": order_id},
-                {"$set": {"status": "failed", "updatedAt": datetime.utcnow()}}
-            )
-        
+        if not midtrans.verify_signature(data):
+            raise HTTPException(status_code=403, detail="Invalid signature")
+        # Processed by the webhook inbox consumer; acknowledge right away
+        await webhook_inbox.accept(WEBHOOK_SOURCE, data)
         return {"status": "ok"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
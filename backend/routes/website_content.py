@@ -1,16 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer
 from typing import List, Optional
 from pydantic import BaseModel
 from database import get_db
+from pymongo import IndexModel, ASCENDING
+from utils.indexes import declare_indexes
+from utils.cache import public_cache
+from utils.etag import etag_response
+from utils.blobs import blob_store
+from utils.images import image_pipeline, with_srcset
+from routes.banners import get_cached_banners
+from routes.running_info import get_cached_running_info
+from routes.settings import get_cached_settings
 from datetime import datetime
 from bson import ObjectId
+import asyncio
 
 router = APIRouter(prefix="/api/website-content", tags=["website-content"])
 security = HTTPBearer()
 
 db = get_db()
 
+declare_indexes(
+    "section_images",
+    IndexModel([("sectionName", ASCENDING)], name="sectionName_1"),
+)
+
 # Models
 class SlideContent(BaseModel):
     title: str
@@ -54,23 +69,94 @@ class SectionImage(BaseModel):
     imageUrl: str
     altText: str = ""
 
+CACHE_PREFIX = "website-content:"
+
+def invalidate_content_cache(section: str = ""):
+    public_cache.invalidate_prefix(CACHE_PREFIX + section)
+
+# Collections whose imageUrl gets a srcset once its variants exist -> cache section
+IMAGE_COLLECTIONS = {
+    "hero_slides": "hero-slides",
+    "website_products": "products",
+    "website_testimonials": "testimonials",
+    "website_activities": "activities",
+    "section_images": "section-images",
+}
+
+async def record_image_variants(url: str, srcset: dict):
+    for collection, section in IMAGE_COLLECTIONS.items():
+        result = await db[collection].update_many({"imageUrl": url}, {"$set": {"imageSrcset": srcset}})
+        if result.modified_count:
+            invalidate_content_cache(section)
+
+image_pipeline.on_ready(record_image_variants)
+
+for collection in IMAGE_COLLECTIONS:
+    blob_store.track(collection, "imageUrl")
+
+async def load_hero_slides():
+    return await db.hero_slides.find({"isActive": True}).sort("order", 1).to_list(100)
+
+async def load_products():
+    return await db.website_products.find({"isActive": True}).sort("order", 1).to_list(100)
+
+async def load_testimonials():
+    return await db.website_testimonials.find({"isActive": True}).sort("order", 1).to_list(100)
+
+async def load_activities():
+    return await db.website_activities.find({"isActive": True}).sort("order", 1).to_list(100)
+
+async def load_section_images():
+    return await db.section_images.find({}).to_list(100)
+
+@router.get("/bundle")
+async def get_homepage_bundle(request: Request):
+    """
+    Everything the public homepage needs in one response (public).
+    Sections are fetched concurrently and each one is served from the public cache.
+    """
+    try:
+        (
+            hero_slides, products, testimonials, activities,
+            section_images, banners, running_info, settings
+        ) = await asyncio.gather(
+            public_cache.get_or_load(CACHE_PREFIX + "hero-slides", load_hero_slides),
+            public_cache.get_or_load(CACHE_PREFIX + "products", load_products),
+            public_cache.get_or_load(CACHE_PREFIX + "testimonials", load_testimonials),
+            public_cache.get_or_load(CACHE_PREFIX + "activities", load_activities),
+            public_cache.get_or_load(CACHE_PREFIX + "section-images", load_section_images),
+            get_cached_banners(isActive=True),
+            get_cached_running_info(isActive=True),
+            get_cached_settings()
+        )
+        return etag_response(request, {
+            "heroSlides": hero_slides,
+            "products": products,
+            "testimonials": testimonials,
+            "activities": activities,
+            "sectionImages": section_images,
+            "banners": banners,
+            "runningInfo": running_info,
+            "settings": settings
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Hero Slides CRUD
 @router.get("/hero-slides")
-async def get_hero_slides():
+async def get_hero_slides(request: Request):
     try:
-        slides = await db.hero_slides.find({"isActive": True}).sort("order", 1).to_list(100)
-        for slide in slides:
-            slide["_id"] = str(slide["_id"])
-        return slides
+        return etag_response(request, await public_cache.get_or_load(CACHE_PREFIX + "hero-slides", load_hero_slides))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/hero-slides")
 async def create_hero_slide(slide: SlideContent):
     try:
-        slide_dict = slide.dict()
+        slide_dict = await with_srcset(slide.dict())
         slide_dict["createdAt"] = datetime.utcnow()
         result = await db.hero_slides.insert_one(slide_dict)
+        invalidate_content_cache("hero-slides")
         return {"id": str(result.inserted_id), "message": "Slide created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -80,10 +166,11 @@ async def update_hero_slide(slide_id: str, slide: SlideContent):
     try:
         result = await db.hero_slides.update_one(
             {"_id": ObjectId(slide_id)},
-            {"$set": slide.dict()}
+            {"$set": await with_srcset(slide.dict())}
         )
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Slide not found")
+        invalidate_content_cache("hero-slides")
         return {"message": "Slide updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -94,27 +181,26 @@ async def delete_hero_slide(slide_id: str):
         result = await db.hero_slides.delete_one({"_id": ObjectId(slide_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Slide not found")
+        invalidate_content_cache("hero-slides")
         return {"message": "Slide deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Products CRUD
 @router.get("/products")
-async def get_products():
+async def get_products(request: Request):
     try:
-        products = await db.website_products.find({"isActive": True}).sort("order", 1).to_list(100)
-        for product in products:
-            product["_id"] = str(product["_id"])
-        return products
+        return etag_response(request, await public_cache.get_or_load(CACHE_PREFIX + "products", load_products))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/products")
 async def create_product(product: ProductContent):
     try:
-        product_dict = product.dict()
+        product_dict = await with_srcset(product.dict())
         product_dict["createdAt"] = datetime.utcnow()
         result = await db.website_products.insert_one(product_dict)
+        invalidate_content_cache("products")
         return {"id": str(result.inserted_id), "message": "Product created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -124,10 +210,11 @@ async def update_product(product_id: str, product: ProductContent):
     try:
         result = await db.website_products.update_one(
             {"_id": ObjectId(product_id)},
-            {"$set": product.dict()}
+            {"$set": await with_srcset(product.dict())}
         )
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Product not found")
+        invalidate_content_cache("products")
         return {"message": "Product updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -138,27 +225,26 @@ async def delete_product(product_id: str):
         result = await db.website_products.delete_one({"_id": ObjectId(product_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Product not found")
+        invalidate_content_cache("products")
         return {"message": "Product deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Testimonials CRUD
 @router.get("/testimonials")
-async def get_testimonials():
+async def get_testimonials(request: Request):
     try:
-        testimonials = await db.website_testimonials.find({"isActive": True}).sort("order", 1).to_list(100)
-        for t in testimonials:
-            t["_id"] = str(t["_id"])
-        return testimonials
+        return etag_response(request, await public_cache.get_or_load(CACHE_PREFIX + "testimonials", load_testimonials))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/testimonials")
 async def create_testimonial(testimonial: TestimonialContent):
     try:
-        t_dict = testimonial.dict()
+        t_dict = await with_srcset(testimonial.dict())
         t_dict["createdAt"] = datetime.utcnow()
         result = await db.website_testimonials.insert_one(t_dict)
+        invalidate_content_cache("testimonials")
         return {"id": str(result.inserted_id), "message": "Testimonial created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -168,10 +254,11 @@ async def update_testimonial(testimonial_id: str, testimonial: TestimonialConten
     try:
         result = await db.website_testimonials.update_one(
             {"_id": ObjectId(testimonial_id)},
-            {"$set": testimonial.dict()}
+            {"$set": await with_srcset(testimonial.dict())}
         )
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Testimonial not found")
+        invalidate_content_cache("testimonials")
         return {"message": "Testimonial updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -182,27 +269,26 @@ async def delete_testimonial(testimonial_id: str):
         result = await db.website_testimonials.delete_one({"_id": ObjectId(testimonial_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Testimonial not found")
+        invalidate_content_cache("testimonials")
         return {"message": "Testimonial deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Activities CRUD
 @router.get("/activities")
-async def get_activities():
+async def get_activities(request: Request):
     try:
-        activities = await db.website_activities.find({"isActive": True}).sort("order", 1).to_list(100)
-        for a in activities:
-            a["_id"] = str(a["_id"])
-        return activities
+        return etag_response(request, await public_cache.get_or_load(CACHE_PREFIX + "activities", load_activities))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/activities")
 async def create_activity(activity: ActivityContent):
     try:
-        a_dict = activity.dict()
+        a_dict = await with_srcset(activity.dict())
         a_dict["createdAt"] = datetime.utcnow()
         result = await db.website_activities.insert_one(a_dict)
+        invalidate_content_cache("activities")
         return {"id": str(result.inserted_id), "message": "Activity created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -212,10 +298,11 @@ async def update_activity(activity_id: str, activity: ActivityContent):
     try:
         result = await db.website_activities.update_one(
             {"_id": ObjectId(activity_id)},
-            {"$set": activity.dict()}
+            {"$set": await with_srcset(activity.dict())}
         )
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Activity not found")
+        invalidate_content_cache("activities")
         return {"message": "Activity updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -226,28 +313,26 @@ async def delete_activity(activity_id: str):
         result = await db.website_activities.delete_one({"_id": ObjectId(activity_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Activity not found")
+        invalidate_content_cache("activities")
         return {"message": "Activity deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Section Images CRUD (for about, services, etc)
 @router.get("/section-images")
-async def get_section_images():
+async def get_section_images(request: Request):
     try:
-        images = await db.section_images.find({}).to_list(100)
-        for img in images:
-            img["_id"] = str(img["_id"])
-        return images
+        return etag_response(request, await public_cache.get_or_load(CACHE_PREFIX + "section-images", load_section_images))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/section-images/{section_name}")
-async def get_section_image(section_name: str):
+async def get_section_image(request: Request, section_name: str):
     try:
-        image = await db.section_images.find_one({"sectionName": section_name})
-        if image:
-            image["_id"] = str(image["_id"])
-        return image
+        # Served from the cached list so arbitrary names cannot fill the cache
+        images = await public_cache.get_or_load(CACHE_PREFIX + "section-images", load_section_images)
+        image = next((image for image in images if image.get("sectionName") == section_name), None)
+        return etag_response(request, image)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -256,9 +341,10 @@ async def create_or_update_section_image(image: SectionImage):
     try:
         result = await db.section_images.update_one(
             {"sectionName": image.sectionName},
-            {"$set": image.dict(), "$setOnInsert": {"createdAt": datetime.utcnow()}},
+            {"$set": await with_srcset(image.dict()), "$setOnInsert": {"createdAt": datetime.utcnow()}},
             upsert=True
         )
+        invalidate_content_cache("section-images")
         return {"message": "Section image saved successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -362,6 +448,7 @@ async def seed_default_content():
             {"sectionName": "promo-main", "imageUrl": "https://images.unsplash.com/photo-1598162942982-5cb74331817c?w=600&q=80", "altText": "Growth Mindset", "createdAt": datetime.utcnow()}
         ]
         await db.section_images.insert_many(default_section_images)
+        invalidate_content_cache()
         
         return {"message": "Default content seeded successfully", "seeded": True}
     except Exception as e:
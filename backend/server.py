@@ -1,16 +1,16 @@
-from fastapi import FastAPI, APIRouter
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, APIRouter, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
 from pathlib import Path
+from contextlib import asynccontextmanager
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Initialize database
-from database import init_db
+from database import init_db, connect_db, close_db, get_pool_stats
 db = init_db()
 
 # Import routes AFTER database initialization
@@ -38,12 +38,64 @@ from routes.ai_analysis import router as ai_analysis_router
 from routes.website_content import router as website_content_router
 from routes.wallet import router as wallet_router
 from routes.test_results import router as test_results_router
+from routes.admin import verify_token
+from routes.certificates import certificate_renders, warm_renderer_template
+from utils.indexes import ensure_indexes
+from utils.query_metrics import QueryMetricsMiddleware, get_route_stats
+from utils.cache import get_cache_stats
+from utils.responses import MongoJSONResponse
+from utils.compression import CompressionMiddleware
+from utils.password_pool import password_pool
+from utils.pdf_renderer import pdf_renderer
+from utils.pdf_cache import certificate_pdf_cache
+from utils.http_clients import http_clients
+from utils.webhook_inbox import webhook_inbox
+from utils.reconciler import payment_reconciler
+from utils.pubsub import pubsub
+from utils.stats_counters import stats_counters
+from utils.images import image_pipeline
+from utils.blobs import blob_store
+from utils.uploads import UploadStaticFiles
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_logger = logging.getLogger(__name__)
+    try:
+        await connect_db()
+        # Route modules declare their indexes at import time; apply them once here
+        await ensure_indexes(db)
+    except Exception as e:
+        startup_logger.error(f"MongoDB startup checks failed: {str(e)}")
+    http_clients.open()
+    webhook_inbox.start()
+    payment_reconciler.start()
+    stats_counters.start()
+    blob_store.start()
+    try:
+        await warm_renderer_template()
+    except Exception as e:
+        startup_logger.error(f"Warming the certificate renderer failed: {str(e)}")
+
+    yield
+
+    await blob_store.stop()
+    await certificate_renders.shutdown()
+    await stats_counters.stop()
+    await payment_reconciler.stop()
+    await webhook_inbox.stop()
+    await http_clients.aclose()
+    password_pool.shutdown()
+    pdf_renderer.shutdown()
+    image_pipeline.shutdown()
+    close_db()
 
 # Create the main app without a prefix
 app = FastAPI(
     title="NEWME CLASS API",
     description="API for NEWME CLASS - Kelas Peduli Talenta",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=MongoJSONResponse,
+    lifespan=lifespan
 )
 
 # Create a router with the /api prefix
@@ -62,6 +114,27 @@ async def root():
 async def health_check():
     return {"status": "ok", "database": "connected"}
 
+@api_router.get("/health/metrics")
+async def health_metrics(token_data: dict = Depends(verify_token)):
+    """
+    Runtime metrics for capacity planning (admin only)
+    """
+    return {
+        "mongoPool": get_pool_stats(),
+        "mongoCommandsByRoute": get_route_stats(),
+        "cache": get_cache_stats(),
+        "passwordHashing": password_pool.stats(),
+        "certificateRendering": pdf_renderer.stats(),
+        "certificatePdfCache": certificate_pdf_cache.stats(),
+        "certificatePrerender": certificate_renders.stats(),
+        "outboundHttp": http_clients.stats(),
+        "webhookInbox": webhook_inbox.stats(),
+        "paymentReconciler": payment_reconciler.stats(),
+        "pubsub": pubsub.stats(),
+        "imageVariants": image_pipeline.stats(),
+        "uploadBlobs": blob_store.stats()
+    }
+
 # Include all routers
 app.include_router(registrations_router)
 app.include_router(contacts_router)
@@ -94,7 +167,15 @@ app.include_router(api_router)
 # Mount static files for uploads (served from frontend's public folder)
 uploads_path = Path("/app/frontend/public/uploads")
 if uploads_path.exists():
-    app.mount("/uploads", StaticFiles(directory=str(uploads_path)), name="uploads")
+    app.mount("/uploads", UploadStaticFiles(directory=str(uploads_path)), name="uploads")
+
+app.add_middleware(QueryMetricsMiddleware)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", "1024")),
+    exclude_paths=("/uploads",)
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -102,6 +183,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
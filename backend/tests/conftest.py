@@ -0,0 +1,28 @@
+"""
+Fixtures for the offline unit tests (payments, webhooks, Midtrans client).
+test_newmeclass_api.py runs against a deployed backend and needs none of these.
+"""
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database
+from mongomock_motor import AsyncMongoMockClient
+from utils.indexes import ensure_indexes
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(monkeypatch):
+    """In-memory MongoDB behind database.get_db(), with the declared indexes"""
+    test_db = AsyncMongoMockClient()["newmeclass_test"]
+    monkeypatch.setattr(database, "db", test_db)
+    await ensure_indexes(test_db)
+    return test_db
@@ -0,0 +1,187 @@
+"""
+MidtransService against a fake Midtrans API (httpx.MockTransport)
+"""
+import hashlib
+import json
+
+import httpx
+import pytest
+
+import utils.midtrans
+from utils.midtrans import MidtransError, MidtransService
+
+pytestmark = pytest.mark.anyio
+
+API_URL = "http://midtrans.test"
+
+
+class FakeMidtrans:
+    """Answers each request with the next queued response and records what it received"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def make_service(fake: FakeMidtrans, max_retries: int = 2) -> MidtransService:
+    return MidtransService(
+        server_key="SB-Mid-server-test",
+        api_base_url=API_URL,
+        snap_base_url=f"{API_URL}/snap",
+        max_retries=max_retries,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    )
+
+
+def status_body(order_id: str = "ORDER-1", transaction_status: str = "settlement", status_code: str = "200") -> dict:
+    return {
+        "order_id": order_id,
+        "transaction_id": f"trx-{order_id}",
+        "transaction_status": transaction_status,
+        "status_code": status_code,
+        "gross_amount": "50000.00"
+    }
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def sleep(_delay):
+        pass
+    monkeypatch.setattr(utils.midtrans.asyncio, "sleep", sleep)
+
+
+class TestRetries:
+    """Status lookups are retried; charges only when the request never left"""
+
+    async def test_status_lookup_retries_server_errors(self):
+        fake = FakeMidtrans(
+            httpx.Response(503, json={"status_message": "busy"}),
+            httpx.Response(502, json={"status_message": "bad gateway"}),
+            httpx.Response(200, json=status_body())
+        )
+        result = await make_service(fake).transaction_status("ORDER-1")
+
+        assert result["transaction_status"] == "settlement"
+        assert len(fake.requests) == 3
+        assert fake.requests[0].url == f"{API_URL}/v2/ORDER-1/status"
+
+    async def test_status_lookup_gives_up_after_max_retries(self):
+        fake = FakeMidtrans(*[httpx.Response(500, json={}) for _ in range(3)])
+
+        with pytest.raises(MidtransError) as error:
+            await make_service(fake, max_retries=2).transaction_status("ORDER-1")
+
+        assert error.value.status_code == 500
+        assert len(fake.requests) == 3
+
+    async def test_status_lookup_retries_read_timeouts(self):
+        fake = FakeMidtrans(httpx.ReadTimeout("slow"), httpx.Response(200, json=status_body()))
+        result = await make_service(fake).transaction_status("ORDER-1")
+
+        assert result["order_id"] == "ORDER-1"
+        assert len(fake.requests) == 2
+
+    async def test_charge_is_not_retried_after_a_server_error(self):
+        fake = FakeMidtrans(httpx.Response(500, json={"status_message": "oops"}))
+
+        with pytest.raises(MidtransError) as error:
+            await make_service(fake).charge({"payment_type": "qris"})
+
+        assert error.value.status_code == 500
+        assert len(fake.requests) == 1
+
+    async def test_charge_is_not_retried_after_a_read_timeout(self):
+        fake = FakeMidtrans(httpx.ReadTimeout("slow"))
+
+        with pytest.raises(MidtransError):
+            await make_service(fake).charge({"payment_type": "qris"})
+
+        assert len(fake.requests) == 1
+
+    async def test_charge_is_retried_when_the_connection_failed(self):
+        fake = FakeMidtrans(
+            httpx.ConnectError("refused"),
+            httpx.Response(201, json={"status_code": "201", "transaction_status": "pending"})
+        )
+        result = await make_service(fake).charge({"payment_type": "qris"})
+
+        assert result["transaction_status"] == "pending"
+        assert len(fake.requests) == 2
+        assert json.loads(fake.requests[-1].content) == {"payment_type": "qris"}
+
+    async def test_requests_use_basic_auth_with_the_server_key(self):
+        fake = FakeMidtrans(httpx.Response(200, json=status_body()))
+        await make_service(fake).transaction_status("ORDER-1")
+
+        assert fake.requests[0].headers["Authorization"] == "Basic U0ItTWlkLXNlcnZlci10ZXN0Og=="
+
+
+class TestStatusCodes:
+    """Errors Midtrans reports with HTTP 200 and a status_code in the body"""
+
+    async def test_expired_transaction_407_is_a_normal_response(self):
+        fake = FakeMidtrans(httpx.Response(200, json=status_body(transaction_status="expire", status_code="407")))
+        result = await make_service(fake).transaction_status("ORDER-1")
+
+        assert result["transaction_status"] == "expire"
+
+    async def test_not_found_in_body_raises_with_its_status_code(self):
+        fake = FakeMidtrans(httpx.Response(200, json={"status_code": "404", "status_message": "not found"}))
+
+        with pytest.raises(MidtransError) as error:
+            await make_service(fake).transaction_status("ORDER-1")
+
+        assert error.value.status_code == 404
+
+    async def test_http_error_carries_the_error_messages(self):
+        fake = FakeMidtrans(httpx.Response(401, json={"error_messages": ["Access denied"]}))
+
+        with pytest.raises(MidtransError) as error:
+            await make_service(fake).create_snap_transaction({})
+
+        assert error.value.status_code == 401
+        assert "Access denied" in str(error.value)
+
+
+class TestNotifications:
+    """Webhook payloads are resolved against the Core API before use"""
+
+    async def test_notification_returns_the_status_midtrans_reports(self):
+        fake = FakeMidtrans(httpx.Response(200, json=status_body(transaction_status="pending")))
+        forged = {**status_body(transaction_status="settlement"), "transaction_id": "trx-ORDER-1"}
+
+        result = await make_service(fake).notification(forged)
+
+        assert result["transaction_status"] == "pending"
+        assert fake.requests[0].url == f"{API_URL}/v2/trx-ORDER-1/status"
+
+    async def test_notification_falls_back_to_the_order_id(self):
+        fake = FakeMidtrans(httpx.Response(200, json=status_body()))
+        await make_service(fake).notification({"order_id": "ORDER-1"})
+
+        assert fake.requests[0].url == f"{API_URL}/v2/ORDER-1/status"
+
+    async def test_notification_without_ids_is_rejected(self):
+        fake = FakeMidtrans()
+
+        with pytest.raises(MidtransError):
+            await make_service(fake).notification({"transaction_status": "settlement"})
+
+        assert fake.requests == []
+
+    def test_verify_signature(self):
+        service = make_service(FakeMidtrans())
+        notification = status_body()
+        raw = f"{notification['order_id']}{notification['status_code']}{notification['gross_amount']}SB-Mid-server-test"
+        notification["signature_key"] = hashlib.sha512(raw.encode()).hexdigest()
+
+        assert service.verify_signature(notification)
+        assert not service.verify_signature({**notification, "gross_amount": "1.00"})
+        assert not service.verify_signature({**notification, "signature_key": ""})
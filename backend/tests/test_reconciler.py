@@ -0,0 +1,147 @@
+"""
+PendingPaymentReconciler: claiming with backoff, applying Midtrans statuses
+"""
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import utils.reconciler
+from utils.midtrans import MidtransService
+from utils.reconciler import PendingPaymentReconciler
+
+pytestmark = pytest.mark.anyio
+
+COLLECTION = "test_orders"
+
+
+class FakeStatusApi:
+    """Midtrans status endpoint: order id -> transaction_status, 404 for unknown orders"""
+
+    def __init__(self, statuses: dict):
+        self.statuses = statuses
+        self.checked = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        order_id = request.url.path.split("/")[2]
+        self.checked.append(order_id)
+        if order_id not in self.statuses:
+            return httpx.Response(404, json={"status_code": "404", "status_message": "Transaction doesn't exist."})
+        return httpx.Response(200, json={
+            "order_id": order_id,
+            "transaction_status": self.statuses[order_id],
+            "status_code": "200"
+        })
+
+
+@pytest.fixture
+def status_api(monkeypatch):
+    api = FakeStatusApi({})
+    service = MidtransService(
+        server_key="SB-Mid-server-test",
+        api_base_url="http://midtrans.test",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(api))
+    )
+    monkeypatch.setattr(utils.reconciler, "get_midtrans_service", lambda: service)
+    return api
+
+
+@pytest.fixture
+def applied():
+    return []
+
+
+@pytest.fixture
+def reconciler(applied):
+    async def apply(status_response: dict):
+        applied.append((status_response["order_id"], status_response["transaction_status"]))
+
+    reconciler = PendingPaymentReconciler(base_delay=15, max_delay=900)
+    reconciler.register("test", COLLECTION, apply, max_age=timedelta(hours=1))
+    return reconciler
+
+
+async def insert_order(db, order_id: str, age: timedelta = timedelta(minutes=5), **fields):
+    await db[COLLECTION].insert_one({
+        "orderId": order_id,
+        "status": "pending",
+        "createdAt": datetime.utcnow() - age,
+        **fields
+    })
+
+
+class TestBackoff:
+    """Each claim pushes nextCheckAt out exponentially, up to max_delay"""
+
+    def test_next_delay_doubles_and_is_capped(self):
+        reconciler = PendingPaymentReconciler(base_delay=15, max_delay=900)
+
+        assert [reconciler.next_delay(attempts) for attempts in range(8)] == [15, 30, 60, 120, 240, 480, 900, 900]
+
+    async def test_claim_schedules_the_next_check_with_backoff(self, db, reconciler, status_api):
+        await insert_order(db, "A", reconcileAttempts=3, nextCheckAt=datetime.utcnow() - timedelta(seconds=1))
+
+        # BSON dates keep milliseconds
+        before = datetime.utcnow() - timedelta(milliseconds=1)
+        await reconciler.reconcile()
+
+        order = await db[COLLECTION].find_one({"orderId": "A"})
+        assert order["reconcileAttempts"] == 4
+        assert order["nextCheckAt"] >= before + timedelta(seconds=120)
+        assert order["nextCheckAt"] < before + timedelta(seconds=125)
+
+    async def test_orders_not_yet_due_are_left_alone(self, db, reconciler, status_api):
+        await insert_order(db, "A", nextCheckAt=datetime.utcnow() + timedelta(minutes=1))
+
+        assert await reconciler.reconcile() == 0
+        assert status_api.checked == []
+
+    async def test_claimed_order_is_not_checked_again_in_the_next_cycle(self, db, reconciler, status_api):
+        await insert_order(db, "A")
+
+        assert await reconciler.reconcile() == 1
+        assert await reconciler.reconcile() == 0
+        assert status_api.checked == ["A"]
+
+    async def test_only_pending_orders_are_claimed(self, db, reconciler, status_api):
+        await insert_order(db, "A", status="settlement")
+
+        assert await reconciler.reconcile() == 0
+
+
+class TestApply:
+    """Midtrans answers are applied through the source's apply function"""
+
+    async def test_status_is_applied(self, db, reconciler, status_api, applied):
+        status_api.statuses["A"] = "settlement"
+        await insert_order(db, "A")
+
+        await reconciler.reconcile()
+
+        assert applied == [("A", "settlement")]
+        assert reconciler.stats()["checks"] == 1
+
+    async def test_unknown_order_past_max_age_is_expired(self, db, reconciler, status_api, applied):
+        await insert_order(db, "A", age=timedelta(hours=2))
+
+        await reconciler.reconcile()
+
+        assert applied == [("A", "expire")]
+        assert reconciler.stats()["expired"] == 1
+
+    async def test_unknown_young_order_waits(self, db, reconciler, status_api, applied):
+        await insert_order(db, "A", age=timedelta(minutes=5))
+
+        await reconciler.reconcile()
+
+        assert applied == []
+        assert reconciler.stats()["errors"] == 0
+
+    async def test_unconfigured_midtrans_skips_the_cycle(self, db, reconciler, monkeypatch):
+        monkeypatch.setattr(utils.reconciler, "get_midtrans_service", lambda: MidtransService(server_key=""))
+        await insert_order(db, "A")
+
+        assert await reconciler.reconcile() == 0
+        order = await db[COLLECTION].find_one({"orderId": "A"})
+        assert "nextCheckAt" not in order
@@ -0,0 +1,178 @@
+"""
+WebhookInbox: idempotent accept, per-order ordering, retries
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.webhook_inbox import INBOX_COLLECTION, LEASE_COLLECTION, WebhookInbox
+
+pytestmark = pytest.mark.anyio
+
+SOURCE = "test-source"
+
+
+def notification(order_id: str, transaction_status: str, **extra) -> dict:
+    return {
+        "order_id": order_id,
+        "transaction_id": f"trx-{order_id}",
+        "transaction_status": transaction_status,
+        "status_code": "200",
+        **extra
+    }
+
+
+class Recorder:
+    """Inbox handler that records what it applied; fails for the statuses in fail_on"""
+
+    def __init__(self, fail_on=()):
+        self.applied = []
+        self.fail_on = set(fail_on)
+
+    async def __call__(self, payload: dict):
+        if payload["transaction_status"] in self.fail_on:
+            raise RuntimeError(f"cannot apply {payload['transaction_status']}")
+        self.applied.append((payload["order_id"], payload["transaction_status"]))
+
+
+def make_inbox(handler, max_attempts: int = 3) -> WebhookInbox:
+    inbox = WebhookInbox(max_attempts=max_attempts)
+    inbox.register(SOURCE, handler)
+    return inbox
+
+
+async def make_due(db, **query):
+    """Skip the retry backoff of matching entries"""
+    await db[INBOX_COLLECTION].update_many(
+        {"status": "pending", **query},
+        {"$set": {"nextAttemptAt": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+
+class TestAccept:
+    """Midtrans redeliveries collapse into one entry"""
+
+    async def test_redelivered_notification_is_stored_once(self, db):
+        inbox = make_inbox(Recorder())
+
+        assert await inbox.accept(SOURCE, notification("A", "pending")) is True
+        assert await inbox.accept(SOURCE, notification("A", "pending")) is False
+
+        assert await db[INBOX_COLLECTION].count_documents({}) == 1
+        assert inbox.stats()["duplicates"] == 1
+
+    async def test_new_status_of_the_same_order_is_a_new_entry(self, db):
+        inbox = make_inbox(Recorder())
+
+        await inbox.accept(SOURCE, notification("A", "pending"))
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+
+        assert await db[INBOX_COLLECTION].count_documents({"orderId": "A"}) == 2
+
+    async def test_same_payload_from_another_source_is_not_a_duplicate(self, db):
+        inbox = make_inbox(Recorder())
+
+        assert await inbox.accept(SOURCE, notification("A", "pending"))
+        assert await inbox.accept("other-source", notification("A", "pending"))
+
+    async def test_applied_entry_is_not_applied_again(self, db):
+        recorder = Recorder()
+        inbox = make_inbox(recorder)
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+
+        await inbox.drain()
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+        await inbox.drain()
+
+        assert recorder.applied == [("A", "settlement")]
+        entry = await db[INBOX_COLLECTION].find_one({"orderId": "A"})
+        assert entry["status"] == "done"
+        assert entry["processedAt"] is not None
+
+
+class TestOrdering:
+    """Entries of one order are applied in arrival order"""
+
+    async def test_entries_are_applied_in_arrival_order(self, db):
+        recorder = Recorder()
+        inbox = make_inbox(recorder)
+        for status in ("pending", "settlement"):
+            await inbox.accept(SOURCE, notification("A", status))
+        await inbox.accept(SOURCE, notification("B", "expire"))
+
+        await inbox.drain()
+
+        assert [status for order, status in recorder.applied if order == "A"] == ["pending", "settlement"]
+        assert ("B", "expire") in recorder.applied
+
+    async def test_failed_entry_blocks_later_entries_of_its_order_only(self, db):
+        recorder = Recorder(fail_on={"pending"})
+        inbox = make_inbox(recorder)
+        await inbox.accept(SOURCE, notification("A", "pending"))
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+        await inbox.accept(SOURCE, notification("B", "settlement"))
+
+        await inbox.drain()
+
+        assert recorder.applied == [("B", "settlement")]
+        failed = await db[INBOX_COLLECTION].find_one({"orderId": "A", "payload.transaction_status": "pending"})
+        assert failed["status"] == "pending"
+        assert failed["attempts"] == 1
+        assert failed["nextAttemptAt"] > datetime.utcnow()
+        assert "cannot apply pending" in failed["lastError"]
+
+    async def test_retried_entry_unblocks_the_rest_of_its_order(self, db):
+        recorder = Recorder(fail_on={"pending"})
+        inbox = make_inbox(recorder)
+        await inbox.accept(SOURCE, notification("A", "pending"))
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+        await inbox.drain()
+
+        recorder.fail_on.clear()
+        await make_due(db)
+        await inbox.drain()
+
+        assert recorder.applied == [("A", "pending"), ("A", "settlement")]
+
+    async def test_exhausted_entry_is_dead_lettered_and_stops_blocking(self, db):
+        recorder = Recorder(fail_on={"pending"})
+        inbox = make_inbox(recorder, max_attempts=2)
+        await inbox.accept(SOURCE, notification("A", "pending"))
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+
+        await inbox.drain()
+        await make_due(db)
+        await inbox.drain()
+
+        assert recorder.applied == [("A", "settlement")]
+        dead = await db[INBOX_COLLECTION].find_one({"payload.transaction_status": "pending"})
+        assert dead["status"] == "failed"
+        assert dead["attempts"] == 2
+
+    async def test_order_leased_by_another_consumer_is_skipped(self, db):
+        recorder = Recorder()
+        inbox = make_inbox(recorder)
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+        await db[LEASE_COLLECTION].insert_one({
+            "_id": f"{SOURCE}:A",
+            "owner": "another-worker",
+            "leaseUntil": datetime.utcnow() + timedelta(seconds=60)
+        })
+
+        await inbox.drain()
+        assert recorder.applied == []
+
+        await db[LEASE_COLLECTION].update_one(
+            {"_id": f"{SOURCE}:A"},
+            {"$set": {"leaseUntil": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        await inbox.drain()
+        assert recorder.applied == [("A", "settlement")]
+
+    async def test_lease_is_released_after_processing(self, db):
+        inbox = make_inbox(Recorder())
+        await inbox.accept(SOURCE, notification("A", "settlement"))
+
+        await inbox.drain()
+
+        assert await db[LEASE_COLLECTION].count_documents({}) == 0
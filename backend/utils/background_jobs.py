@@ -0,0 +1,55 @@
+from typing import Awaitable, Callable, Dict, Hashable
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BackgroundJobs:
+    """
+    In-process fire-and-forget jobs with bounded concurrency.
+
+    Jobs are keyed, so scheduling a key that is already queued or running
+    is a no-op. Nothing is persisted: callers record their own status on
+    the document the job is about, and re-schedule jobs whose status has
+    gone stale (e.g. after a restart).
+    """
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+
+    def schedule(self, key: Hashable, job: Callable[[], Awaitable[None]]) -> asyncio.Task:
+        task = self._tasks.get(key)
+        if task is not None:
+            return task
+        task = asyncio.create_task(self._run(key, job), name=f"{self.name}:{key}")
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    async def _run(self, key: Hashable, job: Callable[[], Awaitable[None]]) -> None:
+        async with self._semaphore:
+            try:
+                await job()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Background job {self.name}:{key} failed: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "maxConcurrency": self.max_concurrency,
+            "scheduled": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
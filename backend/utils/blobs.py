@@ -0,0 +1,238 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from database import get_db
+from fastapi import UploadFile
+from pathlib import Path
+from pymongo import IndexModel, UpdateOne, ASCENDING
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Optional, Tuple
+from utils.images import image_pipeline
+from utils.indexes import declare_indexes
+from utils.uploads import MAX_UPLOAD_SIZE, StoredUpload, receive_upload
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+BLOBS_COLLECTION = "upload_blobs"
+
+declare_indexes(
+    BLOBS_COLLECTION,
+    IndexModel([("sha256", ASCENDING)], name="sha256_1"),
+    IndexModel([("refs", ASCENDING), ("lastUploadedAt", ASCENDING)], name="refs_1_lastUploadedAt_1"),
+)
+
+def _place(temp_path: Path, final_path: Path) -> bool:
+    """Move a received upload into place; returns False when identical content already exists"""
+    if final_path.exists():
+        temp_path.unlink(missing_ok=True)
+        return False
+    os.replace(temp_path, final_path)
+    return True
+
+class BlobStore:
+    """
+    Content-addressed upload storage with reference counting.
+
+    Uploads are stored as {directory}/{sha256}.{ext}, so uploading the same
+    file twice reuses the existing copy and its image variants. Every stored
+    file has a document in upload_blobs (_id = public URL) with a refs count.
+
+    Route modules declare the fields that hold upload URLs with track().
+    refs is recounted from those fields: for the affected URLs when a
+    handler calls refresh() after adding or dropping a reference, and for
+    every blob by the periodic collect() pass. collect() then deletes blobs
+    that have had no references for longer than grace_period, together
+    with their image variants. The grace period covers uploads whose URL
+    is only saved on a document later (e.g. product images).
+
+    save() and the deletion in collect() hold a per-URL lock, so a blob is
+    either deleted together with its file before an upload of the same
+    content records it again, or not deleted at all.
+    """
+
+    def __init__(self, grace_period: float = 86400.0, gc_interval: float = 3600.0, batch_size: int = 500):
+        self.grace_period = grace_period
+        self.gc_interval = gc_interval
+        self.batch_size = batch_size
+        self._references: List[Tuple[str, str]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self.stored = 0
+        self.deduplicated = 0
+        self.collected = 0
+        self.last_collect: Optional[dict] = None
+
+    @property
+    def db(self):
+        return get_db()
+
+    @asynccontextmanager
+    async def _locked(self, url: str):
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        self._lock_users[url] = self._lock_users.get(url, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[url] -= 1
+            if not self._lock_users[url]:
+                del self._lock_users[url]
+                del self._locks[url]
+
+    def track(self, collection: str, *fields: str) -> None:
+        """Declare fields (dotted paths may cross arrays) that hold upload URLs"""
+        for field in fields:
+            if (collection, field) not in self._references:
+                self._references.append((collection, field))
+
+    async def save(
+        self,
+        file: UploadFile,
+        directory: Path,
+        url_prefix: str,
+        extension: str,
+        max_size: int = MAX_UPLOAD_SIZE
+    ) -> StoredUpload:
+        stored = await receive_upload(file, directory, max_size)
+        filename = f"{stored.sha256}.{extension}"
+        url = f"{url_prefix}/{filename}"
+        now = datetime.utcnow()
+        try:
+            async with self._locked(url):
+                await self.db[BLOBS_COLLECTION].update_one(
+                    {"_id": url},
+                    {
+                        "$set": {"lastUploadedAt": now},
+                        "$setOnInsert": {
+                            "sha256": stored.sha256,
+                            "path": str(directory / filename),
+                            "size": stored.size,
+                            "contentType": stored.content_type,
+                            "refs": 0,
+                            "createdAt": now
+                        }
+                    },
+                    upsert=True
+                )
+                placed = await run_in_threadpool(_place, stored.path, directory / filename)
+        except BaseException:
+            stored.path.unlink(missing_ok=True)
+            raise
+
+        if placed:
+            self.stored += 1
+        else:
+            self.deduplicated += 1
+        stored.path = directory / filename
+        stored.filename = filename
+        stored.url = url
+        return stored
+
+    async def count_refs(self, urls: List[str]) -> Dict[str, int]:
+        counts = {url: 0 for url in urls}
+        for collection, field in self._references:
+            pipeline = [
+                {"$match": {field: {"$in": urls}}},
+                {"$project": {"_id": 0, "url": f"${field}"}},
+                {"$unwind": "$url"},
+                {"$match": {"url": {"$in": urls}}},
+                {"$group": {"_id": "$url", "count": {"$sum": 1}}}
+            ]
+            async for group in self.db[collection].aggregate(pipeline):
+                counts[group["_id"]] += group["count"]
+        return counts
+
+    async def _recount(self, urls: List[str]) -> Dict[str, int]:
+        counts = await self.count_refs(urls)
+        await self.db[BLOBS_COLLECTION].bulk_write(
+            [UpdateOne({"_id": url}, {"$set": {"refs": refs}}) for url, refs in counts.items()],
+            ordered=False
+        )
+        return counts
+
+    async def refresh(self, *urls: Optional[str]) -> None:
+        """Recount the references of URLs a handler just started or stopped using"""
+        urls = [url for url in set(urls) if url]
+        if not urls:
+            return
+        try:
+            await self._recount(urls)
+        except Exception as e:
+            # collect() recounts everything anyway
+            logger.error(f"Refreshing upload references failed: {str(e)}")
+
+    async def collect(self) -> dict:
+        """Recount every blob, then delete the ones unreferenced for longer than the grace period"""
+        blobs = self.db[BLOBS_COLLECTION]
+        batch: List[str] = []
+        recounted = 0
+        async for blob in blobs.find({}, {"_id": 1}):
+            batch.append(blob["_id"])
+            if len(batch) >= self.batch_size:
+                await self._recount(batch)
+                recounted += len(batch)
+                batch = []
+        if batch:
+            await self._recount(batch)
+            recounted += len(batch)
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_period)
+        orphans = await blobs.find({"refs": 0, "lastUploadedAt": {"$lt": cutoff}}).to_list(None)
+        deleted = 0
+        for blob in orphans:
+            # A document may have picked the URL up since the recount
+            if (await self.count_refs([blob["_id"]]))[blob["_id"]]:
+                continue
+            async with self._locked(blob["_id"]):
+                # lastUploadedAt changes when the same content is uploaded again
+                result = await blobs.delete_one(
+                    {"_id": blob["_id"], "refs": 0, "lastUploadedAt": blob["lastUploadedAt"]}
+                )
+                if not result.deleted_count:
+                    continue
+                path = Path(blob["path"])
+                await run_in_threadpool(path.unlink, missing_ok=True)
+                await image_pipeline.discard(blob["_id"], path.parent)
+            deleted += 1
+
+        self.collected += deleted
+        self.last_collect = {"at": datetime.utcnow(), "recounted": recounted, "deleted": deleted}
+        return self.last_collect
+
+    def stats(self) -> dict:
+        return {
+            "trackedFields": len(self._references),
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "collected": self.collected,
+            "lastCollect": self.last_collect
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="upload-blob-gc")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.error(f"Upload garbage collection failed: {str(e)}")
+
+blob_store = BlobStore(
+    grace_period=float(os.environ.get("UPLOAD_GC_GRACE_SECONDS", "86400")),
+    gc_interval=float(os.environ.get("UPLOAD_GC_INTERVAL", "3600"))
+)
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import os
+import time
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    In-process LRU cache with per-key TTLs.
+    Writers call invalidate()/invalidate_prefix() after changing the data.
+    """
+
+    def __init__(self, name: str, maxsize: int = 512, default_ttl: float = 300):
+        self.name = name
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _caches[name] = self
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        for key in [k for k in self._data if k.startswith(prefix)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """Return the cached value or load it once, even under concurrent misses"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                entry = self._data.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+                value = await loader()
+                self.set(key, value, ttl)
+                return value
+        finally:
+            if not lock.locked():
+                self._locks.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+_caches: Dict[str, TTLCache] = {}
+
+def get_cache_stats() -> Dict[str, dict]:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+# Public, anonymous read endpoints (homepage content, banners, settings).
+# Admin writes invalidate explicitly; the TTL only bounds staleness across workers.
+public_cache = TTLCache(
+    "public",
+    maxsize=int(os.environ.get("PUBLIC_CACHE_SIZE", "256")),
+    default_ttl=float(os.environ.get("PUBLIC_CACHE_TTL", "300"))
+)
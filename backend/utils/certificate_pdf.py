@@ -0,0 +1,546 @@
+# Certificate drawing: plain dicts in, PDF bytes out. These run in the
+# render process pool (utils.pdf_renderer), whose workers import this
+# module, so keep it free of database and FastAPI imports.
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from typing import Optional, Tuple
+
+# Part of every rendered-PDF cache key; bump it when the drawing code changes
+LAYOUT_VERSION = 1
+
+PUBLIC_ROOT = Path("/app/frontend/public")
+
+# Template versions kept per worker; old ones are only needed until renders catch up
+TEMPLATE_ASSET_CACHE_SIZE = 4
+
+RGB = Tuple[float, float, float]
+
+@lru_cache(maxsize=64)
+def hex_to_rgb(hex_color: str) -> RGB:
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4))
+
+@dataclass
+class TemplateAssets:
+    """Decoded images and colours of one template version"""
+    background: Optional[ImageReader]
+    logo: Optional[ImageReader]
+    signature: Optional[ImageReader]
+    accent_rgb: RGB
+    text_rgb: RGB
+
+_template_assets: "OrderedDict[tuple, TemplateAssets]" = OrderedDict()
+
+def _load_image(url: Optional[str]) -> Optional[ImageReader]:
+    if not url:
+        return None
+    try:
+        path = PUBLIC_ROOT / url.lstrip("/")
+        if not path.exists():
+            return None
+        reader = ImageReader(str(path))
+        # Decode now rather than on the first drawImage of every render
+        reader.getSize()
+        reader.getRGBData()
+        return reader
+    except Exception:
+        return None
+
+def template_assets(template: dict) -> TemplateAssets:
+    """
+    Per-process cache of a template's decoded images and colours, keyed by
+    template version and the asset URLs (which are content-addressed).
+    """
+    key = (
+        template.get("version", 0),
+        template.get("backgroundUrl"),
+        template.get("logoUrl"),
+        template.get("signatureUrl"),
+        template.get("accentColor", "#FFD700"),
+        template.get("textColor", "#000000")
+    )
+    assets = _template_assets.get(key)
+    if assets is not None:
+        _template_assets.move_to_end(key)
+        return assets
+
+    assets = TemplateAssets(
+        background=_load_image(template.get("backgroundUrl")),
+        logo=_load_image(template.get("logoUrl")),
+        signature=_load_image(template.get("signatureUrl")),
+        accent_rgb=hex_to_rgb(template.get("accentColor", "#FFD700")),
+        text_rgb=hex_to_rgb(template.get("textColor", "#000000"))
+    )
+    _template_assets[key] = assets
+    while len(_template_assets) > TEMPLATE_ASSET_CACHE_SIZE:
+        _template_assets.popitem(last=False)
+    return assets
+
+def warm_template_assets(template: dict) -> int:
+    """Pool initializer / warm-up job: load a template's assets into this worker"""
+    try:
+        assets = template_assets(template)
+    except Exception:
+        # An initializer that raises breaks the pool; the render reports the error instead
+        return 0
+    return sum(image is not None for image in (assets.background, assets.logo, assets.signature))
+
+def generate_certificate_pdf(certificate: dict, template: dict) -> bytes:
+    """
+    Generate PDF certificate
+    """
+    buffer = BytesIO()
+    
+    # Create landscape A4 PDF
+    page_width, page_height = landscape(A4)
+    c = canvas.Canvas(buffer, pagesize=landscape(A4))
+    
+    # Colors and images from template
+    assets = template_assets(template)
+    accent_rgb = assets.accent_rgb
+    text_rgb = assets.text_rgb
+    
+    # Background
+    background_url = template.get("backgroundUrl")
+    if background_url:
+        if assets.background:
+            c.drawImage(assets.background, 0, 0, width=page_width, height=page_height)
+    else:
+        # Default elegant background
+        c.setFillColorRGB(0.98, 0.98, 0.95)
+        c.rect(0, 0, page_width, page_height, fill=1)
+        
+        # Border
+        c.setStrokeColorRGB(*accent_rgb)
+        c.setLineWidth(3)
+        c.rect(30, 30, page_width - 60, page_height - 60, stroke=1, fill=0)
+        
+        # Inner border
+        c.setLineWidth(1)
+        c.rect(40, 40, page_width - 80, page_height - 80, stroke=1, fill=0)
+    
+    # Logo
+    if assets.logo:
+        c.drawImage(assets.logo, page_width/2 - 40, page_height - 120, width=80, height=80, preserveAspectRatio=True)
+    
+    # Title
+    title_text = template.get("titleText", "SERTIFIKAT")
+    c.setFillColorRGB(*accent_rgb)
+    c.setFont("Helvetica-Bold", 48)
+    c.drawCentredString(page_width/2, page_height - 160, title_text)
+    
+    # Subtitle
+    subtitle_text = template.get("subtitleText", "Diberikan kepada")
+    c.setFillColorRGB(*text_rgb)
+    c.setFont("Helvetica", 18)
+    c.drawCentredString(page_width/2, page_height - 200, subtitle_text)
+    
+    # Recipient Name
+    recipient_name = certificate.get("userName", "")
+    c.setFillColorRGB(*text_rgb)
+    c.setFont("Helvetica-Bold", 36)
+    c.drawCentredString(page_width/2, page_height - 260, recipient_name)
+    
+    # Decorative line under name
+    c.setStrokeColorRGB(*accent_rgb)
+    c.setLineWidth(2)
+    name_width = c.stringWidth(recipient_name, "Helvetica-Bold", 36)
+    c.line(page_width/2 - name_width/2 - 20, page_height - 275, 
+           page_width/2 + name_width/2 + 20, page_height - 275)
+    
+    # Completion text
+    completion_text = template.get("completionText", "Telah berhasil menyelesaikan")
+    c.setFillColorRGB(*text_rgb)
+    c.setFont("Helvetica", 16)
+    c.drawCentredString(page_width/2, page_height - 310, completion_text)
+    
+    # Course name
+    course_name = certificate.get("courseName", "")
+    c.setFont("Helvetica-Bold", 24)
+    c.drawCentredString(page_width/2, page_height - 350, course_name)
+    
+    # Date
+    completion_date = certificate.get("completionDate", "")
+    if completion_date:
+        c.setFont("Helvetica", 14)
+        c.drawCentredString(page_width/2, page_height - 390, f"Pada tanggal: {completion_date}")
+    
+    # Certificate number
+    cert_number = certificate.get("certificateNumber", "")
+    c.setFont("Helvetica", 12)
+    c.setFillColorRGB(0.5, 0.5, 0.5)
+    c.drawCentredString(page_width/2, 80, f"No. Sertifikat: {cert_number}")
+    
+    # Signature section
+    signer_name = template.get("signerName", "Director NEWME CLASS")
+    signer_title = template.get("signerTitle", "Direktur")
+    
+    # Signature image
+    if assets.signature:
+        c.drawImage(assets.signature, page_width/2 - 50, 120, width=100, height=50, preserveAspectRatio=True)
+    
+    # Signature line
+    c.setStrokeColorRGB(*text_rgb)
+    c.setLineWidth(1)
+    c.line(page_width/2 - 80, 115, page_width/2 + 80, 115)
+    
+    # Signer info
+    c.setFillColorRGB(*text_rgb)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(page_width/2, 95, signer_name)
+    c.setFont("Helvetica", 12)
+    c.drawCentredString(page_width/2, 75, signer_title)
+    
+    c.save()
+    return buffer.getvalue()
+
+
+def generate_ai_certificate_pdf(
+    user: dict,
+    ai_analysis: dict,
+    template: dict,
+    issued_at: Optional[datetime] = None
+) -> bytes:
+    """
+    Generate PDF certificate dengan layout seperti template NEWME CLASS
+    Termasuk 5 Element, Kepribadian, Kekuatan Jatidiri, dll
+    """
+    issued_at = issued_at or datetime.utcnow()
+    buffer = BytesIO()
+    
+    page_width, page_height = landscape(A4)
+    c = canvas.Canvas(buffer, pagesize=landscape(A4))
+    
+    # Colors
+    gold_rgb = (0.85, 0.65, 0.13)  # Gold/Yellow
+    black_rgb = (0, 0, 0)
+    gray_rgb = (0.3, 0.3, 0.3)
+    
+    def draw_wrapped_text(c, text, x, y, max_width, font_name, font_size, line_height=None):
+        """Helper to draw wrapped text"""
+        if line_height is None:
+            line_height = font_size + 2
+        c.setFont(font_name, font_size)
+        words = text.split()
+        lines = []
+        current_line = ""
+        for word in words:
+            test_line = current_line + " " + word if current_line else word
+            if c.stringWidth(test_line, font_name, font_size) < max_width:
+                current_line = test_line
+            else:
+                lines.append(current_line)
+                current_line = word
+        if current_line:
+            lines.append(current_line)
+        
+        for line in lines:
+            c.drawString(x, y, line)
+            y -= line_height
+        return y
+    
+    # ========== PAGE 1: Main Certificate ==========
+    # Background
+    c.setFillColorRGB(1, 1, 0.95)  # Light cream
+    c.rect(0, 0, page_width, page_height, fill=1)
+    
+    # Gold gradient-like border (top and bottom)
+    c.setFillColorRGB(*gold_rgb)
+    c.rect(0, page_height - 25, page_width, 25, fill=1)
+    c.rect(0, 0, page_width, 25, fill=1)
+    
+    # Inner border
+    c.setStrokeColorRGB(*gold_rgb)
+    c.setLineWidth(2)
+    c.rect(15, 35, page_width - 30, page_height - 70, stroke=1, fill=0)
+    
+    # Logo placeholder (left side)
+    c.setFillColorRGB(*gold_rgb)
+    c.setFont("Helvetica-Bold", 24)
+    c.drawString(40, page_height - 80, "NEWME")
+    c.setFont("Helvetica", 10)
+    c.drawString(40, page_height - 95, "CLASS")
+    c.setFont("Helvetica-Oblique", 8)
+    c.drawString(40, page_height - 108, "Jatidirimu di Sini")
+    
+    # Title Section (right side)
+    c.setFillColorRGB(*black_rgb)
+    c.setFont("Helvetica-Bold", 36)
+    c.drawRightString(page_width - 40, page_height - 70, "SERTIFIKAT")
+    c.setFont("Helvetica", 12)
+    c.drawRightString(page_width - 40, page_height - 88, "ANALISA KEPRIBADIAN & JATIDIRI")
+    
+    # Certificate number
+    cert_number = f"1-{issued_at.strftime('%m.%d')}-{str(user.get('_id', ''))[-6:]}"
+    c.setFont("Helvetica", 10)
+    c.drawRightString(page_width - 40, page_height - 105, cert_number)
+    
+    # Sub header
+    c.setFont("Helvetica", 11)
+    c.drawCentredString(page_width/2, page_height - 130, "OPTIMALKAN VERSI TERBAIK_MU")
+    
+    # User Name (large, centered)
+    recipient_name = user.get("fullName", "Pengguna")
+    c.setFont("Helvetica-Bold", 28)
+    c.drawCentredString(page_width/2, page_height - 165, recipient_name)
+    
+    # Dominant Type
+    dominant_type = ai_analysis.get("dominantType", "DOMINAN")
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(page_width/2, page_height - 190, f"- {dominant_type} -")
+    
+    # Personality Type and Element (two columns)
+    personality_type = ai_analysis.get("personalityType", "AMBIVERT")
+    dominant_element = ai_analysis.get("dominantElement", "AIR")
+    element_scores = ai_analysis.get("elementScores", {})
+    
+    # Get dominant element percentage
+    dominant_pct = 0
+    dominant_label = "SI ADAPTIF"
+    if dominant_element in element_scores:
+        dominant_pct = element_scores[dominant_element].get("percentage", 0)
+        dominant_label = element_scores[dominant_element].get("label", "SI ADAPTIF")
+    
+    # Left column header: Kepribadian
+    c.setFont("Helvetica", 10)
+    c.drawString(60, page_height - 215, "Kepribadian:")
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(60, page_height - 235, f"{personality_type} (#)")
+    
+    # Right column header: Simbol Karakter
+    c.drawString(page_width/2 + 50, page_height - 215, "Simbol Karakter:")
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(page_width/2 + 50, page_height - 235, f"{dominant_element} ({dominant_label})")
+    c.setFont("Helvetica", 12)
+    c.drawString(page_width/2 + 50, page_height - 252, f"{dominant_pct:.2f} %")
+    
+    # Symbol display (like -aA-)
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(page_width/2, page_height - 275, f"- {personality_type[0].lower()}{dominant_element[0].upper()} -")
+    
+    # ========== Three Column Layout ==========
+    col_width = (page_width - 100) / 3
+    col1_x = 50
+    col2_x = 50 + col_width + 15
+    col3_x = 50 + (col_width + 15) * 2
+    y_start = page_height - 310
+    
+    # Column 1: KEPRIBADIAN
+    c.setFillColorRGB(*black_rgb)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(col1_x, y_start, "KEPRIBADIAN:")
+    
+    kepribadian = ai_analysis.get("kepribadian", ["Responsif", "Investigatif", "Aktif", "Peka", "Sensitif"])
+    y = y_start - 15
+    c.setFont("Helvetica", 8)
+    for trait in kepribadian[:8]:
+        c.drawString(col1_x + 5, y, trait)
+        y -= 11
+    
+    # CIRI KHAS section
+    y -= 10
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(col1_x, y, "CIRI KHAS:")
+    y -= 15
+    c.setFont("Helvetica", 8)
+    ciri_khas = ai_analysis.get("ciriKhas", ["Penampil", "Entertainer", "Kulineran", "BB Stabil"])
+    for ciri in ciri_khas[:6]:
+        c.drawString(col1_x + 5, y, ciri)
+        y -= 11
+    
+    # KARAKTER section
+    y -= 10
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(col1_x, y, "(+/-) KARAKTER:")
+    y -= 15
+    c.setFont("Helvetica", 8)
+    c.drawString(col1_x + 5, y, f"{dominant_element}/TENANG")
+    y -= 11
+    karakter = ai_analysis.get("karakter", ["Pengamat", "Performer", "Investigator"])
+    for kar in karakter[:5]:
+        c.drawString(col1_x + 5, y, kar)
+        y -= 11
+    
+    # Column 2: Kekuatan JATIDIRI
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(col2_x, y_start, "Kekuatan JATIDIRI")
+    
+    kekuatan = ai_analysis.get("kekuatanJatidiri", {})
+    y = y_start - 15
+    c.setFont("Helvetica", 8)
+    
+    jatidiri_items = [
+        ("1- Kehidupan:", kekuatan.get("kehidupan", "RELA BERKORBAN")),
+        ("2- Kesehatan:", kekuatan.get("kesehatan", "JANTUNG")),
+        ("3- Kontribusi:", kekuatan.get("kontribusi", "PERDAMAIAN")),
+        ("4- Kekhasan:", kekuatan.get("kekhasan", "TATAPAN")),
+        ("5- Kharisma:", kekuatan.get("kharisma", "SENYUMAN")),
+    ]
+    
+    for label, value in jatidiri_items:
+        c.drawString(col2_x, y, f"{label} {value}")
+        y -= 12
+    
+    # Kompilasi ADAPTASI
+    y -= 10
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(col2_x, y, "Kompilasi ADAPTASI")
+    y -= 15
+    c.setFont("Helvetica", 7)
+    
+    kompilasi = ai_analysis.get("kompilasiAdaptasi", [
+        "Belajar: Merangkum", "Bekerja: Bebas dalam aturan", "Kalibrasi: Ganti Suasana",
+        "Daya Raga: Refleks Emosi", "Memimpin: Org. Swadaya/Seni", "Jalur Bisnis: Pemodal",
+        "Pendukung Karir: Serba Bisa", "Keahlian: Mendaramaikan", "Karya: Inspirator Kemanusiaan"
+    ])
+    
+    for i, item in enumerate(kompilasi[:15], 1):
+        c.drawString(col2_x, y, f"{i}- {item}")
+        y -= 10
+    
+    # Column 3: Orientasi / Other Elements
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(col3_x, y_start, "Orientasi")
+    c.setFont("Helvetica", 9)
+    c.drawString(col3_x, y_start - 15, "Kamu yang lain:")
+    
+    y = y_start - 35
+    # Show other elements with percentages
+    for element, data in element_scores.items():
+        if element != dominant_element:
+            pct = data.get("percentage", 0)
+            label = data.get("label", "")
+            c.setFont("Helvetica-Bold", 11)
+            c.drawString(col3_x, y, element)
+            c.setFont("Helvetica", 9)
+            c.drawString(col3_x + 50, y, f"({label})")
+            c.drawString(col3_x, y - 12, f"{pct:.2f} %")
+            y -= 35
+    
+    # Footer with quote
+    y -= 20
+    c.setFont("Helvetica-Oblique", 8)
+    quote = f'"JATIDIRI {dominant_type.lower()}_mu,'
+    c.drawString(col3_x, y, quote)
+    c.drawString(col3_x, y - 10, 'adalah versi TERBAIK_mu"')
+    
+    # Bottom footer
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(col3_x, 60, "NEW ME CLASS")
+    c.setFont("Helvetica", 8)
+    c.drawString(col3_x, 48, "- Jatidirimu di Sini -")
+    
+    # Contact info
+    c.setFont("Helvetica", 8)
+    c.drawRightString(page_width - 40, 50, "0895.0267.1691")
+    
+    # Note at bottom left
+    c.setFont("Helvetica-Oblique", 7)
+    c.drawString(50, 45, "Catt: Point positif only, negatif by private.")
+    
+    # ========== PAGE 2: Detailed Analysis ==========
+    c.showPage()
+    
+    # Background
+    c.setFillColorRGB(1, 1, 0.97)
+    c.rect(0, 0, page_width, page_height, fill=1)
+    
+    # Header bars
+    c.setFillColorRGB(*gold_rgb)
+    c.rect(0, page_height - 20, page_width, 20, fill=1)
+    c.rect(0, 0, page_width, 20, fill=1)
+    
+    # Border
+    c.setStrokeColorRGB(*gold_rgb)
+    c.setLineWidth(1)
+    c.rect(15, 25, page_width - 30, page_height - 50, stroke=1, fill=0)
+    
+    # Title
+    c.setFillColorRGB(*black_rgb)
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(page_width/2, page_height - 50, "LAPORAN ANALISIS AI")
+    c.setFont("Helvetica", 11)
+    c.drawCentredString(page_width/2, page_height - 68, f"Untuk: {recipient_name}")
+    
+    # Two column layout
+    col_width = (page_width - 100) / 2
+    col1_x = 50
+    col2_x = page_width/2 + 20
+    y_start = page_height - 100
+    
+    # Left Column
+    c.setFillColorRGB(*gold_rgb)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(col1_x, y_start, "KEKUATAN ANDA")
+    
+    y = y_start - 20
+    c.setFillColorRGB(*black_rgb)
+    c.setFont("Helvetica", 9)
+    for strength in ai_analysis.get("strengths", [])[:6]:
+        c.drawString(col1_x + 10, y, f"• {strength[:55]}")
+        y -= 14
+    
+    y -= 15
+    c.setFillColorRGB(*gold_rgb)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(col1_x, y, "AREA PENGEMBANGAN")
+    y -= 20
+    c.setFillColorRGB(*black_rgb)
+    c.setFont("Helvetica", 9)
+    for area in ai_analysis.get("areasToImprove", [])[:5]:
+        c.drawString(col1_x + 10, y, f"• {area[:55]}")
+        y -= 14
+    
+    # Right Column
+    y = y_start
+    c.setFillColorRGB(*gold_rgb)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(col2_x, y, "REKOMENDASI KARIR")
+    y -= 20
+    c.setFillColorRGB(*black_rgb)
+    c.setFont("Helvetica", 9)
+    for career in ai_analysis.get("careerRecommendations", [])[:7]:
+        c.drawString(col2_x + 10, y, f"• {career[:45]}")
+        y -= 14
+    
+    y -= 15
+    c.setFillColorRGB(*gold_rgb)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(col2_x, y, "TIPS PENGEMBANGAN")
+    y -= 20
+    c.setFillColorRGB(*black_rgb)
+    c.setFont("Helvetica", 9)
+    for i, tip in enumerate(ai_analysis.get("tips", [])[:6], 1):
+        c.drawString(col2_x + 10, y, f"{i}. {tip[:50]}")
+        y -= 14
+    
+    # Summary box at bottom
+    summary = ai_analysis.get("summary", "")
+    if summary:
+        y = 120
+        c.setFillColorRGB(0.95, 0.95, 0.90)
+        c.rect(50, 50, page_width - 100, 70, fill=1)
+        c.setStrokeColorRGB(*gold_rgb)
+        c.rect(50, 50, page_width - 100, 70, stroke=1, fill=0)
+        
+        c.setFillColorRGB(*black_rgb)
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(60, 105, "RINGKASAN:")
+        c.setFont("Helvetica", 9)
+        draw_wrapped_text(c, summary, 60, 90, page_width - 130, "Helvetica", 9, 12)
+    
+    # Footer
+    c.setFillColorRGB(0.5, 0.5, 0.5)
+    c.setFont("Helvetica", 7)
+    c.drawCentredString(page_width/2, 35, "Sertifikat ini dihasilkan berdasarkan analisis AI dari jawaban test kepribadian Anda.")
+    c.drawCentredString(page_width/2, 25, f"© NEWME CLASS - Jatidirimu di Sini | Diterbitkan: {issued_at.strftime('%d %B %Y')}")
+    
+    c.save()
+    return buffer.getvalue()
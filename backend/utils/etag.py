@@ -0,0 +1,29 @@
+from fastapi import Request, Response
+from utils.responses import dumps
+from typing import Any, Optional
+import hashlib
+
+def compute_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+def etag_response(request: Request, content: Any, cache_control: str = "no-cache") -> Response:
+    """
+    JSON response with a content-hash ETag.
+    Returns 304 Not Modified when the client already holds this exact body.
+    """
+    body = dumps(content)
+    etag = compute_etag(body)
+    # "no-cache" lets browsers and CDNs store the body but revalidate every time
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,157 @@
+from typing import Dict, Optional
+import httpx
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class LatencyHistogram:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float, error: bool = False) -> None:
+        index = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.requests += 1
+            self.errors += 1 if error else 0
+            self.total_ms += duration_ms
+            self.max_ms = max(self.max_ms, duration_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            buckets = {f"le{bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)}
+            buckets["inf"] = self.counts[-1]
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "avgMs": round(self.total_ms / self.requests, 2) if self.requests else 0.0,
+                "maxMs": round(self.max_ms, 2),
+                "buckets": buckets
+            }
+
+class _TimedTransport(httpx.AsyncBaseTransport):
+    """Records time-to-response-headers per upstream host"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, registry: "HttpClientRegistry"):
+        self._transport = transport
+        self._registry = registry
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        histogram = self._registry.histogram(request.url.host)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            histogram.observe((time.perf_counter() - started) * 1000, error=True)
+            raise
+        histogram.observe((time.perf_counter() - started) * 1000, error=response.status_code >= 500)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+class HttpClientRegistry:
+    """
+    Application-scoped outbound HTTP clients, one pooled httpx.AsyncClient per
+    upstream. Modules declare their upstream with configure() at import time;
+    the app lifespan opens the clients on startup and closes them on shutdown.
+    """
+
+    def __init__(self):
+        self._options: Dict[str, dict] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        name: str,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: Optional[bool] = None
+    ) -> None:
+        self._options[name] = {
+            "timeout": timeout,
+            "connect_timeout": connect_timeout,
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+            "http2": HTTP2_AVAILABLE if http2 is None else (http2 and HTTP2_AVAILABLE)
+        }
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        options = self._options.get(name)
+        if options is None:
+            self.configure(name)
+            options = self._options[name]
+        transport = httpx.AsyncHTTPTransport(
+            http2=options["http2"],
+            limits=httpx.Limits(
+                max_connections=options["max_connections"],
+                max_keepalive_connections=options["max_keepalive_connections"],
+                keepalive_expiry=options["keepalive_expiry"]
+            )
+        )
+        return httpx.AsyncClient(
+            transport=_TimedTransport(transport, self),
+            timeout=httpx.Timeout(options["timeout"], connect=options["connect_timeout"])
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Borrow the shared client for an upstream; never close it yourself"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self._clients[name] = client
+        return client
+
+    def histogram(self, host: str) -> LatencyHistogram:
+        histogram = self._histograms.get(host)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(host, LatencyHistogram())
+        return histogram
+
+    def open(self) -> None:
+        for name in self._options:
+            self.get(name)
+        logger.info(f"Outbound HTTP clients ready: {', '.join(self._options) or 'none'} (http2={HTTP2_AVAILABLE})")
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "clients": {
+                name: {**options, "open": name in self._clients}
+                for name, options in self._options.items()
+            },
+            "upstreams": {host: histogram.snapshot() for host, histogram in self._histograms.items()}
+        }
+
+http_clients = HttpClientRegistry()
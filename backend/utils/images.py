@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import get_db
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+import os
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional; uploads are then served as-is
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_COLLECTION = "image_variants"
+
+# Variant name -> maximum width in pixels
+VARIANT_WIDTHS = (("thumb", 320), ("mobile", 768), ("desktop", 1600))
+
+# Animated GIFs and vector images are left alone
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+ENCODER_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 60},
+}
+
+OnReady = Callable[[str, dict], Awaitable[None]]
+
+def _available_formats() -> List[str]:
+    if Image is None:
+        return []
+    return [fmt for fmt in ("avif", "webp") if features.check(fmt)]
+
+def variant_filename(stem: str, variant: str, fmt: str) -> str:
+    return f"{stem}-{variant}.{fmt}"
+
+def _render_variants(source: Path, formats: List[str]) -> dict:
+    """Resize and encode every variant; runs in the pipeline's worker threads"""
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA", "P") else "RGB")
+        width, height = image.size
+
+        rendered = []
+        seen_widths: Set[int] = set()
+        for variant, max_width in VARIANT_WIDTHS:
+            target = min(max_width, width)
+            if target in seen_widths:
+                # Source is narrower than this variant; the previous one already covers it
+                continue
+            seen_widths.add(target)
+            resized = image if target == width else image.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS
+            )
+            for fmt in formats:
+                filename = variant_filename(source.stem, variant, fmt)
+                temp_path = source.parent / f".{filename}.part"
+                resized.save(temp_path, **ENCODER_OPTIONS[fmt])
+                os.replace(temp_path, source.parent / filename)
+                rendered.append({"variant": variant, "format": fmt, "width": target, "filename": filename})
+
+    return {"width": width, "height": height, "variants": rendered}
+
+class ImagePipeline:
+    """
+    Generates resized WebP (and AVIF where Pillow supports it) variants of
+    uploaded images off the request path.
+
+    Handlers call schedule() after saving an upload. The variants are
+    written next to the original with deterministic names
+    ({stem}-{thumb|mobile|desktop}.{fmt}) and a manifest with ready-made
+    srcset strings is stored in image_variants, keyed by the original URL.
+    Route modules register on_ready callbacks that copy the srcset onto
+    the documents that reference that URL.
+
+    Resizing and encoding run in a small thread pool: Pillow releases the
+    GIL for both, so this stays off the event loop without process overhead.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.formats = _available_formats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-variants")
+        self._callbacks: List[OnReady] = []
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.generated = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.formats)
+
+    @property
+    def db(self):
+        return get_db()
+
+    def on_ready(self, callback: OnReady) -> None:
+        self._callbacks.append(callback)
+
+    def schedule(self, path: Path, url: str) -> Optional[asyncio.Task]:
+        if not self.enabled or path.suffix.lower() not in SOURCE_EXTENSIONS:
+            return None
+        if url in self._tasks:
+            # The same content uploaded again while its variants are still being generated
+            return self._tasks[url]
+        task = asyncio.create_task(self.process(path, url))
+        self._tasks[url] = task
+        task.add_done_callback(lambda _: self._tasks.pop(url, None))
+        return task
+
+    async def process(self, path: Path, url: str) -> Optional[dict]:
+        manifest = await self.db[VARIANTS_COLLECTION].find_one({"_id": url})
+        if manifest is not None:
+            # Content-addressed re-upload of an image that was already processed
+            await self._notify(url, self.srcset_document(manifest))
+            return manifest
+
+        loop = asyncio.get_running_loop()
+        try:
+            rendered = await loop.run_in_executor(self._executor, _render_variants, path, self.formats)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Generating image variants for {url} failed: {str(e)}")
+            return None
+
+        base_url = url.rsplit("/", 1)[0]
+        srcset = {}
+        for fmt in self.formats:
+            srcset[fmt] = ", ".join(
+                f"{base_url}/{item['filename']} {item['width']}w"
+                for item in rendered["variants"] if item["format"] == fmt
+            )
+        manifest = {
+            "width": rendered["width"],
+            "height": rendered["height"],
+            "srcset": srcset,
+            "variants": [
+                {**item, "url": f"{base_url}/{item['filename']}"} for item in rendered["variants"]
+            ],
+            "createdAt": datetime.utcnow()
+        }
+        await self.db[VARIANTS_COLLECTION].replace_one({"_id": url}, manifest, upsert=True)
+        self.generated += 1
+
+        await self._notify(url, self.srcset_document(manifest))
+        return manifest
+
+    async def _notify(self, url: str, srcset: dict) -> None:
+        for callback in self._callbacks:
+            try:
+                await callback(url, srcset)
+            except Exception as e:
+                logger.error(f"Recording image variants for {url} failed: {str(e)}")
+
+    async def discard(self, url: str, directory: Path) -> None:
+        """Delete the variant files and manifest of an original that is being removed"""
+        manifest = await self.db[VARIANTS_COLLECTION].find_one_and_delete({"_id": url})
+        if manifest is None:
+            return
+        for item in manifest["variants"]:
+            (directory / item["filename"]).unlink(missing_ok=True)
+
+    @staticmethod
+    def srcset_document(manifest: dict) -> dict:
+        """The part of a manifest that is stored on documents and sent to clients"""
+        return {**manifest["srcset"], "width": manifest["width"], "height": manifest["height"]}
+
+    async def lookup(self, urls: Iterable[str]) -> Dict[str, dict]:
+        """Srcsets of already processed URLs, for documents created after the upload"""
+        urls = [url for url in urls if url]
+        if not urls:
+            return {}
+        manifests = await self.db[VARIANTS_COLLECTION].find({"_id": {"$in": urls}}).to_list(len(urls))
+        return {manifest["_id"]: self.srcset_document(manifest) for manifest in manifests}
+
+    def stats(self) -> dict:
+        return {
+            "formats": self.formats,
+            "inFlight": len(self._tasks),
+            "generated": self.generated,
+            "failed": self.failed
+        }
+
+    def shutdown(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+image_pipeline = ImagePipeline(max_workers=int(os.environ.get("IMAGE_VARIANT_WORKERS", "2")))
+
+async def with_srcset(doc: dict, field: str = "imageUrl", target: str = "imageSrcset") -> dict:
+    """Attach the srcset of doc[field] if its variants already exist"""
+    url = doc.get(field)
+    doc[target] = (await image_pipeline.lookup([url])).get(url) if url else None
+    return doc
@@ -0,0 +1,88 @@
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
+from typing import Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# collection name -> indexes declared by the route modules that query it
+_registry: Dict[str, List[IndexModel]] = {}
+
+# Result of the last ensure_indexes() run, exposed for health checks
+last_report: Dict[str, dict] = {}
+
+def declare_indexes(collection: str, *indexes: IndexModel) -> None:
+    """
+    Declare indexes a route module depends on.
+    Called at import time; applied by ensure_indexes() on startup.
+    """
+    declared = _registry.setdefault(collection, [])
+    known = {index.document["name"] for index in declared}
+    for index in indexes:
+        if index.document["name"] not in known:
+            declared.append(index)
+            known.add(index.document["name"])
+
+def get_declared_indexes() -> Dict[str, List[IndexModel]]:
+    return _registry
+
+def _same_definition(declared: dict, existing: dict) -> bool:
+    """Compare a declared IndexModel document with index_information() output"""
+    if list(declared["key"].items()) != [tuple(k) for k in existing["key"]]:
+        return False
+    for option in ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression"):
+        if declared.get(option) != existing.get(option):
+            return False
+    return True
+
+async def ensure_indexes(db) -> Dict[str, dict]:
+    """
+    Create every declared index that is missing and report drift.
+    createIndexes is idempotent, so this is safe to run on every startup.
+    """
+    report = {}
+    for collection, indexes in _registry.items():
+        entry = {"created": [], "conflicts": [], "undeclared": [], "errors": []}
+        try:
+            existing = await db[collection].index_information()
+        except PyMongoError as e:
+            entry["errors"].append(str(e))
+            report[collection] = entry
+            continue
+
+        missing = []
+        for index in indexes:
+            name = index.document["name"]
+            if name not in existing:
+                missing.append(index)
+            elif not _same_definition(index.document, existing[name]):
+                entry["conflicts"].append(name)
+
+        # Create one at a time so a single bad index (e.g. duplicates on a
+        # unique key) does not block the rest of the collection
+        for index in missing:
+            try:
+                await db[collection].create_indexes([index])
+                entry["created"].append(index.document["name"])
+            except PyMongoError as e:
+                entry["errors"].append(f"{index.document['name']}: {str(e)}")
+
+        declared_names = {index.document["name"] for index in indexes}
+        entry["undeclared"] = sorted(
+            name for name in existing if name != "_id_" and name not in declared_names
+        )
+        report[collection] = entry
+
+    for collection, entry in report.items():
+        if entry["created"]:
+            logger.info(f"Created indexes on {collection}: {', '.join(entry['created'])}")
+        if entry["conflicts"]:
+            logger.warning(f"Index definition drift on {collection}: {', '.join(entry['conflicts'])}")
+        if entry["undeclared"]:
+            logger.warning(f"Undeclared indexes on {collection}: {', '.join(entry['undeclared'])}")
+        for error in entry["errors"]:
+            logger.error(f"Index creation failed on {collection}: {error}")
+
+    last_report.clear()
+    last_report.update(report)
+    return report
@@ -1,39 +1,192 @@
-import midtransclient
-import os
 from datetime import datetime
+from typing import Optional
+from utils.http_clients import http_clients
+import asyncio
+import base64
+import hashlib
+import hmac
+import httpx
+import logging
+import os
 import uuid
 
+logger = logging.getLogger(__name__)
+
+SANDBOX_API_URL = "https://api.sandbox.midtrans.com"
+PRODUCTION_API_URL = "https://api.midtrans.com"
+SANDBOX_SNAP_URL = "https://app.sandbox.midtrans.com/snap"
+PRODUCTION_SNAP_URL = "https://app.midtrans.com/snap"
+
+HTTP_CLIENT_NAME = "midtrans"
+
+http_clients.configure(
+    HTTP_CLIENT_NAME,
+    timeout=float(os.environ.get("MIDTRANS_TIMEOUT", "10")),
+    max_connections=int(os.environ.get("MIDTRANS_MAX_CONNECTIONS", "20"))
+)
+
+class MidtransError(Exception):
+    """Midtrans rejected the request or could not be reached"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, response: Optional[dict] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response or {}
+
 class MidtransService:
-    def __init__(self):
-        # Get Midtrans credentials from environment
-        self.server_key = os.environ.get('MIDTRANS_SERVER_KEY', '')
-        self.client_key = os.environ.get('MIDTRANS_CLIENT_KEY', '')
-        self.is_production = os.environ.get('MIDTRANS_IS_PRODUCTION', 'false').lower() == 'true'
-        
-        # Initialize Snap API
-        self.snap = midtransclient.Snap(
-            is_production=self.is_production,
-            server_key=self.server_key,
-            client_key=self.client_key
-        )
-        
-        # Initialize Core API for checking transaction status
-        self.core_api = midtransclient.CoreApi(
-            is_production=self.is_production,
-            server_key=self.server_key,
-            client_key=self.client_key
+    """
+    Async Midtrans client (Snap + Core API) on the shared "midtrans"
+    client from utils.http_clients.
+
+    Connection failures are retried for every call; read timeouts and 5xx
+    responses are retried only for status lookups, because repeating a
+    charge whose request already reached Midtrans could double-submit it.
+    Base URLs can be overridden (MIDTRANS_API_BASE_URL / MIDTRANS_SNAP_BASE_URL)
+    to point at a local fake server.
+    """
+
+    def __init__(
+        self,
+        server_key: str,
+        client_key: str = "",
+        is_production: bool = False,
+        api_base_url: Optional[str] = None,
+        snap_base_url: Optional[str] = None,
+        max_retries: int = 2,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        self.server_key = server_key
+        self.client_key = client_key
+        self.is_production = is_production
+        self.api_base_url = (api_base_url or (PRODUCTION_API_URL if is_production else SANDBOX_API_URL)).rstrip("/")
+        self.snap_base_url = (snap_base_url or (PRODUCTION_SNAP_URL if is_production else SANDBOX_SNAP_URL)).rstrip("/")
+        self.max_retries = max_retries
+        self._http_client = http_client
+
+    @classmethod
+    def from_env(cls, **overrides) -> "MidtransService":
+        options = {
+            "server_key": os.environ.get("MIDTRANS_SERVER_KEY", ""),
+            "client_key": os.environ.get("MIDTRANS_CLIENT_KEY", ""),
+            "is_production": os.environ.get("MIDTRANS_IS_PRODUCTION", "false").lower() == "true",
+            "api_base_url": os.environ.get("MIDTRANS_API_BASE_URL") or None,
+            "snap_base_url": os.environ.get("MIDTRANS_SNAP_BASE_URL") or None,
+            "max_retries": int(os.environ.get("MIDTRANS_MAX_RETRIES", "2")),
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.server_key)
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # An explicit client is only passed in tests; routes borrow the app-scoped one
+        return self._http_client or http_clients.get(HTTP_CLIENT_NAME)
+
+    def _headers(self) -> dict:
+        auth = base64.b64encode(f"{self.server_key}:".encode()).decode()
+        return {
+            "Authorization": f"Basic {auth}",
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+
+    async def _request(self, method: str, url: str, json: Optional[dict] = None, idempotent: bool = False) -> dict:
+        attempt = 0
+        while True:
+            try:
+                response = await self.http_client.request(method, url, json=json, headers=self._headers())
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # The request never reached Midtrans, so retrying is always safe
+                error = MidtransError(f"Midtrans unreachable: {str(e)}")
+            except httpx.TransportError as e:
+                # Timeouts and dropped connections after the request was sent
+                error = MidtransError(f"Midtrans request failed: {str(e) or type(e).__name__}")
+                if not idempotent:
+                    raise error
+            else:
+                if response.status_code >= 500 and idempotent:
+                    error = MidtransError(f"Midtrans error {response.status_code}", response.status_code)
+                else:
+                    return self._parse(response)
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            delay = 0.2 * (2 ** (attempt - 1))
+            logger.warning(f"Midtrans {method} {url} failed ({str(error)}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _parse(response: httpx.Response) -> dict:
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"status_message": response.text}
+        if response.status_code >= 400:
+            messages = body.get("error_messages") or [body.get("status_message", "")]
+            raise MidtransError(
+                f"Midtrans API error {response.status_code}: {', '.join(str(m) for m in messages)}",
+                response.status_code,
+                body
+            )
+        # Core API reports some failures as HTTP 200 with an error status_code
+        # in the body; 407 (expired transaction) is a normal status response.
+        status_code = str(body.get("status_code", ""))
+        if status_code.isdigit() and int(status_code) >= 400 and int(status_code) != 407:
+            raise MidtransError(
+                f"Midtrans API error {status_code}: {body.get('status_message', '')}",
+                int(status_code),
+                body
+            )
+        return body
+
+    async def create_snap_transaction(self, param: dict) -> dict:
+        """Create a Snap transaction; returns {"token", "redirect_url"}"""
+        return await self._request("POST", f"{self.snap_base_url}/v1/transactions", json=param)
+
+    async def charge(self, param: dict) -> dict:
+        """Core API charge (e.g. QRIS)"""
+        return await self._request("POST", f"{self.api_base_url}/v2/charge", json=param)
+
+    async def transaction_status(self, order_id: str) -> dict:
+        return await self._request("GET", f"{self.api_base_url}/v2/{order_id}/status", idempotent=True)
+
+    async def notification(self, notification: dict) -> dict:
+        """
+        Resolve a webhook payload against the Core API, as the SDK does,
+        so a forged notification cannot change a payment's status.
+        """
+        transaction_id = notification.get("transaction_id") or notification.get("order_id")
+        if not transaction_id:
+            raise MidtransError("Notification has no transaction_id or order_id")
+        return await self.transaction_status(transaction_id)
+
+    def verify_signature(self, notification: dict) -> bool:
+        """
+        Check a webhook's signature_key, sha512(order_id + status_code +
+        gross_amount + server key). Cheap enough to run before a
+        notification is stored; notification() is still the authority.
+        """
+        raw = (
+            f"{notification.get('order_id', '')}{notification.get('status_code', '')}"
+            f"{notification.get('gross_amount', '')}{self.server_key}"
         )
-    
-    def create_qris_transaction(self, order_id: str, amount: int, customer_details: dict, item_details: list):
+        expected = hashlib.sha512(raw.encode()).hexdigest()
+        return hmac.compare_digest(expected, str(notification.get("signature_key", "")))
+
+    async def create_qris_transaction(self, order_id: str, amount: int, customer_details: dict, item_details: list):
         """
         Create QRIS transaction using Midtrans
-        
+
         Args:
             order_id: Unique order ID
             amount: Transaction amount in IDR
             customer_details: Dict with customer info (email, first_name, phone)
             item_details: List of items being purchased
-            
+
         Returns:
             Dict with transaction token and redirect URL
         """
@@ -52,10 +205,10 @@ class MidtransService:
                     "duration": 60  # 60 minutes expiry
                 }
             }
-            
+
             # Create transaction
-            transaction = self.snap.create_transaction(param)
-            
+            transaction = await self.create_snap_transaction(param)
+
             return {
                 "success": True,
                 "token": transaction['token'],
@@ -67,20 +220,20 @@ class MidtransService:
                 "success": False,
                 "error": str(e)
             }
-    
-    def get_transaction_status(self, order_id: str):
+
+    async def get_transaction_status(self, order_id: str):
         """
         Check transaction status from Midtrans
-        
+
         Args:
             order_id: Order ID to check
-            
+
         Returns:
             Dict with transaction status
         """
         try:
-            status_response = self.core_api.transactions.status(order_id)
-            
+            status_response = await self.transaction_status(order_id)
+
             return {
                 "success": True,
                 "order_id": status_response['order_id'],
@@ -98,24 +251,24 @@ class MidtransService:
                 "success": False,
                 "error": str(e)
             }
-    
-    def verify_notification(self, notification_data: dict):
+
+    async def verify_notification(self, notification_data: dict):
         """
         Verify and process Midtrans notification
-        
+
         Args:
             notification_data: Notification payload from Midtrans
-            
+
         Returns:
             Dict with verification result and status
         """
         try:
-            status_response = self.core_api.transactions.notification(notification_data)
-            
+            status_response = await self.notification(notification_data)
+
             order_id = status_response['order_id']
             transaction_status = status_response['transaction_status']
             fraud_status = status_response.get('fraud_status')
-            
+
             # Determine final status
             if transaction_status == 'capture':
                 if fraud_status == 'accept':
@@ -130,7 +283,7 @@ class MidtransService:
                 final_status = 'pending'
             else:
                 final_status = 'unknown'
-            
+
             return {
                 "success": True,
                 "order_id": order_id,
@@ -147,15 +300,15 @@ class MidtransService:
                 "success": False,
                 "error": str(e)
             }
-    
+
     def generate_order_id(self, user_id: str, prefix: str = "NEWME"):
         """
         Generate unique order ID
-        
+
         Args:
             user_id: User ID
             prefix: Order ID prefix (default: NEWME)
-            
+
         Returns:
             Unique order ID string
         """
@@ -166,9 +319,9 @@ class MidtransService:
 # Singleton instance
 _midtrans_service = None
 
-def get_midtrans_service():
+def get_midtrans_service() -> MidtransService:
     """Get or create Midtrans service instance"""
     global _midtrans_service
     if _midtrans_service is None:
-        _midtrans_service = MidtransService()
+        _midtrans_service = MidtransService.from_env()
     return _midtrans_service
@@ -0,0 +1,77 @@
+from bson import ObjectId
+from datetime import datetime
+from fastapi import HTTPException
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+import base64
+import heapq
+import json
+
+Position = Tuple[Optional[datetime], ObjectId]
+
+def encode_cursor(timestamp: Optional[datetime], _id: ObjectId) -> str:
+    """Opaque keyset cursor for the (timestamp, _id) position of the last item on a page"""
+    raw = json.dumps([timestamp.isoformat() if timestamp else None, str(_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Position:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, _id = json.loads(raw)
+        return (datetime.fromisoformat(timestamp) if timestamp else None), ObjectId(_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(field: str, position: Optional[Position]) -> dict:
+    """
+    Match documents strictly after `position` in (field desc, _id desc)
+    order. MongoDB sorts a null or missing field below every date, so those
+    documents come last and are paged by _id alone.
+    """
+    if position is None:
+        return {}
+    timestamp, _id = position
+    if timestamp is None:
+        return {field: None, "_id": {"$lt": _id}}
+    return {"$or": [
+        {field: {"$lt": timestamp}},
+        {field: timestamp, "_id": {"$lt": _id}},
+        {field: None}
+    ]}
+
+async def merge_desc(
+    streams: List[AsyncIterator[Any]],
+    key: Callable[[Any], Any],
+    limit: int
+) -> List[Any]:
+    """
+    Lazy k-way merge of async iterators that are each already sorted
+    descending by `key`. Pulls only as many items from each stream as the
+    merged page needs.
+    """
+    heap = []
+    for index, stream in enumerate(streams):
+        item = await anext(stream, None)
+        if item is not None:
+            # heapq is a min-heap: negate by wrapping the key in _Desc
+            heapq.heappush(heap, (_Desc(key(item)), index, item))
+
+    merged = []
+    while heap and len(merged) < limit:
+        _, index, item = heapq.heappop(heap)
+        merged.append(item)
+        following = await anext(streams[index], None)
+        if following is not None:
+            heapq.heappush(heap, (_Desc(key(following)), index, following))
+    return merged
+
+class _Desc:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other: "_Desc") -> bool:
+        return self.value > other.value
+
+    def __eq__(self, other: "_Desc") -> bool:
+        return self.value == other.value
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from typing import Any, Callable
+import asyncio
+import os
+import threading
+import time
+
+class PasswordHashPool:
+    """
+    Dedicated thread pool for bcrypt work.
+    bcrypt releases the GIL, so hashing here keeps the event loop free;
+    the pool size caps CPU spent on hashing and the queue bound sheds load
+    with a 503 instead of letting login storms pile up indefinitely.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_wait_ms = 0.0
+        self.total_wait_ms = 0.0
+
+    def _run(self, submitted_at: float, func: Callable, args: tuple) -> Any:
+        wait_ms = (time.perf_counter() - submitted_at) * 1000
+        with self._lock:
+            self.running += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                self.completed += 1
+
+    async def run(self, func: Callable, *args) -> Any:
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
+            self.pending += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run, time.perf_counter(), func, args)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "maxQueue": self.max_queue,
+                "running": self.running,
+                "queued": self.pending - self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avgWaitMs": round(self.total_wait_ms / self.completed, 2) if self.completed else 0.0,
+                "maxWaitMs": round(self.max_wait_ms, 2)
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_pool = PasswordHashPool(
+    max_workers=int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.environ.get("PASSWORD_HASH_QUEUE", "256"))
+)
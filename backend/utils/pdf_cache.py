@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Awaitable, Callable, Dict, Optional
+from utils.responses import dumps
+import asyncio
+import hashlib
+import os
+import uuid
+
+def _scan(directory: Path) -> "OrderedDict[str, int]":
+    """Existing cache files, least recently used first"""
+    directory.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for path in directory.glob("*.pdf"):
+        try:
+            stat_result = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat_result.st_mtime, path.stem, stat_result.st_size))
+    entries.sort()
+    return OrderedDict((key, size) for _, key, size in entries)
+
+def _write(directory: Path, key: str, data: bytes) -> Path:
+    path = directory / f"{key}.pdf"
+    temp_path = directory / f".{uuid.uuid4().hex}.part"
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+    return path
+
+def _touch(path: Path) -> bool:
+    """Mark a cache file as recently used; False if another worker evicted it"""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+class PdfCache:
+    """
+    Disk cache of rendered PDFs, keyed by a hash of everything that goes
+    into the render (see key()).
+
+    Keys change whenever an input changes (callers include the template
+    version), so entries never need invalidating: stale ones stop being
+    requested and are evicted least-recently-used first once the cache
+    exceeds max_bytes. File mtimes carry the recency, so the index can be
+    rebuilt from the directory and worker processes sharing it agree on
+    what is old. Concurrent misses for the same key render once.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(*inputs: Any) -> str:
+        return hashlib.sha256(dumps(list(inputs))).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.pdf"
+
+    async def _get_index(self) -> "OrderedDict[str, int]":
+        if self._index is None:
+            self._index = await run_in_threadpool(_scan, self.directory)
+        return self._index
+
+    async def get_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> Path:
+        """Path of the cached PDF for key, rendering and storing it on a miss"""
+        index = await self._get_index()
+        path = self.path(key)
+        if key in index or path.exists():
+            if await run_in_threadpool(_touch, path):
+                self.hits += 1
+                size = index.pop(key, None)
+                index[key] = size if size is not None else (await run_in_threadpool(path.stat)).st_size
+                return path
+            index.pop(key, None)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.misses += 1
+            data = await render()
+            path = await run_in_threadpool(_write, self.directory, key, data)
+            index[key] = len(data)
+            await self._evict(index)
+            future.set_result(path)
+            return path
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; don't warn about an unretrieved exception when there are none
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _evict(self, index: "OrderedDict[str, int]") -> None:
+        total = sum(index.values())
+        while total > self.max_bytes and len(index) > 1:
+            key, size = index.popitem(last=False)
+            total -= size
+            await run_in_threadpool(self.path(key).unlink, missing_ok=True)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        index = self._index or {}
+        return {
+            "entries": len(index),
+            "bytes": sum(index.values()),
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+certificate_pdf_cache = PdfCache(
+    directory=Path(os.environ.get("CERTIFICATE_PDF_CACHE_DIR", "/app/backend/cache/certificates")),
+    max_bytes=int(os.environ.get("CERTIFICATE_PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+)
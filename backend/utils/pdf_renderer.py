@@ -0,0 +1,145 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from typing import Callable, Optional, Tuple
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+
+class PdfRenderPool:
+    """
+    Process pool for certificate PDF rendering.
+
+    reportlab drawing is pure Python and holds the GIL, so unlike bcrypt it
+    cannot share the API process; jobs run in separate worker processes
+    (spawn context, so workers never inherit the event loop or Mongo
+    client). Jobs are module-level functions that take plain dicts and
+    return PDF bytes.
+
+    Like the password pool, a bounded queue sheds load with a 503. A job
+    that exceeds the timeout is answered with a 504; its worker finishes it
+    in the background and the slot stays counted until then.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, timeout: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._warmup: Optional[Tuple[Callable, tuple]] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.total_render_ms = 0.0
+        self.max_render_ms = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            initializer, initargs = self._warmup or (None, ())
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+                initargs=initargs
+            )
+        return self._executor
+
+    def warm(self, func: Callable, *args) -> None:
+        """
+        Run func(*args) in every worker: as the initializer of workers started
+        from now on, and as one job per worker for the ones already running.
+        Used to preload per-worker caches; the warm-up jobs are not counted
+        against the queue bound.
+        """
+        self._warmup = (func, args)
+        executor = self._executor
+        if executor is None:
+            # Start the workers now instead of on the first download
+            executor = self._get_executor()
+        try:
+            for _ in range(self.max_workers):
+                executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._reset()
+
+    def _finished(self, started_at: float, future) -> None:
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.completed += 1
+            self.total_render_ms += elapsed_ms
+            self.max_render_ms = max(self.max_render_ms, elapsed_ms)
+
+    async def render(self, func: Callable[..., bytes], *args) -> bytes:
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
+            self.pending += 1
+
+        started_at = time.perf_counter()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException as e:
+            with self._lock:
+                self.pending -= 1
+            if isinstance(e, BrokenProcessPool):
+                self._reset()
+                raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
+            raise
+        future.add_done_callback(functools.partial(self._finished, started_at))
+
+        try:
+            # shield: a timeout must not cancel the job, which would free its slot while it still runs
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise HTTPException(status_code=504, detail="Pembuatan sertifikat terlalu lama, silakan coba lagi")
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next job
+            with self._lock:
+                self.failed += 1
+            self._reset()
+            raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+
+    def _reset(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "maxQueue": self.max_queue,
+                "timeoutSeconds": self.timeout,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timedOut": self.timed_out,
+                "failed": self.failed,
+                "avgRenderMs": round(self.total_render_ms / self.completed, 2) if self.completed else 0.0,
+                "maxRenderMs": round(self.max_render_ms, 2)
+            }
+
+    def shutdown(self) -> None:
+        self._reset()
+
+pdf_renderer = PdfRenderPool(
+    max_workers=int(os.environ.get("CERTIFICATE_RENDER_WORKERS", str(min(2, os.cpu_count() or 1)))),
+    max_queue=int(os.environ.get("CERTIFICATE_RENDER_QUEUE", "16")),
+    timeout=float(os.environ.get("CERTIFICATE_RENDER_TIMEOUT", "30"))
+)
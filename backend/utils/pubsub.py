@@ -0,0 +1,113 @@
+from contextlib import asynccontextmanager
+from fastapi import Request
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+from utils.responses import dumps
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PubSub:
+    """
+    In-process publish/subscribe keyed by topic (e.g. "payment:<orderId>").
+
+    Each subscriber gets a small bounded queue; a subscriber that falls
+    behind loses its oldest messages rather than blocking publishers.
+    Delivery is per process only, so consumers that must not miss an
+    update (SSE streams) also re-read the database periodically.
+    """
+
+    def __init__(self, max_queue: int = 16):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    @asynccontextmanager
+    async def subscription(self, topic: str) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic: str, message: Any) -> int:
+        """Fan a message out to the topic's subscribers; returns how many received it"""
+        subscribers = self._subscribers.get(topic)
+        self.published += 1
+        if not subscribers:
+            return 0
+        for queue in subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+        return len(subscribers)
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+pubsub = PubSub()
+
+def format_sse(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+async def status_event_stream(
+    request: Request,
+    topic: str,
+    load_status: Callable[[], Awaitable[Optional[dict]]],
+    is_final: Callable[[dict], bool],
+    refresh_interval: float = 10.0,
+    keepalive_interval: float = 15.0,
+    max_duration: float = 3600.0
+) -> AsyncIterator[bytes]:
+    """
+    Server-Sent Events for a status document.
+
+    Sends the current status, then every change published on the topic.
+    The status is re-read from the database every refresh_interval, which
+    covers updates recorded by another worker process. Comment lines keep
+    idle connections open through proxies. Ends on a final status, client
+    disconnect or after max_duration (EventSource reconnects by itself).
+    """
+    loop = asyncio.get_running_loop()
+    wait = min(refresh_interval, keepalive_interval)
+    async with pubsub.subscription(topic) as queue:
+        started = last_sent = last_refresh = loop.time()
+        last_status = None
+        status = await load_status()
+        while True:
+            if status is not None and status != last_status:
+                yield format_sse("status", status)
+                last_status = status
+                last_sent = loop.time()
+                if is_final(status):
+                    return
+
+            try:
+                status = await asyncio.wait_for(queue.get(), timeout=wait)
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            now = loop.time()
+            if await request.is_disconnected() or now - started >= max_duration:
+                return
+            if now - last_refresh >= refresh_interval:
+                status = await load_status()
+                last_refresh = now
+                if status is not None and status != last_status:
+                    continue
+            if now - last_sent >= keepalive_interval:
+                yield b": keepalive\n\n"
+                last_sent = now
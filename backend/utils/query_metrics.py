@@ -0,0 +1,172 @@
+from pymongo import monitoring
+from contextvars import ContextVar
+from typing import Dict, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SLOW_COMMAND_MS = float(os.environ.get("MONGO_SLOW_COMMAND_MS", "100"))
+
+# Handshake/keepalive commands that say nothing about a route's workload
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "buildInfo"}
+
+class RequestQueryStats:
+    """Mongo commands issued while serving a single HTTP request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.duration_ms = 0.0
+        self.documents = 0
+
+    def add(self, duration_ms: float, documents: int):
+        with self._lock:
+            self.count += 1
+            self.duration_ms += duration_ms
+            self.documents += documents
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("mongo_request_stats", default=None)
+
+# route template -> aggregated totals since startup
+_route_totals: Dict[str, dict] = {}
+_route_lock = threading.Lock()
+
+def filter_shape(value):
+    """Replace literal values with their type name so filters can be logged safely"""
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = [filter_shape(item) for item in value[:3]]
+        return shapes + ["..."] if len(value) > 3 else shapes
+    return type(value).__name__
+
+def _command_shape(command_name: str, command: dict):
+    if command_name in ("find", "count", "distinct", "delete", "update"):
+        if "filter" in command:
+            return filter_shape(command["filter"])
+        if "query" in command:
+            return filter_shape(command["query"])
+        statements = command.get("updates") or command.get("deletes")
+        if statements:
+            return [filter_shape(statement.get("q", {})) for statement in statements[:3]]
+    if command_name == "findAndModify":
+        return filter_shape(command.get("query", {}))
+    if command_name == "aggregate":
+        return [next(iter(stage), "") for stage in command.get("pipeline", [])]
+    return None
+
+def _returned_documents(command_name: str, reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    if command_name == "distinct":
+        return len(reply.get("values", []))
+    return int(reply.get("n", 0) or 0)
+
+class CommandStatsListener(monitoring.CommandListener):
+    """Attributes every Mongo command to the HTTP request that issued it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                _current_stats.get(),
+                collection if isinstance(collection, str) else None,
+                _command_shape(event.command_name, event.command)
+            )
+
+    def _finish(self, event, reply: Optional[dict]):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        stats, collection, shape = pending
+        duration_ms = event.duration_micros / 1000.0
+        documents = _returned_documents(event.command_name, reply) if reply else 0
+        if stats is not None:
+            stats.add(duration_ms, documents)
+        if duration_ms >= SLOW_COMMAND_MS:
+            logger.warning(
+                f"Slow Mongo command {event.command_name} on {collection} "
+                f"took {duration_ms:.1f}ms, returned {documents} docs, shape={shape}"
+            )
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event, None)
+
+command_stats = CommandStatsListener()
+
+def _record_route(route: str, stats: RequestQueryStats):
+    with _route_lock:
+        totals = _route_totals.setdefault(route, {
+            "requests": 0, "commands": 0, "durationMs": 0.0, "documents": 0, "maxCommands": 0
+        })
+        totals["requests"] += 1
+        totals["commands"] += stats.count
+        totals["durationMs"] += stats.duration_ms
+        totals["documents"] += stats.documents
+        totals["maxCommands"] = max(totals["maxCommands"], stats.count)
+
+def get_route_stats() -> Dict[str, dict]:
+    with _route_lock:
+        result = {}
+        for route, totals in _route_totals.items():
+            requests = totals["requests"] or 1
+            result[route] = {
+                **totals,
+                "durationMs": round(totals["durationMs"], 2),
+                "avgCommands": round(totals["commands"] / requests, 2),
+                "avgDurationMs": round(totals["durationMs"] / requests, 2)
+            }
+        return result
+
+class QueryMetricsMiddleware:
+    """
+    ASGI middleware that scopes command stats to a request, reports them in a
+    Server-Timing header and aggregates them per route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.duration_ms:.1f};desc="{stats.count} commands", '
+                    f'app;dur={(time.perf_counter() - started) * 1000:.1f}'.encode()
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route or stats.count:
+                _record_route(f"{scope['method']} {route or '<unmatched>'}", stats)
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+from database import get_db
+from pymongo import IndexModel, ASCENDING
+from typing import Awaitable, Callable, Dict, Optional
+from utils.indexes import declare_indexes
+from utils.midtrans import get_midtrans_service, MidtransError
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+Apply = Callable[[dict], Awaitable[None]]
+
+class PendingPaymentReconciler:
+    """
+    Server-side status sync for pending Midtrans orders.
+
+    Route modules register the collection that holds their orders and the
+    function that applies a Midtrans status response (the same one their
+    webhook handler uses). Each cycle claims due pending orders by pushing
+    their nextCheckAt forward with exponential backoff, then checks them
+    against Midtrans with bounded concurrency. Orders Midtrans never heard
+    of are expired once they are older than the source's max_age.
+    """
+
+    def __init__(
+        self,
+        interval: float = 15.0,
+        batch_size: int = 200,
+        concurrency: int = 5,
+        base_delay: float = 15.0,
+        max_delay: float = 900.0
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sources: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.checks = 0
+        self.errors = 0
+        self.expired = 0
+
+    @property
+    def db(self):
+        return get_db()
+
+    def register(
+        self,
+        source: str,
+        collection: str,
+        apply: Apply,
+        query: Optional[dict] = None,
+        order_field: str = "orderId",
+        created_field: str = "createdAt",
+        max_age: timedelta = timedelta(days=1)
+    ) -> None:
+        self._sources[source] = {
+            "collection": collection,
+            "apply": apply,
+            "query": query or {},
+            "order_field": order_field,
+            "created_field": created_field,
+            "max_age": max_age
+        }
+        declare_indexes(
+            collection,
+            IndexModel([("status", ASCENDING), ("nextCheckAt", ASCENDING)], name="status_1_nextCheckAt_1"),
+        )
+
+    def next_delay(self, attempts: int) -> float:
+        return min(self.base_delay * (2 ** attempts), self.max_delay)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="payment-reconciler")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Payment reconciliation error: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def reconcile(self) -> int:
+        """Run one cycle over every source; returns the number of orders checked"""
+        midtrans = get_midtrans_service()
+        if not midtrans.is_configured:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        checks = []
+        for source, options in self._sources.items():
+            for order in await self._claim_due(options):
+                checks.append(self._check(midtrans, semaphore, source, options, order))
+        await asyncio.gather(*checks)
+        return len(checks)
+
+    async def _claim_due(self, options: dict) -> list:
+        collection = self.db[options["collection"]]
+        now = datetime.utcnow()
+        # nextCheckAt None also matches orders created before reconciliation existed
+        due = await collection.find(
+            {
+                **options["query"],
+                "status": "pending",
+                "$or": [{"nextCheckAt": {"$lte": now}}, {"nextCheckAt": None}]
+            },
+            {options["order_field"]: 1, options["created_field"]: 1, "nextCheckAt": 1, "reconcileAttempts": 1}
+        ).sort("nextCheckAt", 1).limit(self.batch_size).to_list(self.batch_size)
+
+        claimed = []
+        for order in due:
+            attempts = order.get("reconcileAttempts", 0)
+            # Moving nextCheckAt is the claim: another worker running the
+            # same cycle sees a changed value and skips the order
+            result = await collection.update_one(
+                {"_id": order["_id"], "status": "pending", "nextCheckAt": order.get("nextCheckAt")},
+                {
+                    "$set": {
+                        "nextCheckAt": now + timedelta(seconds=self.next_delay(attempts)),
+                        "lastCheckedAt": now
+                    },
+                    "$inc": {"reconcileAttempts": 1}
+                }
+            )
+            if result.modified_count:
+                claimed.append(order)
+        return claimed
+
+    async def _check(self, midtrans, semaphore: asyncio.Semaphore, source: str, options: dict, order: dict) -> None:
+        order_id = order.get(options["order_field"])
+        async with semaphore:
+            try:
+                status_response = await midtrans.transaction_status(order_id)
+            except MidtransError as e:
+                if e.status_code != 404:
+                    self.errors += 1
+                    logger.warning(f"Reconcile {source} order {order_id} failed: {str(e)}")
+                    return
+                created_at = order.get(options["created_field"])
+                if created_at is None or datetime.utcnow() - created_at < options["max_age"]:
+                    # Not opened by the customer yet
+                    return
+                # Midtrans never saw a payment for it; expire it locally
+                status_response = {"order_id": order_id, "transaction_status": "expire"}
+                self.expired += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Reconcile {source} order {order_id} failed: {str(e)}")
+                return
+
+            self.checks += 1
+            try:
+                await options["apply"](status_response)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Applying reconciled status for {source} order {order_id} failed: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "sources": sorted(self._sources),
+            "checks": self.checks,
+            "expired": self.expired,
+            "errors": self.errors
+        }
+
+payment_reconciler = PendingPaymentReconciler(
+    interval=float(os.environ.get("PAYMENT_RECONCILE_INTERVAL", "15")),
+    batch_size=int(os.environ.get("PAYMENT_RECONCILE_BATCH_SIZE", "200")),
+    concurrency=int(os.environ.get("PAYMENT_RECONCILE_CONCURRENCY", "5")),
+    base_delay=float(os.environ.get("PAYMENT_RECONCILE_BASE_DELAY", "15")),
+    max_delay=float(os.environ.get("PAYMENT_RECONCILE_MAX_DELAY", "900"))
+)
@@ -0,0 +1,79 @@
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
+from bson import ObjectId, Decimal128
+from decimal import Decimal
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Optional, Tuple
+import orjson
+import os
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    # Pydantic models, sets and the other types FastAPI knows about
+    return jsonable_encoder(obj)
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode Mongo documents straight to JSON bytes.
+    ObjectId, datetime and Decimal128 are handled in the same pass, so
+    routers can return documents as read from the database.
+    """
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class MongoJSONResponse(JSONResponse):
+    """Default response class for the API; see dumps()"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def _byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=start-end" range; None means serve the whole file, 416 if unsatisfiable"""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start, _, end = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = min(int(end), size - 1) if end else size - 1
+        else:
+            # Suffix range: the last N bytes
+            first = max(size - int(end), 0)
+            last = size - 1
+    except ValueError:
+        return None
+    if first > last or first >= size:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return first, last
+
+def _read_range(path: Path, first: int, length: int) -> bytes:
+    with open(path, "rb") as handle:
+        handle.seek(first)
+        return handle.read(length)
+
+async def file_range_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    headers: Optional[dict] = None
+) -> Response:
+    """
+    Send a file with Content-Length and single-range support (206/416),
+    which Starlette's FileResponse does not do yet.
+    """
+    stat_result = await run_in_threadpool(os.stat, path)
+    headers = {**(headers or {}), "Accept-Ranges": "bytes"}
+    byte_range = _byte_range(request.headers.get("range"), stat_result.st_size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+    first, last = byte_range
+    body = await run_in_threadpool(_read_range, path, first, last - first + 1)
+    headers["Content-Range"] = f"bytes {first}-{last}/{stat_result.st_size}"
+    return Response(content=body, status_code=206, media_type=media_type, headers=headers)
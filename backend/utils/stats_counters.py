@@ -0,0 +1,140 @@
+from datetime import datetime
+from database import get_db
+from typing import Dict, Iterable, Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_COLLECTION = "stats_counters"
+
+class StatsCounters:
+    """
+    Incrementally maintained status counts and revenue per collection.
+
+    Each registered scope has one document in stats_counters:
+        {_id: scope, total, byStatus: {<status>: n}, revenue}
+    Write paths report inserts and status transitions, which are applied
+    with a single $inc. Because a concurrent write can slip between a
+    recompute's aggregation and its replace, a periodic full recompute
+    repairs any drift.
+    """
+
+    def __init__(self, recompute_interval: float = 3600.0):
+        self.recompute_interval = recompute_interval
+        self._scopes: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def db(self):
+        return get_db()
+
+    def register(self, scope: str, collection: str, amount_field: str, revenue_statuses: Iterable[str]) -> None:
+        self._scopes[scope] = {
+            "collection": collection,
+            "amount_field": amount_field,
+            "revenue_statuses": set(revenue_statuses)
+        }
+
+    @staticmethod
+    def _status_key(status: Optional[str]) -> str:
+        return f"byStatus.{status or 'unknown'}"
+
+    async def _inc(self, scope: str, inc: dict) -> None:
+        inc = {field: value for field, value in inc.items() if value}
+        if not inc:
+            return
+        await self.db[COUNTERS_COLLECTION].update_one(
+            {"_id": scope},
+            {"$inc": inc, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def record_insert(self, scope: str, status: Optional[str], amount: float = 0) -> None:
+        options = self._scopes[scope]
+        inc = {"total": 1, self._status_key(status): 1}
+        if status in options["revenue_statuses"]:
+            inc["revenue"] = amount or 0
+        await self._inc(scope, inc)
+
+    async def record_transition(
+        self,
+        scope: str,
+        old_status: Optional[str],
+        new_status: Optional[str],
+        amount: float = 0
+    ) -> None:
+        """Move one document between status buckets; no-op when the status did not change"""
+        if old_status == new_status:
+            return
+        options = self._scopes[scope]
+        inc = {self._status_key(old_status): -1, self._status_key(new_status): 1}
+        revenue = 0
+        if old_status in options["revenue_statuses"]:
+            revenue -= amount or 0
+        if new_status in options["revenue_statuses"]:
+            revenue += amount or 0
+        inc["revenue"] = revenue
+        await self._inc(scope, inc)
+
+    async def recompute(self, scope: str) -> dict:
+        options = self._scopes[scope]
+        pipeline = [
+            {"$group": {
+                "_id": "$status",
+                "count": {"$sum": 1},
+                "amount": {"$sum": f"${options['amount_field']}"}
+            }}
+        ]
+        groups = await self.db[options["collection"]].aggregate(pipeline).to_list(None)
+        counters = {
+            "total": sum(group["count"] for group in groups),
+            "byStatus": {},
+            "revenue": 0,
+            "recomputedAt": datetime.utcnow(),
+            "updatedAt": datetime.utcnow()
+        }
+        for group in groups:
+            status = group["_id"] or "unknown"
+            counters["byStatus"][status] = counters["byStatus"].get(status, 0) + group["count"]
+            if status in options["revenue_statuses"]:
+                counters["revenue"] += group["amount"] or 0
+        await self.db[COUNTERS_COLLECTION].replace_one({"_id": scope}, counters, upsert=True)
+        return {"_id": scope, **counters}
+
+    async def get(self, scope: str) -> dict:
+        """O(1) read; the first read of a scope seeds it with a full recompute"""
+        counters = await self.db[COUNTERS_COLLECTION].find_one({"_id": scope})
+        if counters is None or "recomputedAt" not in counters:
+            counters = await self.recompute(scope)
+        return counters
+
+    async def recompute_all(self) -> None:
+        for scope in self._scopes:
+            try:
+                await self.recompute(scope)
+            except Exception as e:
+                logger.error(f"Recomputing stats counters for {scope} failed: {str(e)}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="stats-counters")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            await self.recompute_all()
+            await asyncio.sleep(self.recompute_interval)
+
+stats_counters = StatsCounters(
+    recompute_interval=float(os.environ.get("STATS_RECOMPUTE_INTERVAL", "3600"))
+)
@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile
+from fastapi.staticfiles import StaticFiles
+from starlette.responses import Response
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
+from typing import BinaryIO, Optional
+import hashlib
+import os
+import re
+import uuid
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.environ.get("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# {sha256}.{ext}, or {sha256}-{variant}.{ext} for generated image variants
+CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{64}(-[a-z]+)?\.[a-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@dataclass
+class StoredUpload:
+    path: Path
+    filename: str
+    size: int
+    sha256: str
+    content_type: Optional[str] = None
+    url: Optional[str] = None
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Ukuran file maksimal {max_size // (1024 * 1024)} MB"
+    )
+
+def _write_chunk(handle: BinaryIO, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    handle.write(chunk)
+
+def _discard(handle: BinaryIO, temp_path: Path) -> None:
+    handle.close()
+    temp_path.unlink(missing_ok=True)
+
+async def receive_upload(file: UploadFile, directory: Path, max_size: int = MAX_UPLOAD_SIZE) -> StoredUpload:
+    """
+    Stream an uploaded file into a hidden temp file in directory.
+
+    Reads UPLOAD_CHUNK_SIZE chunks, so memory stays flat whatever the file
+    size. File I/O and hashing run in the thread pool, and max_size is
+    enforced as bytes arrive (413). The returned path is the temp file;
+    the caller moves it into place, which keeps readers from ever seeing
+    a partial file.
+    """
+    if file.size is not None and file.size > max_size:
+        raise _too_large(max_size)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    temp_path = directory / f".{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+
+    handle = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise _too_large(max_size)
+            await run_in_threadpool(_write_chunk, handle, hasher, chunk)
+        await run_in_threadpool(handle.close)
+    except BaseException:
+        await run_in_threadpool(_discard, handle, temp_path)
+        raise
+
+    return StoredUpload(
+        path=temp_path,
+        filename=temp_path.name,
+        size=size,
+        sha256=hasher.hexdigest(),
+        content_type=file.content_type
+    )
+
+class UploadStaticFiles(StaticFiles):
+    """
+    /uploads mount. Content-addressed files (and their image variants) can
+    never change under the same name, so they are cached for a year.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if CONTENT_ADDRESSED_NAME.match(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
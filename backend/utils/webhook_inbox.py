@@ -0,0 +1,247 @@
+from datetime import datetime, timedelta
+from database import get_db
+from pymongo import IndexModel, ASCENDING
+from pymongo.errors import DuplicateKeyError
+from typing import Awaitable, Callable, Dict, Optional
+from utils.indexes import declare_indexes
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+INBOX_COLLECTION = "webhook_inbox"
+LEASE_COLLECTION = "webhook_leases"
+
+declare_indexes(
+    INBOX_COLLECTION,
+    IndexModel([("idempotencyKey", ASCENDING)], name="idempotencyKey_1", unique=True),
+    IndexModel([("status", ASCENDING), ("nextAttemptAt", ASCENDING)], name="status_1_nextAttemptAt_1"),
+    IndexModel([("source", ASCENDING), ("orderId", ASCENDING), ("receivedAt", ASCENDING)], name="source_1_orderId_1_receivedAt_1"),
+    # Processed entries only need to outlive Midtrans' retry window
+    IndexModel(
+        [("processedAt", ASCENDING)],
+        name="processedAt_1",
+        expireAfterSeconds=int(os.environ.get("WEBHOOK_INBOX_RETENTION_DAYS", "30")) * 86400
+    ),
+)
+declare_indexes(
+    LEASE_COLLECTION,
+    IndexModel([("leaseUntil", ASCENDING)], name="leaseUntil_1", expireAfterSeconds=3600),
+)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+def notification_key(source: str, payload: dict) -> str:
+    """
+    Idempotency key for a Midtrans notification. Midtrans re-sends the same
+    body until it gets a 2xx, so identical status transitions collapse into
+    one inbox entry while a new status for the same order gets its own.
+    """
+    parts = [
+        source,
+        str(payload.get("order_id", "")),
+        str(payload.get("transaction_id", "")),
+        str(payload.get("transaction_status", "")),
+        str(payload.get("fraud_status", "")),
+        str(payload.get("status_code", "")),
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+class WebhookInbox:
+    """
+    Durable inbox for payment webhooks.
+
+    Endpoints call accept() to persist the raw notification and answer
+    Midtrans immediately; a background consumer then runs the handler
+    registered for the source. Entries of the same order are applied in
+    arrival order under a lease in webhook_leases, so several app workers
+    can run consumers without applying one order's transitions concurrently.
+    Failed entries are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float = 2.0,
+        batch_size: int = 100,
+        concurrency: int = 8,
+        lease_seconds: float = 60.0,
+        max_attempts: int = 8
+    ):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = uuid.uuid4().hex
+        self._handlers: Dict[str, Handler] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.accepted = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def db(self):
+        return get_db()
+
+    def register(self, source: str, handler: Handler) -> None:
+        """Route modules register one handler per webhook source at import time"""
+        self._handlers[source] = handler
+
+    async def accept(self, source: str, payload: dict, order_id: Optional[str] = None) -> bool:
+        """
+        Persist a notification. Returns False when the same notification was
+        already received; either way the caller can acknowledge it.
+        """
+        now = datetime.utcnow()
+        entry = {
+            "source": source,
+            "idempotencyKey": notification_key(source, payload),
+            "orderId": order_id or payload.get("order_id"),
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "receivedAt": now,
+            "nextAttemptAt": now
+        }
+        try:
+            await self.db[INBOX_COLLECTION].insert_one(entry)
+        except DuplicateKeyError:
+            self.duplicates += 1
+            return False
+        self.accepted += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="webhook-inbox")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook inbox consumer error: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain(self) -> int:
+        """Process every due entry once; returns the number of orders handled"""
+        due = await self.db[INBOX_COLLECTION].find(
+            {"status": "pending", "nextAttemptAt": {"$lte": datetime.utcnow()}},
+            {"source": 1, "orderId": 1}
+        ).sort("receivedAt", 1).limit(self.batch_size).to_list(self.batch_size)
+
+        orders = list(dict.fromkeys((entry["source"], entry.get("orderId")) for entry in due))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(source: str, order_id: Optional[str]):
+            async with semaphore:
+                await self._process_order(source, order_id)
+
+        await asyncio.gather(*(process(source, order_id) for source, order_id in orders))
+        return len(orders)
+
+    async def _acquire(self, lease_id: str) -> bool:
+        now = datetime.utcnow()
+        try:
+            await self.db[LEASE_COLLECTION].find_one_and_update(
+                {"_id": lease_id, "leaseUntil": {"$lt": now}},
+                {"$set": {"owner": self.owner, "leaseUntil": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Another consumer holds an unexpired lease on this order
+            return False
+
+    async def _release(self, lease_id: str) -> None:
+        await self.db[LEASE_COLLECTION].delete_one({"_id": lease_id, "owner": self.owner})
+
+    async def _process_order(self, source: str, order_id: Optional[str]) -> None:
+        lease_id = f"{source}:{order_id}"
+        if not await self._acquire(lease_id):
+            return
+        try:
+            # Re-read under the lease so entries handled elsewhere are skipped
+            entries = await self.db[INBOX_COLLECTION].find(
+                {"source": source, "orderId": order_id, "status": "pending"}
+            ).sort("receivedAt", 1).to_list(None)
+            for entry in entries:
+                if entry["nextAttemptAt"] > datetime.utcnow() or not await self._apply(entry):
+                    # Later transitions wait until this one has been applied
+                    break
+        finally:
+            await self._release(lease_id)
+
+    async def _apply(self, entry: dict) -> bool:
+        inbox = self.db[INBOX_COLLECTION]
+        handler = self._handlers.get(entry["source"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"No webhook handler registered for source '{entry['source']}'")
+            await handler(entry["payload"])
+        except Exception as e:
+            attempts = entry.get("attempts", 0) + 1
+            exhausted = attempts >= self.max_attempts
+            logger.error(
+                f"Webhook {entry['source']} order {entry.get('orderId')} failed "
+                f"(attempt {attempts}/{self.max_attempts}): {str(e)}"
+            )
+            await inbox.update_one(
+                {"_id": entry["_id"]},
+                {"$set": {
+                    "status": "failed" if exhausted else "pending",
+                    "attempts": attempts,
+                    "lastError": str(e),
+                    "nextAttemptAt": datetime.utcnow() + timedelta(seconds=min(2 ** attempts, 600))
+                }}
+            )
+            self.failed += 1
+            # A dead entry no longer blocks the order it belongs to
+            return exhausted
+
+        await inbox.update_one(
+            {"_id": entry["_id"]},
+            {"$set": {"status": "done", "processedAt": datetime.utcnow()}, "$inc": {"attempts": 1}}
+        )
+        self.processed += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "handlers": sorted(self._handlers),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "failed": self.failed
+        }
+
+webhook_inbox = WebhookInbox(
+    poll_interval=float(os.environ.get("WEBHOOK_INBOX_POLL_INTERVAL", "2")),
+    batch_size=int(os.environ.get("WEBHOOK_INBOX_BATCH_SIZE", "100")),
+    concurrency=int(os.environ.get("WEBHOOK_INBOX_CONCURRENCY", "8")),
+    max_attempts=int(os.environ.get("WEBHOOK_INBOX_MAX_ATTEMPTS", "8"))
+)
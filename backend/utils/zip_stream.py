@@ -0,0 +1,62 @@
+from datetime import datetime
+from pathlib import Path
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import shutil
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+class _ChunkBuffer:
+    """Write-only file object for ZipFile; take() returns what was written since the last call"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+def _entry(name: str, modified_at: Optional[datetime]) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=(modified_at or datetime.now()).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    return info
+
+def _copy_file(archive: zipfile.ZipFile, info: zipfile.ZipInfo, path: Path) -> None:
+    with open(path, "rb") as source, archive.open(info, "w") as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+class ZipStreamWriter:
+    """
+    Builds a ZIP archive piece by piece for a StreamingResponse.
+
+    Each add_*() call returns the bytes of that entry, ready to be yielded,
+    so only the entry being written is held in memory. The output is never
+    seeked, so ZipFile writes sizes in data descriptors after each entry.
+    Entries are stored uncompressed: the archives carry PDFs and images,
+    which are compressed already.
+    """
+
+    def __init__(self):
+        self._buffer = _ChunkBuffer()
+        self._archive = zipfile.ZipFile(self._buffer, "w", zipfile.ZIP_STORED)
+
+    async def add_file(self, name: str, path: Path, modified_at: Optional[datetime] = None) -> bytes:
+        await run_in_threadpool(_copy_file, self._archive, _entry(name, modified_at), path)
+        return self._buffer.take()
+
+    def add_bytes(self, name: str, data: bytes, modified_at: Optional[datetime] = None) -> bytes:
+        self._archive.writestr(_entry(name, modified_at), data)
+        return self._buffer.take()
+
+    def close(self) -> bytes:
+        """The central directory; the last chunk of the archive"""
+        self._archive.close()
+        return self._buffer.take()
@@ -9,6 +9,9 @@ import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '../co
 import { useToast } from '../hooks/use-toast';
 import { authAPI, userPaymentsAPI, settingsAPI, runningInfoAPI, referralAPI } from '../services/api';
 
+const QRIS_EXPIRY_MS = 60 * 60 * 1000;
+const STREAM_RETRY_MS = 5000;
+
 const UserDashboard = () => {
   const navigate = useNavigate();
   const { toast } = useToast();
@@ -161,15 +164,8 @@ const UserDashboard = () => {
           description: 'Scan QR code untuk melanjutkan pembayaran'
         });
         
-        // Auto check payment status every 5 seconds
-        const interval = setInterval(async () => {
-          await handleCheckPaymentStatus(response.data.orderId);
-        }, 5000);
-        
-        // Clear interval after 1 hour (expiry time)
-        setTimeout(() => {
-          clearInterval(interval);
-        }, 60 * 60 * 1000);
+        // Listen for payment status updates until the QRIS expires (1 hour)
+        listenForPayment(response.data.orderId, Date.now() + QRIS_EXPIRY_MS);
       }
     } catch (error) {
       toast({
@@ -182,6 +178,61 @@ const UserDashboard = () => {
     }
   };
 
+  // Returns true once the payment reached a final status
+  const handlePaymentStatus = (status) => {
+    if (['settlement', 'approved'].includes(status)) {
+      handlePaymentSettled();
+      return true;
+    }
+    return ['failed', 'rejected'].includes(status);
+  };
+
+  const listenForPayment = async (orderId, expiresAt) => {
+    if (Date.now() >= expiresAt) return;
+    const retry = () => setTimeout(() => listenForPayment(orderId, expiresAt), STREAM_RETRY_MS);
+
+    let stream;
+    try {
+      stream = await userPaymentsAPI.streamPayment(orderId);
+    } catch (error) {
+      console.error('Error opening payment stream:', error);
+      retry();
+      return;
+    }
+    const stop = setTimeout(() => stream.close(), expiresAt - Date.now());
+
+    stream.addEventListener('status', (event) => {
+      const { status } = JSON.parse(event.data);
+      if (handlePaymentStatus(status)) {
+        stream.close();
+        clearTimeout(stop);
+      }
+    });
+
+    // The stream token is short-lived, so EventSource's own reconnect would
+    // be refused: check the status once, then reopen with a fresh token
+    stream.onerror = async () => {
+      stream.close();
+      clearTimeout(stop);
+      try {
+        const response = await userPaymentsAPI.checkPayment(orderId);
+        if (handlePaymentStatus(response.data.status)) return;
+      } catch (error) {
+        console.error('Error checking payment:', error);
+      }
+      retry();
+    };
+  };
+
+  const handlePaymentSettled = async () => {
+    toast({
+      title: 'Pembayaran Berhasil!',
+      description: 'Pembayaran Anda telah dikonfirmasi'
+    });
+    setQrisData(null);
+    await loadUserData();
+  };
+
   const handleCheckPaymentStatus = async (orderId) => {
     if (checkingPayment) return;
     
@@ -189,13 +240,8 @@ const UserDashboard = () => {
     try {
       const response = await userPaymentsAPI.checkPayment(orderId);
       
-      if (response.data.status === 'settlement') {
-        toast({
-          title: 'Pembayaran Berhasil!',
-          description: 'Pembayaran Anda telah dikonfirmasi'
-        });
-        setQrisData(null);
-        await loadUserData();
+      if (['settlement', 'approved'].includes(response.data.status)) {
+        await handlePaymentSettled();
       }
     } catch (error) {
       console.error('Error checking payment:', error);
@@ -214,6 +214,14 @@ export const userPaymentsAPI = {
   getTestPrice: () => apiClient.get('/user-payments/test-price'),
   createQRIS: () => apiClient.post('/user-payments/create-qris'),
   checkPayment: (orderId) => apiClient.get(`/user-payments/check-payment/${orderId}`),
+  // Server-Sent Events; EventSource cannot set headers, so a short-lived
+  // stream token (never the login token) goes in the query
+  streamPayment: async (orderId) => {
+    const response = await apiClient.post(`/user-payments/stream/${orderId}/token`);
+    return new EventSource(
+      `${API_URL}/user-payments/stream/${orderId}?token=${encodeURIComponent(response.data.token)}`
+    );
+  },
 };
 
 // Referral API